@@ -1,9 +1,32 @@
-from google import genai
 from dotenv import load_dotenv
+import logging
 import os
 import sqlite3
-from typing import List, Tuple, Optional
+import threading
+import time
+import pandas as pd
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Optional
 from dataclasses import dataclass
+from api.index_advisor import QueryLog
+from api.sql_cache import SemanticSQLCache
+from api.result_cache import ResultCache, database_version, estimate_bytes
+from api.rollups import RollupRouter
+from api.columnar import AggregateQuery, get_snapshot
+from api.digest import compact_results
+from api.llm_gateway import get_gateway
+from api.prompts import BACKGROUND, SCHEMA, Prompt, ledger
+from api.sql_repair import RepairResult, SQLRepairer
+from api.sql_templates import SQLTemplateEngine, TemplateMatch
+from api.digest import digest_results
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimeoutError(RuntimeError):
+    """Raised when a query runs past the analyst's wall-clock budget."""
 
 
 @dataclass
@@ -13,6 +36,7 @@ class QueryResult:
     results: List[Tuple]
     columns: List[str]
     explanation: str
+    truncated: bool = False
 
     def __str__(self) -> str:
         # Format results nicely
@@ -23,6 +47,8 @@ class QueryResult:
             table = f"\n{header}\n{rows}\n"
         else:
             table = "\nNo rows returned.\n"
+        if self.truncated:
+            table += f"(truncated to {len(self.results)} rows)\n"
 
         return (
             f"SQL used:\n{self.sql}\n\n"
@@ -31,6 +57,115 @@ class QueryResult:
         )
 
 
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only SQLite connections.
+
+    Connections are opened lazily up to `max_connections`, reused across
+    requests, and tuned for read-heavy analytics. A thread that finds every
+    connection busy waits for one to be returned; those waits are counted
+    so contention shows up in `stats()`.
+    """
+
+    PRAGMAS = {
+        "query_only": "ON",
+        "temp_store": "MEMORY",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative = KiB, i.e. 64 MiB per connection
+    }
+
+    def __init__(self, db_path: str, max_connections: int = 8, timeout: float = 30.0):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            max_connections: Upper bound on open connections (~ worker threads)
+            timeout: Seconds to wait for a free connection before giving up
+        """
+        self.db_path = db_path
+        self.uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "opened": 0, "checkouts": 0, "waits": 0,
+            "wait_seconds": 0.0, "max_wait_seconds": 0.0, "peak_in_use": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for name, value in self.PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Check out a connection for the duration of the block.
+
+        Raises:
+            TimeoutError: If no connection frees up within `timeout`
+        """
+        conn = None
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if not self._idle and self._open >= self.max_connections:
+                self._stats["waits"] += 1
+                start = time.perf_counter()
+                if not self._cond.wait_for(lambda: self._idle, timeout=self.timeout):
+                    raise TimeoutError(f"No SQLite connection free after {self.timeout}s")
+                waited = time.perf_counter() - start
+                self._stats["wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._open += 1
+                self._stats["opened"] += 1
+            self._in_use += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+
+        try:
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            yield conn
+        finally:
+            if conn is not None:
+                with self._cond:
+                    self._in_use -= 1
+                    self._idle.append(conn)
+                    self._cond.notify()
+
+    def close(self) -> None:
+        """Close idle connections; any still checked out rejoin the pool when returned."""
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                **self._stats,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_connections": self.max_connections,
+                "reuse_rate": (checkouts - self._stats["opened"]) / checkouts if checkouts else 0.0,
+            }
+
+
 class Analyst:
     """
     A class for analyzing Singapore HDB BTO data using natural language queries.
@@ -41,155 +176,125 @@ class Analyst:
     - Generate analytical explanations of results
     """
     
-    # SQL generation prompt template
-    SQL_PROMPT_TEMPLATE = """
-    You are a housing market intelligence assistant designed to support analysis of BTO (Build-To-Order) pricing in Singapore, leveraging trends from HDB resale transactions. Provide explanations and predictions for BTO prices based on past resale data and contextual factors.
-    1. **Pricing Framework**
-    - BTO flat prices are informed by nearby resale flat transactions: HDB benchmarks BTO “market value” by comparing transacted resale flat prices in the vicinity
-
-    2. **Trends in BTO–Resale Price Gaps**
-    - In **mature estates**, resale prices have risen faster than BTO prices
-    - In **non-mature estates**, BTO price growth sometimes outpaces resale growth
-
-    3. **Other Market Influences**
-    - BTO supply levels significantly affect resale demand and prices. Over-supply of BTO units historically led to resale price stagnation, while undersupply—or demand exceeding supply—increases pressure on resale prices
-   - Micro-level price drivers include: location/town attributes, estate maturity, flat type and size, remaining lease, floor level, and time of year. Empirical analyses confirm that higher floors,central/mature locations, larger flat sizes, newer builds (longer leases) command higher resale prices
-
-    **Task Instructions**
-    You are a SQL-only assistant for the HDB data mart (Singapore context). Given the above background information, your ONLY task is to understand the intent of the user query and emit **exactly one valid SQLite statement** (or a single CTE) that answers the user's question by reading from the tables below.
-
-    Schema
-    ------
-    bto_prices(
-        _id INTEGER PRIMARY KEY AUTOINCREMENT,
-        financial_year TEXT,
-        room_type TEXT,
-        town TEXT,
-        min_selling_price REAL,
-        max_selling_price REAL,
-        min_selling_price_less_ahg_shg REAL,
-        max_selling_price_less_ahg_shg REAL
-    )
-
-    resale_prices (
-        _id INTEGER PRIMARY KEY AUTOINCREMENT,
-        month TEXT,
-        town TEXT,
-        flat_type TEXT,
-        flat_model TEXT,
-        block TEXT,
-        street_name TEXT,
-        storey_range TEXT,
-        floor_area_sqm REAL,
-        lease_commence_date TEXT,
-        resale_price REAL
-    )
-
-    Sample data
-    -----------
-    {sample_data}
-    
-
-    Note that the data in the database is stored in lowercase
-
-    Rules
-    1. Return ONLY the SQL statement—no explanations, no markdown fences.  
-    2. Use standard SQLite syntax (CTEs allowed).  
-    3. Parameterise with $town, $room_type, etc. when possible.  
-    4. Aggregate or filter as needed to answer the question; do NOT predict future prices.  
-    5. If the question is ambiguous, choose the most reasonable interpretation and proceed.  
-    6. The SQLite query must always be executable.
-
-    Examples
-    --------
-    Q: List all towns with BTO launches in 2018.
-    A:
-    SELECT DISTINCT town
-    FROM bto_prices
-    WHERE financial_year = '2018';
-
-    Q: {user_query}
-    """
-
-    # Analysis prompt template
-    ANALYST_PROMPT_TEMPLATE = """
-    You are a housing market intelligence assistant designed to support analysis of BTO (Build-To-Order) pricing in Singapore, leveraging trends from HDB resale transactions. Provide explanations and predictions for BTO prices based on past resale data and contextual factors.
-    1. **Pricing Framework**
-    - BTO flat prices are informed by nearby resale flat transactions: HDB benchmarks BTO “market value” by comparing transacted resale flat prices in the vicinity
-
-    2. **Trends in BTO–Resale Price Gaps**
-    - In **mature estates**, resale prices have risen faster than BTO prices
-    - In **non-mature estates**, BTO price growth sometimes outpaces resale growth
-
-    3. **Other Market Influences**
-    - BTO supply levels significantly affect resale demand and prices. Over-supply of BTO units historically led to resale price stagnation, while undersupply—or demand exceeding supply—increases pressure on resale prices
-    - Micro-level price drivers include: location/town attributes, estate maturity, flat type and size, remaining lease, floor level, and time of year. Empirical analyses confirm that higher floors,central/mature locations, larger flat sizes, newer builds (longer leases) command higher resale prices
-
-
-    You will be given the following data and context:  
-    1. A user query  
-    2. An SQL query that extracts relevant information from the database  
-    3. The corresponding SQL output  
-
-    Your task is to response to the user’s query using the information provided. Understand the query, and provide analysis in natural language explanations and justifications.
-    Ensure you always aim to respond to the user's query, but only use information provided.
-
-    Schema
-    ------
-    bto_prices(
-        _id INTEGER PRIMARY KEY AUTOINCREMENT,
-        financial_year TEXT,
-        room_type TEXT,
-        town TEXT,
-        min_selling_price REAL,
-        max_selling_price REAL,
-        min_selling_price_less_ahg_shg REAL,
-        max_selling_price_less_ahg_shg REAL
-    )
-
-    resale_prices (
-        _id INTEGER PRIMARY KEY AUTOINCREMENT,
-        month TEXT,
-        town TEXT,
-        flat_type TEXT,
-        flat_model TEXT,
-        block TEXT,
-        street_name TEXT,
-        storey_range TEXT,
-        floor_area_sqm REAL,
-        lease_commence_date TEXT,
-        resale_price REAL
-    )
-
-    Q: {user_query}
-    SQL: {sql_query}
-    Output: {output}
-    """
-
-    def __init__(self, db_path: str, model: str = "gemini-2.5-flash"):
+    # SQL generation prompt: static prefix (cached across calls) and per-question suffix
+    SQL_PROMPT_PREFIX = """{background}
+**Task Instructions**
+You are a SQL-only assistant for the HDB data mart (Singapore context). Given the above background information, your ONLY task is to understand the intent of the user query and emit **exactly one valid SQLite statement** (or a single CTE) that answers the user's question by reading from the tables below.
+
+{schema}
+{rollup_schema}
+
+Sample data
+-----------
+{sample_data}
+
+Note that the data in the database is stored in lowercase
+
+Rules
+1. Return ONLY the SQL statement—no explanations, no markdown fences.
+2. Use standard SQLite syntax (CTEs allowed).
+3. Write literal values inline (e.g. town = 'ang mo kio'); no parameters such as $town are bound.
+4. Aggregate or filter as needed to answer the question; do NOT predict future prices.
+5. If the question is ambiguous, choose the most reasonable interpretation and proceed.
+6. The SQLite query must always be executable.
+
+Examples
+--------
+Q: List all towns with BTO launches in 2018.
+A:
+SELECT DISTINCT town
+FROM bto_prices
+WHERE financial_year = '2018';
+"""
+    SQL_PROMPT_SUFFIX = "Q: {user_query}"
+    SQL_REPAIR_SUFFIX = """Q: {user_query}
+
+Your previous statement:
+{sql}
+failed with: {error}
+Return a corrected statement."""
+
+    # Analysis prompt: static prefix and per-question suffix
+    ANALYST_PROMPT_PREFIX = """{background}
+
+You will be given the following data and context:
+1. A user query
+2. An SQL query that extracts relevant information from the database
+3. The corresponding SQL output (or, for large outputs, a statistical digest of it)
+
+Your task is to response to the user’s query using the information provided. Understand the query, and provide analysis in natural language explanations and justifications.
+Ensure you always aim to respond to the user's query, but only use information provided.
+
+{schema}
+"""
+    ANALYST_PROMPT_SUFFIX = """Q: {user_query}
+SQL: {sql_query}
+Output: {output}"""
+
+    # SQLite VM instructions between wall-clock budget checks
+    PROGRESS_OPS = 10_000
+    # Rows fetched per cursor.fetchmany call
+    FETCH_CHUNK = 1_000
+
+    def __init__(
+        self,
+        db_path: str,
+        model: str = "gemini-2.5-flash",
+        pool_size: int = 8,
+        max_seconds: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        columnar: Optional[bool] = None,
+        digest_tokens: Optional[int] = None,
+    ):
         """
         Initialize the HDB Data Analyst.
         
         Args:
             db_path: Path to the SQLite database file
             model: Gemini model to use for query generation and analysis
+            pool_size: Maximum pooled read-only SQLite connections
+            max_seconds: Wall-clock budget per query (default ANALYST_QUERY_TIMEOUT or 5s)
+            max_rows: Rows materialized per query (default ANALYST_MAX_ROWS or 10,000)
+            max_bytes: Approximate bytes materialized per query (default ANALYST_MAX_BYTES or 8 MiB)
+            columnar: Answer `aggregate` from an in-memory columnar snapshot (default ANALYST_COLUMNAR=1)
+            digest_tokens: Results estimated above this many tokens are sent to the explanation
+                prompt as a statistical digest (default ANALYST_DIGEST_TOKENS or 2,000)
         """
         load_dotenv()
         
         self.db_path = db_path
         self.model = model
+        self.max_seconds = max_seconds if max_seconds is not None else float(os.getenv("ANALYST_QUERY_TIMEOUT", "5"))
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv("ANALYST_MAX_ROWS", "10000"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("ANALYST_MAX_BYTES", str(8 * 1024 * 1024)))
+        self.digest_tokens = digest_tokens if digest_tokens is not None else int(os.getenv("ANALYST_DIGEST_TOKENS", "2000"))
+        self.pool = ConnectionPool(db_path, max_connections=pool_size)
+        # Executed SQL, for api.index_advisor; set ANALYST_QUERY_LOG to also append to a JSONL file
+        self.query_log = QueryLog(path=os.getenv("ANALYST_QUERY_LOG"))
+        # Paraphrased questions reuse SQL that already passed validation
+        self.sql_cache = SemanticSQLCache(threshold=float(os.getenv("SQL_CACHE_THRESHOLD", "0.8")))
+        # Result sets keyed on canonical SQL and the database file version
+        self.result_cache = ResultCache(max_bytes=int(os.getenv("RESULT_CACHE_BYTES", str(64 * 1024 * 1024))))
+        # Eligible aggregates are answered from the summary tables built by api.rollups
+        self.rollups = RollupRouter(self.pool.connection, db_path)
+        # Common question shapes are answered from pre-vetted SQL templates
+        self.templates = SQLTemplateEngine(self.sql_cache.extract_entities)
+        self.template_explanations = os.getenv("ANALYST_TEMPLATE_EXPLANATIONS", "0") == "1"
+        # Generated SQL is fixed and checked locally before any re-prompt
+        self.sql_repair = SQLRepairer(self.pool.connection, db_path)
+        self.columnar = columnar if columnar is not None else os.getenv("ANALYST_COLUMNAR", "0") == "1"
+        if self.columnar:
+            get_snapshot(db_path)  # load once per worker, up front
         self._sample_rows_cache = self._sample_rows(["bto_prices", "resale_prices"], rows=2)
 
-        # Initialize Gemini client
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        self.client = genai.Client(api_key=api_key)
+        # Shared Gemini client; static prompt prefixes go out as a cached system instruction / context cache
+        self.llm = get_gateway()
+        self.token_budget = int(os.getenv("LLM_REQUEST_TOKEN_BUDGET", "0"))
 
     def _sample_rows(self, tables: List[str], rows: int = 3) -> str:
         snippets = []
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             for tbl in tables:
                 try:
                     df = pd.read_sql_query(f"SELECT * FROM {tbl} LIMIT {rows};", conn)
@@ -212,41 +317,52 @@ class Analyst:
             True if SQL is valid, False otherwise
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with tracer.span("sql.explain"), self.pool.connection() as conn:
                 conn.execute(f"EXPLAIN {sql}")
             return True
         except sqlite3.Error as e:
             print(f"SQL validation error: {e}")
             return False
     
-    def _generate_sql_query(self, user_query: str) -> str:
+    def _generate_sql_query(self, user_query: str, failed: Optional[RepairResult] = None) -> str:
         """
         Generate SQL query from natural language query.
         
         Args:
             user_query: Natural language query
+            failed: Previous attempt and its error, to ask for a correction
             
         Returns:
             Generated SQL query string
         """
-        prompt = self.SQL_PROMPT_TEMPLATE.format(
-                    user_query=user_query,
-                    sample_data=self._sample_rows_cache
-                )        
-        response = self.client.models.generate_content(
-            model=self.model,
-            contents=prompt,
+        prompt = Prompt(
+            name="analyst.sql",
+            static=self.SQL_PROMPT_PREFIX.format(
+                background=BACKGROUND,
+                schema=SCHEMA,
+                sample_data=self._sample_rows_cache,
+                rollup_schema=self.rollups.schema_prompt(),
+            ),
+            dynamic=(
+                self.SQL_REPAIR_SUFFIX.format(user_query=user_query, sql=failed.sql, error=failed.error)
+                if failed is not None else self.SQL_PROMPT_SUFFIX.format(user_query=user_query)
+            ),
         )
+        response = self.llm.generate(prompt, model=self.model)
         
         return response.text.strip()
     
     def _generate_valid_sql(self, user_query: str, max_attempts: int = 3) -> str:
         """
-        Generate a valid SQL query with retry logic.
+        Generate a valid SQL query, repairing failed attempts.
+        
+        Each generated statement goes through `SQLRepairer`: deterministic
+        fixes, local checks, then EXPLAIN. Only if it still fails is the
+        model asked again, with the failed statement and its error.
         
         Args:
             user_query: Natural language query
-            max_attempts: Maximum number of generation attempts
+            max_attempts: Maximum number of generation attempts (LLM calls)
             
         Returns:
             Valid SQL query string
@@ -254,41 +370,181 @@ class Analyst:
         Raises:
             RuntimeError: If unable to generate valid SQL after max attempts
         """
-        for attempt in range(max_attempts):
-            sql = self._generate_sql_query(user_query)
-            print(f"Generated SQL (attempt {attempt + 1}): {sql}")
-            
-            if self._is_valid_sql(sql):
-                return sql
-            
-            print(f"SQL validation failed, retrying...")
+        attempts: List[RepairResult] = []
+        try:
+            for attempt in range(max_attempts):
+                with tracer.span("sql.generate", attempt=attempt + 1) as span:
+                    sql = self._generate_sql_query(user_query, attempts[-1] if attempts else None)
+                    print(f"Generated SQL (attempt {attempt + 1}): {sql}")
+                    
+                    result = self.sql_repair.repair(sql)
+                    span.set(ok=result.ok, fixes=result.fixes, error=result.error)
+                attempts.append(result)
+                if result.fixes:
+                    print(f"Applied SQL fixes: {', '.join(result.fixes)}")
+                if result.ok:
+                    return result.sql
+                
+                print(f"SQL validation failed ({result.error}), re-prompting...")
+        finally:
+            self.sql_repair.record(attempts)
         
         raise RuntimeError(f"Failed to generate valid SQL after {max_attempts} attempts")
     
-    def _execute_sql(self, sql: str) -> Tuple[List[Tuple], List[str]]:
+    def _resolve_sql(self, user_query: str) -> Tuple[str, Optional[TemplateMatch]]:
+        """
+        Find SQL for a question, trying the template engine and then the
+        semantic cache before the LLM, then route it to a summary table if
+        it is an eligible aggregate.
+        
+        Args:
+            user_query: Natural language query
+            
+        Returns:
+            Tuple of (valid SQL query string, template match or None)
+        """
+        match = self.templates.match(user_query)
+        if match is not None:
+            sql = match.sql
+            print(f"Matched template {match.template}: {' '.join(sql.split())}")
+        else:
+            sql = self.sql_cache.get(user_query)
+            if sql is not None and self._is_valid_sql(sql):
+                print(f"Reusing cached SQL: {sql}")
+            else:
+                sql = self._generate_valid_sql(user_query)
+                self.sql_cache.put(user_query, sql)
+        
+        routed = self.rollups.rewrite(sql)
+        if routed is not None and self._is_valid_sql(routed):
+            print(f"Routed to summary table: {routed}")
+            return routed, match
+        return sql, match
+    
+    @contextmanager
+    def _time_budget(self, conn: sqlite3.Connection, max_seconds: Optional[float]) -> Iterator[None]:
+        """
+        Interrupt any statement on `conn` that runs past `max_seconds` of wall time.
+        
+        Raises:
+            QueryTimeoutError: If the budget is exhausted
+        """
+        if not max_seconds:
+            yield
+            return
+        deadline = time.perf_counter() + max_seconds
+        # SQLite calls the handler every PROGRESS_OPS VM instructions; a truthy
+        # return aborts the statement with "interrupted"
+        conn.set_progress_handler(lambda: time.perf_counter() > deadline, self.PROGRESS_OPS)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise QueryTimeoutError(f"Query exceeded its {max_seconds}s budget") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+    
+    def _execute_sql(self, sql: str) -> Tuple[List[Tuple], List[str], bool]:
         """
         Execute SQL query and return results with column names.
         
+        Results are served from the result cache while the database file is
+        unchanged; any write to it (e.g. a new ingest) invalidates the cache.
+        Execution is bounded by `max_seconds`, and at most `max_rows` rows /
+        `max_bytes` bytes are materialized; beyond that the result is truncated.
+        
         Args:
             sql: SQL query to execute
             
         Returns:
-            Tuple of (results, column_names)
+            Tuple of (results, column_names, truncated)
             
         Raises:
+            QueryTimeoutError: If the query runs past its time budget
             sqlite3.Error: If query execution fails
         """
+        version = database_version(self.db_path)
+        cached = self.result_cache.get(sql, version)
+        if cached is not None:
+            tracer.record("sql.execute", 0.0, rows=len(cached[0]), cached=True)
+            return cached[0], cached[1], False
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            start = time.perf_counter()
+            results: List[Tuple] = []
+            truncated = False
+            with self.pool.connection() as conn, self._time_budget(conn, self.max_seconds):
                 cursor = conn.execute(sql)
                 columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                results = cursor.fetchall()
-                return results, columns
+                size = 0
+                while True:
+                    rows = cursor.fetchmany(min(self.FETCH_CHUNK, self.max_rows - len(results)))
+                    if not rows:
+                        break
+                    results.extend(rows)
+                    size += estimate_bytes(rows, [])
+                    if len(results) >= self.max_rows or size >= self.max_bytes:
+                        truncated = cursor.fetchone() is not None
+                        break
+            self.query_log.record(sql, time.perf_counter() - start, len(results))
+            tracer.record("sql.execute", time.perf_counter() - start, rows=len(results), truncated=truncated)
+            if truncated:
+                print(f"Query result truncated to {len(results)} rows")
+            else:
+                self.result_cache.put(sql, version, results, columns)
+            return results, columns, truncated
         except sqlite3.Error as e:
+            tracer.record("sql.execute", time.perf_counter() - start, error=str(e))
             print(f"Query execution error: {e}")
             raise
     
-    def _generate_explanation(self, user_query: str, sql: str, results: List[Tuple]) -> str:
+    def stream_sql(self, sql: str, chunk_size: int = 500, max_rows: Optional[int] = None) -> Iterator[dict]:
+        """
+        Execute SQL and yield the result in chunks instead of one list.
+        
+        The pooled connection is held until the generator is exhausted or
+        closed, and the wall-clock budget applies to the whole stream. The
+        stream stops (truncated) after `max_rows` rows or once about
+        `max_bytes` bytes of rows have been sent, as in `_execute_sql`.
+        
+        Args:
+            sql: SQL query to execute
+            chunk_size: Rows per yielded chunk (at least 1)
+            max_rows: Stop after this many rows (default, and at most, the Analyst's `max_rows`)
+            
+        Yields:
+            {"columns": [...]}, then {"rows": [...]} chunks, then
+            {"done": True, "row_count": n, "truncated": bool}
+            
+        Raises:
+            ValueError: If chunk_size or max_rows is below 1
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if max_rows is not None and max_rows < 1:
+            raise ValueError("max_rows must be at least 1")
+        max_rows = self.max_rows if max_rows is None else min(max_rows, self.max_rows)
+        with self.pool.connection() as conn, self._time_budget(conn, self.max_seconds):
+            cursor = conn.execute(sql)
+            yield {"columns": [desc[0] for desc in cursor.description] if cursor.description else []}
+            count = 0
+            size = 0
+            truncated = False
+            while True:
+                rows = cursor.fetchmany(min(chunk_size, max_rows - count))
+                if not rows:
+                    break
+                count += len(rows)
+                size += estimate_bytes(rows, [])
+                yield {"rows": [list(row) for row in rows]}
+                if count >= max_rows or size >= self.max_bytes:
+                    truncated = cursor.fetchone() is not None
+                    break
+        yield {"done": True, "row_count": count, "truncated": truncated}
+    
+    def _generate_explanation(self, user_query: str, sql: str, results: List[Tuple],
+                              columns: Optional[List[str]] = None) -> str:
         """
         Generate analytical explanation of query results.
         
@@ -296,23 +552,29 @@ class Analyst:
             user_query: Original natural language query
             sql: SQL query that was executed
             results: Query results
+            columns: Column names, needed to digest large results
             
         Returns:
             Analytical explanation string
         """
-        result_str = str(results) if results else "No rows returned."
-        
-        prompt = self.ANALYST_PROMPT_TEMPLATE.format(
-            user_query=user_query,
-            sql_query=sql.strip(),
-            output=result_str
+        result_str, raw_tokens, sent_tokens = compact_results(results, columns, self.digest_tokens)
+        logger.info(
+            f"Explanation prompt results: {len(results)} rows, ~{raw_tokens} tokens raw, "
+            f"~{sent_tokens} tokens sent{' (digest)' if sent_tokens != raw_tokens else ''}"
         )
         
-        response = self.client.models.generate_content(
-            model=self.model,
-            contents=prompt
+        prompt = Prompt(
+            name="analyst.explanation",
+            static=self.ANALYST_PROMPT_PREFIX.format(background=BACKGROUND, schema=SCHEMA),
+            dynamic=self.ANALYST_PROMPT_SUFFIX.format(
+                user_query=user_query,
+                sql_query=sql.strip(),
+                output=result_str
+            ),
         )
         
+        response = self.llm.generate(prompt, model=self.model)
+        
         return response.text.strip()
     
     def display_results(self, results: List[Tuple], columns: List[str]) -> None:
@@ -336,6 +598,38 @@ class Analyst:
         for row in results:
             print(" | ".join(f"{str(val):<15}" for val in row))
     
+    def aggregate(self, query: AggregateQuery) -> Tuple[List[Tuple], List[str]]:
+        """
+        Run a structured filter / group / aggregate without going through the LLM.
+        
+        Args:
+            query: Query over resale_prices or bto_prices
+            
+        Returns:
+            (results, columns), from the columnar snapshot when enabled, else from SQLite
+        """
+        if self.columnar:
+            return get_snapshot(self.db_path).execute(query)
+        results, columns, _ = self._execute_sql(query.to_sql())
+        return results, columns
+    
+    def stream(self, user_query: str, chunk_size: int = 500, max_rows: Optional[int] = None) -> Iterator[dict]:
+        """
+        Answer a natural language query by streaming its rows, without an explanation.
+        
+        Args:
+            user_query: Natural language query about HDB data
+            chunk_size: Rows per yielded chunk (at least 1)
+            max_rows: Stop after this many rows (default, and at most, the Analyst's `max_rows`)
+            
+        Yields:
+            {"sql": ...} followed by the events of `stream_sql`
+        """
+        with ledger.request(self.token_budget):
+            sql, _ = self._resolve_sql(user_query)
+        yield {"sql": sql}
+        yield from self.stream_sql(sql, chunk_size=chunk_size, max_rows=max_rows)
+    
     def query(self, user_query: str, display: bool = True) -> QueryResult:
         """
         Execute a natural language query and return comprehensive results.
@@ -346,21 +640,38 @@ class Analyst:
             
         Returns:
             QueryResult object containing SQL, results, columns, and explanation
+            
+        Raises:
+            TokenBudgetExceeded: If the LLM calls would exceed LLM_REQUEST_TOKEN_BUDGET
         """
-        # Generate and validate SQL
-        sql = self._generate_valid_sql(user_query)
-        
-        # Execute query
-        results, columns = self._execute_sql(sql)
-        
-        # Generate explanation
-        explanation = self._generate_explanation(user_query, sql, results)
+        with ledger.request(self.token_budget), tracer.span("analyst.query") as span:
+            # Template, reuse or generate validated SQL
+            with tracer.span("sql.resolve") as resolve:
+                sql, match = self._resolve_sql(user_query)
+                resolve.set(template=match.template if match is not None else None)
+            
+            # Execute query
+            results, columns, truncated = self._execute_sql(sql)
+            span.set(rows=len(results))
+            
+            # Generate explanation (deterministic for template answers if enabled)
+            with tracer.span("analyst.explanation"):
+                if match is not None and self.template_explanations:
+                    try:
+                        summary = digest_results(results, columns)
+                    except Exception as e:
+                        logger.warning(f"Could not digest template results: {e}")
+                        summary = compact_results(results, columns, self.digest_tokens)[0]
+                    explanation = f"Answered with the {match.template} template.\n" + summary
+                else:
+                    explanation = self._generate_explanation(user_query, sql, results, columns)
         
         return QueryResult(
             sql=sql,
             results=results,
             columns=columns,
-            explanation=explanation
+            explanation=explanation,
+            truncated=truncated
         )
 
 
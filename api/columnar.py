@@ -0,0 +1,378 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from api.result_cache import database_version
+
+
+# Columns held per table: dictionary-encoded text columns and numeric arrays.
+# block / street_name / _id are left out; they are never aggregated on.
+TABLES = {
+    "resale_prices": {
+        "categorical": ("month", "town", "flat_type", "flat_model", "storey_range", "lease_commence_date"),
+        "numeric": ("floor_area_sqm", "resale_price"),
+    },
+    "bto_prices": {
+        "categorical": ("financial_year", "room_type", "town"),
+        "numeric": (
+            "min_selling_price", "max_selling_price",
+            "min_selling_price_less_ahg_shg", "max_selling_price_less_ahg_shg",
+        ),
+    },
+}
+
+AGGREGATES = ("count", "sum", "avg", "min", "max", "median")
+
+
+@dataclass(frozen=True)
+class Between:
+    """Inclusive range filter; either bound may be None."""
+    low: Any = None
+    high: Any = None
+
+
+@dataclass
+class AggregateQuery:
+    """
+    A filter / group / aggregate over one table.
+
+    Args:
+        table: "resale_prices" or "bto_prices"
+        where: Column -> value (equality), list/tuple/set (IN) or `Between`
+        group_by: Categorical columns to group on
+        aggregates: Output name -> (function, column); function is one of
+            AGGREGATES and column "*" is allowed for count
+        order_by: Group column or aggregate name to sort on (default: group keys)
+        descending: Sort order for `order_by`
+        limit: Maximum rows returned
+    """
+    table: str
+    where: Dict[str, Any] = field(default_factory=dict)
+    group_by: Sequence[str] = ()
+    aggregates: Dict[str, Tuple[str, str]] = field(default_factory=lambda: {"count": ("count", "*")})
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.group_by) + list(self.aggregates)
+
+    def to_sql(self) -> str:
+        """
+        Equivalent SQLite statement, for running the same query without a snapshot.
+
+        Raises:
+            ValueError: For `median`, which SQLite has no aggregate for
+        """
+        items = list(self.group_by)
+        for name, (func, column) in self.aggregates.items():
+            if func == "median":
+                raise ValueError("median has no SQLite equivalent; use the columnar snapshot")
+            items.append(f"{func.upper()}({column}) AS {name}")
+        sql = f"SELECT {', '.join(items)} FROM {self.table}"
+
+        conditions = []
+        for column, condition in self.where.items():
+            if isinstance(condition, Between):
+                if condition.low is not None:
+                    conditions.append(f"{column} >= {_literal(condition.low)}")
+                if condition.high is not None:
+                    conditions.append(f"{column} <= {_literal(condition.high)}")
+            elif isinstance(condition, (list, tuple, set, frozenset)):
+                conditions.append(f"{column} IN ({', '.join(_literal(v) for v in condition)})")
+            else:
+                conditions.append(f"{column} = {_literal(condition)}")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if self.group_by:
+            sql += " GROUP BY " + ", ".join(self.group_by)
+        order = [self.order_by] if self.order_by else list(self.group_by)
+        if order:
+            direction = " DESC" if self.descending and self.order_by else ""
+            sql += " ORDER BY " + ", ".join(f"{c}{direction}" for c in order)
+        if self.limit is not None:
+            sql += f" LIMIT {int(self.limit)}"
+        return sql
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, str):
+        return "'" + value.lower().replace("'", "''") + "'"
+    return repr(value)
+
+
+class ColumnarTable:
+    """
+    One table held column-wise in NumPy arrays.
+
+    Text columns are dictionary-encoded: `categories[col]` holds the sorted
+    distinct values and `codes[col]` an int32 code per row, with NULL coded
+    as len(categories). Because categories are sorted, code order is value
+    order; for `month` ('YYYY-MM') the codes are a month index, so date
+    ranges and ordering are integer comparisons. Numeric columns are float64
+    (NaN for NULL) so sums agree with SQLite.
+    """
+
+    def __init__(self, name: str, frame: pd.DataFrame, categorical: Sequence[str], numeric: Sequence[str]):
+        self.name = name
+        self.rows = len(frame)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.categories: Dict[str, np.ndarray] = {}
+        self.numeric: Dict[str, np.ndarray] = {}
+        self._index: Dict[str, Dict[str, int]] = {}
+        self._value_order: Dict[str, np.ndarray] = {}
+        for column in categorical:
+            values = frame[column].astype(object).where(frame[column].notna(), None)
+            cat = pd.Categorical(values)
+            categories = np.asarray(cat.categories, dtype=str)
+            codes = cat.codes.astype(np.int32)
+            codes[codes < 0] = len(categories)
+            self.codes[column] = codes
+            self.categories[column] = categories
+            self._index[column] = {v: i for i, v in enumerate(categories.tolist())}
+        for column in numeric:
+            self.numeric[column] = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=np.float64)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = list(self.codes.values()) + list(self.categories.values()) + list(self.numeric.values())
+        return sum(a.nbytes for a in arrays)
+
+    def value_order(self, column: str) -> np.ndarray:
+        """Row indices of a numeric column in ascending value order (cached)."""
+        order = self._value_order.get(column)
+        if order is None:
+            order = np.argsort(self.numeric[column], kind="stable")
+            self._value_order[column] = order
+        return order
+
+    def label(self, column: str, code: int) -> Optional[str]:
+        categories = self.categories[column]
+        return str(categories[code]) if code < len(categories) else None
+
+    def _check(self, column: str) -> None:
+        if column not in self.codes and column not in self.numeric:
+            raise ValueError(f"Unknown column {self.name}.{column}")
+
+    def mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean row mask for the filters of an `AggregateQuery`."""
+        mask = np.ones(self.rows, dtype=bool)
+        for column, condition in where.items():
+            self._check(column)
+            if column in self.codes:
+                mask &= self._categorical_mask(column, condition)
+            else:
+                mask &= self._numeric_mask(column, condition)
+        return mask
+
+    def _categorical_mask(self, column: str, condition: Any) -> np.ndarray:
+        codes = self.codes[column]
+        categories = self.categories[column]
+        if isinstance(condition, Between):
+            low = 0 if condition.low is None else np.searchsorted(categories, str(condition.low).lower(), "left")
+            high = len(categories) if condition.high is None else np.searchsorted(categories, str(condition.high).lower(), "right")
+            return (codes >= low) & (codes < high)
+        index = self._index[column]
+        values = condition if isinstance(condition, (list, tuple, set, frozenset)) else [condition]
+        wanted = [index[v] for v in (str(v).lower() for v in values) if v in index]
+        if not wanted:
+            return np.zeros(self.rows, dtype=bool)
+        if len(wanted) == 1:
+            return codes == wanted[0]
+        return np.isin(codes, wanted)
+
+    def _numeric_mask(self, column: str, condition: Any) -> np.ndarray:
+        values = self.numeric[column]
+        if isinstance(condition, Between):
+            mask = ~np.isnan(values)
+            if condition.low is not None:
+                mask &= values >= condition.low
+            if condition.high is not None:
+                mask &= values <= condition.high
+            return mask
+        if isinstance(condition, (list, tuple, set, frozenset)):
+            return np.isin(values, list(condition))
+        return values == condition
+
+
+class ColumnarSnapshot:
+    """
+    In-memory columnar copy of `resale_prices` and `bto_prices`.
+
+    Built once per worker from the SQLite file (see `get_snapshot`) and
+    answers `AggregateQuery`s with vectorized NumPy: the row mask comes from
+    integer code comparisons, groups from the combined codes of the group
+    columns, and count/sum/avg from `np.bincount`; min/max/median come from
+    one sort of the values within groups.
+    """
+
+    # Largest combined group-key space handled with dense counting arrays
+    DENSE_GROUPS = 1 << 20
+
+    def __init__(self, tables: Dict[str, ColumnarTable], version: Tuple[int, ...], load_seconds: float):
+        self.tables = tables
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, db_path: str) -> "ColumnarSnapshot":
+        version = database_version(db_path)
+        start = time.perf_counter()
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            tables = {}
+            for name, spec in TABLES.items():
+                columns = list(spec["categorical"]) + list(spec["numeric"])
+                frame = pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {name}", conn)
+                tables[name] = ColumnarTable(name, frame, spec["categorical"], spec["numeric"])
+        finally:
+            conn.close()
+        return cls(tables, version, time.perf_counter() - start)
+
+    def execute(self, query: AggregateQuery) -> Tuple[List[Tuple], List[str]]:
+        """
+        Run a query against the snapshot.
+
+        Returns:
+            (rows, columns) in the same shape as `Analyst._execute_sql`
+
+        Raises:
+            ValueError: For unknown tables, columns or aggregate functions
+        """
+        if query.table not in self.tables:
+            raise ValueError(f"Unknown table {query.table}")
+        table = self.tables[query.table]
+        for column in query.group_by:
+            if column not in table.codes:
+                raise ValueError(f"Can only group by categorical columns, not {query.table}.{column}")
+        mask = table.mask(query.where)
+
+        if query.group_by:
+            sizes = [len(table.categories[c]) + 1 for c in query.group_by]
+            combined = np.ravel_multi_index([table.codes[c][mask] for c in query.group_by], sizes)
+            space = int(np.prod(sizes))
+            if space <= self.DENSE_GROUPS:
+                # small key space: find occupied groups by counting instead of sorting
+                groups = np.flatnonzero(np.bincount(combined, minlength=space))
+                remap = np.empty(space, dtype=np.intp)
+                remap[groups] = np.arange(len(groups))
+                group_ids = remap[combined]
+            else:
+                groups, group_ids = np.unique(combined, return_inverse=True)
+            keys = np.unravel_index(groups, sizes)
+            n_groups = len(groups)
+        else:
+            # a plain aggregate yields one row even when nothing matches, as in SQL
+            keys = ()
+            group_ids = np.zeros(int(mask.sum()), dtype=np.intp)
+            n_groups = 1
+
+        results = {}
+        for name, (func, column) in query.aggregates.items():
+            results[name] = self._aggregate(table, func, column, mask, group_ids, n_groups)
+
+        rows = []
+        for g in range(n_groups):
+            row = [table.label(c, int(keys[i][g])) for i, c in enumerate(query.group_by)]
+            row += [results[name][g] for name in query.aggregates]
+            rows.append(tuple(row))
+
+        if query.order_by:
+            columns = query.columns
+            if query.order_by not in columns:
+                raise ValueError(f"Cannot order by {query.order_by}; not a group column or aggregate")
+            i = columns.index(query.order_by)
+            # NULLs first ascending, last descending, like SQLite
+            rows.sort(key=lambda r: (r[i] is not None, r[i] if r[i] is not None else 0), reverse=query.descending)
+        if query.limit is not None:
+            rows = rows[:query.limit]
+        return rows, query.columns
+
+    @staticmethod
+    def _aggregate(table: ColumnarTable, func: str, column: str, mask: np.ndarray,
+                   group_ids: np.ndarray, n_groups: int) -> List[Any]:
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {func}; expected one of {', '.join(AGGREGATES)}")
+        if func == "count":
+            if column == "*":
+                return np.bincount(group_ids, minlength=n_groups).tolist()
+            if column in table.codes:
+                valid = table.codes[column][mask] < len(table.categories[column])
+            else:
+                table._check(column)
+                valid = ~np.isnan(table.numeric[column][mask])
+            return np.bincount(group_ids[valid], minlength=n_groups).tolist()
+
+        if column not in table.numeric:
+            raise ValueError(f"{func} needs a numeric column, not {table.name}.{column}")
+        values = table.numeric[column][mask]
+        valid = ~np.isnan(values)
+        values, ids = values[valid], group_ids[valid]
+        counts = np.bincount(ids, minlength=n_groups)
+
+        if func in ("sum", "avg"):
+            sums = np.bincount(ids, weights=values, minlength=n_groups)
+            out = sums if func == "sum" else sums / np.maximum(counts, 1)
+        else:
+            # walk the column's value order (sorted once per snapshot), then a stable
+            # integer sort by group leaves each group's values contiguous and sorted
+            by_value = table.value_order(column)
+            row_groups = np.full(table.rows, -1, dtype=np.intp)
+            row_groups[mask] = group_ids
+            row_groups = row_groups[by_value]
+            keep = row_groups >= 0
+            keep &= ~np.isnan(table.numeric[column][by_value])
+            row_groups = row_groups[keep]
+            ordered = table.numeric[column][by_value][keep][np.argsort(row_groups, kind="stable")]
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            last = np.maximum(starts + counts - 1, 0)
+            if len(ordered) == 0:
+                out = np.zeros(n_groups)
+            elif func == "min":
+                out = ordered[np.minimum(starts, len(ordered) - 1)]
+            elif func == "max":
+                out = ordered[np.minimum(last, len(ordered) - 1)]
+            else:
+                lo = np.minimum(starts + (counts - 1) // 2, len(ordered) - 1)
+                hi = np.minimum(starts + counts // 2, len(ordered) - 1)
+                out = (ordered[lo] + ordered[hi]) / 2
+        # SQL gives NULL for an aggregate over no values
+        return [float(v) if c else None for v, c in zip(out.tolist(), counts.tolist())]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": list(self.version),
+            "load_seconds": round(self.load_seconds, 4),
+            "loaded_at": self.loaded_at,
+            "tables": {
+                name: {"rows": t.rows, "bytes": t.nbytes,
+                       "categories": {c: len(v) for c, v in t.categories.items()}}
+                for name, t in self.tables.items()
+            },
+        }
+
+
+_snapshots: Dict[str, ColumnarSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db_path: str) -> ColumnarSnapshot:
+    """
+    The process-wide snapshot of `db_path`, loaded on first use.
+
+    Reloaded when the database file version changes (e.g. after an ingest),
+    so every worker holds one copy that is never older than the file.
+    """
+    key = str(Path(db_path).resolve())
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None or snapshot.version != database_version(db_path):
+            snapshot = ColumnarSnapshot.load(db_path)
+            _snapshots[key] = snapshot
+        return snapshot
@@ -0,0 +1,146 @@
+import logging
+from typing import List, Optional, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows rendered to estimate the size of a large result set
+ESTIMATE_ROWS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini-style tokenizers (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _row(values) -> str:
+    return " | ".join(str(v) for v in values)
+
+
+def _unique_columns(columns: List[str]) -> List[str]:
+    """Column names made unique by position (`SELECT *` over a join repeats names): town, town_2, ..."""
+    seen = set(columns)
+    unique, counts = [], {}
+    for column in columns:
+        counts[column] = counts.get(column, 0) + 1
+        name = column
+        if counts[column] > 1:
+            n = counts[column]
+            while f"{column}_{n}" in seen:
+                n += 1
+            name = f"{column}_{n}"
+            seen.add(name)
+        unique.append(name)
+    return unique
+
+
+def _estimate_result_tokens(results: List[Tuple]) -> int:
+    """Tokens of `str(results)`, extrapolated from the first ESTIMATE_ROWS rows of a larger result set."""
+    if len(results) <= ESTIMATE_ROWS:
+        return estimate_tokens(str(results))
+    return estimate_tokens(str(results[:ESTIMATE_ROWS])) * len(results) // ESTIMATE_ROWS
+
+
+def digest_results(results: List[Tuple], columns: List[str], top_k: int = 10, sample: int = 5) -> str:
+    """
+    Statistical digest of a result set, for prompts where the raw rows would be too long.
+
+    Contains the row count, min/max/mean/quartiles of numeric columns, the
+    most frequent values of text columns, the top and bottom `top_k` groups
+    of the first text column by the first numeric column, and the first and
+    last `sample` rows.
+
+    Args:
+        results: Rows as returned by `Analyst._execute_sql`
+        columns: Column names
+        top_k: Values / groups listed per column
+        sample: Rows shown from each end of the result set
+
+    Returns:
+        Plain-text digest
+    """
+    columns = _unique_columns(columns)
+    df = pd.DataFrame.from_records(results, columns=columns)
+    numeric = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    text = [c for c in df.columns if c not in numeric]
+    lines = [f"Result digest ({len(df)} rows; columns: {', '.join(columns)})"]
+
+    if numeric:
+        lines.append("\nNumeric columns (min / p25 / median / p75 / max, mean):")
+        for column in numeric:
+            values = df[column].dropna()
+            if values.empty:
+                lines.append(f"- {column}: all NULL")
+                continue
+            q = values.quantile([0.25, 0.5, 0.75])
+            lines.append(
+                f"- {column}: {values.min():,.2f} / {q[0.25]:,.2f} / {q[0.5]:,.2f} / "
+                f"{q[0.75]:,.2f} / {values.max():,.2f}, mean {values.mean():,.2f}"
+                + (f" ({len(df) - len(values)} NULL)" if len(values) < len(df) else "")
+            )
+
+    if text:
+        lines.append(f"\nText columns (distinct values; top {top_k} by frequency):")
+        for column in text:
+            counts = df[column].value_counts(dropna=False)
+            top = ", ".join(f"{v} ({n})" for v, n in counts.head(top_k).items())
+            lines.append(f"- {column}: {len(counts)} distinct; {top}")
+
+    if text and numeric:
+        group, measure = text[0], numeric[0]
+        means = df.groupby(group, dropna=False)[measure].mean().sort_values(ascending=False)
+        if len(means) > 1:
+            lines.append(f"\nMean {measure} by {group}, highest {min(top_k, len(means))}:")
+            lines.extend(f"- {k}: {v:,.2f}" for k, v in means.head(top_k).items())
+            if len(means) > top_k:
+                lines.append(f"Lowest {min(top_k, len(means) - top_k)}:")
+                lines.extend(f"- {k}: {v:,.2f}" for k, v in means.tail(min(top_k, len(means) - top_k)).items())
+
+    lines.append(f"\nFirst {min(sample, len(df))} rows:")
+    lines.append(_row(columns))
+    lines.extend(_row(r) for r in results[:sample])
+    if len(results) > sample:
+        lines.append(f"Last {min(sample, len(results) - sample)} rows:")
+        lines.extend(_row(r) for r in results[max(sample, len(results) - sample):])
+    return "\n".join(lines)
+
+
+def compact_results(
+    results: List[Tuple],
+    columns: Optional[List[str]],
+    max_tokens: int,
+    top_k: int = 10,
+    sample: int = 5,
+) -> Tuple[str, int, int]:
+    """
+    Text of a result set for a prompt, replaced by `digest_results` above `max_tokens`.
+
+    The raw size of a large result set is estimated from a sample, so its
+    full text is never built. If the digest cannot be computed, the first
+    rows that fit in `max_tokens` are sent instead.
+
+    Returns:
+        (text, tokens of the raw rows, tokens of the text actually sent)
+    """
+    if not results:
+        raw = "No rows returned."
+        return raw, estimate_tokens(raw), estimate_tokens(raw)
+    raw_tokens = _estimate_result_tokens(results)
+    if raw_tokens <= max_tokens:
+        raw = str(results)
+        raw_tokens = estimate_tokens(raw)
+        return raw, raw_tokens, raw_tokens
+    if columns:
+        try:
+            digest = digest_results(results, columns, top_k=top_k, sample=sample)
+            return digest, raw_tokens, estimate_tokens(digest)
+        except Exception as e:
+            logger.warning(f"Could not digest {len(results)} rows, sending the first rows instead: {e}")
+    head, tokens = [], 0
+    for row in results:
+        tokens += estimate_tokens(str(row)) + 1
+        if tokens > max_tokens and head:
+            break
+        head.append(row)
+    text = f"{head} ... ({len(results) - len(head)} more rows)" if len(head) < len(results) else str(head)
+    return text, raw_tokens, estimate_tokens(text)
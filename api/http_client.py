@@ -0,0 +1,227 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying on an idempotent call (e.g. /predict while the server warms up)
+RETRY_STATUSES = {502, 503, 504}
+
+# Per-endpoint read timeouts in seconds; /analyze waits on two LLM calls
+DEFAULT_TIMEOUTS = {"predict": 10.0, "predict_batch": 60.0, "predict_sweep": 60.0, "analyze": 60.0}
+
+
+def timeouts_from_env() -> Dict[str, float]:
+    """Per-endpoint timeouts, overridden by HTTP_TIMEOUT_<ENDPOINT> environment variables."""
+    return {
+        name: float(os.getenv(f"HTTP_TIMEOUT_{name.upper()}", str(default)))
+        for name, default in DEFAULT_TIMEOUTS.items()
+    }
+
+
+class HTTPClient:
+    """
+    Shared keep-alive HTTP client for calls to the prediction / analysis API.
+
+    Sync calls go through one `requests.Session` whose connection pool is
+    sized by `pool_size`, so repeated calls to the same host reuse TCP
+    connections instead of opening one per call. Async calls use an
+    `httpx.AsyncClient` with the same limits, created on first use (httpx
+    is only needed if the async API is used).
+
+    Every call names its endpoint, which selects its timeout. Calls marked
+    idempotent are retried on connection errors, timeouts and 502/503/504
+    with exponential backoff and full jitter. `stats()` reports in-flight
+    and peak concurrency against the pool size, and how many sync requests
+    reused a pooled connection.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 3.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        retries: int = 2,
+        backoff: float = 0.2,
+    ):
+        """
+        Args:
+            pool_size: Keep-alive connections per host (and max concurrent requests without queueing)
+            connect_timeout: Seconds to establish a connection
+            timeouts: Endpoint name -> read timeout in seconds (merged over DEFAULT_TIMEOUTS)
+            retries: Extra attempts for idempotent calls
+            backoff: Base delay in seconds; attempt n waits up to backoff * 2**n
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._async_client = None
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._async_requests = 0
+
+    @classmethod
+    def from_env(cls) -> "HTTPClient":
+        return cls(
+            pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3")),
+            timeouts=timeouts_from_env(),
+            retries=int(os.getenv("HTTP_RETRIES", "2")),
+            backoff=float(os.getenv("HTTP_BACKOFF", "0.2")),
+        )
+
+    def timeout(self, endpoint: str) -> float:
+        return self.timeouts.get(endpoint, max(self.timeouts.values()))
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _enter(self, is_async: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self._async_requests += int(is_async)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self, failed: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += int(failed)
+
+    def post(self, url: str, json: Any, endpoint: str, idempotent: bool = False) -> requests.Response:
+        """
+        POST `json` to `url` and return the successful response.
+
+        Raises:
+            requests.RequestException: If the call (and any retries) failed,
+                including non-2xx responses
+        """
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            self._enter()
+            failed = True
+            try:
+                resp = self.session.post(
+                    url, json=json, headers=tracer.headers(), timeout=(self.connect_timeout, self.timeout(endpoint))
+                )
+                if resp.status_code in RETRY_STATUSES and attempt + 1 < attempts:
+                    raise requests.HTTPError(f"{resp.status_code} from {url}", response=resp)
+                resp.raise_for_status()
+                failed = False
+                return resp
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or (
+                    e.response is not None and e.response.status_code in RETRY_STATUSES
+                )
+                if not retryable or attempt + 1 >= attempts:
+                    raise
+                delay = self._delay(attempt)
+                logger.warning(f"{endpoint} call failed ({e}); retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+                failed = False  # counted once, on the final attempt
+                with self._lock:
+                    self.retried += 1
+                time.sleep(delay)
+            finally:
+                self._exit(failed)
+        raise RuntimeError("unreachable")
+
+    async def apost(self, url: str, json: Any, endpoint: str, idempotent: bool = False) -> Any:
+        """
+        Async counterpart of `post`, on a shared `httpx.AsyncClient`.
+
+        Returns:
+            The `httpx.Response`
+
+        Raises:
+            httpx.HTTPError: If the call (and any retries) failed, including non-2xx responses
+        """
+        import asyncio
+        import httpx
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            self._enter(is_async=True)
+            failed = True
+            try:
+                resp = await self._async_client.post(
+                    url, json=json, headers=tracer.headers(),
+                    timeout=httpx.Timeout(self.timeout(endpoint), connect=self.connect_timeout),
+                )
+                if resp.status_code in RETRY_STATUSES and attempt + 1 < attempts:
+                    raise httpx.HTTPStatusError(f"{resp.status_code} from {url}", request=resp.request, response=resp)
+                resp.raise_for_status()
+                failed = False
+                return resp
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRY_STATUSES
+                if not retryable or attempt + 1 >= attempts:
+                    raise
+                delay = self._delay(attempt)
+                logger.warning(f"{endpoint} call failed ({e}); retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+                failed = False  # counted once, on the final attempt
+                with self._lock:
+                    self.retried += 1
+                await asyncio.sleep(delay)
+            finally:
+                self._exit(failed)
+        raise RuntimeError("unreachable")
+
+    def _connections_opened(self) -> int:
+        """New TCP connections made by the sync session's urllib3 pools."""
+        pools = self._adapter.poolmanager.pools
+        return sum(getattr(pools[key], "num_connections", 0) for key in list(pools.keys()))
+
+    def stats(self) -> Dict[str, float]:
+        opened = self._connections_opened()
+        with self._lock:
+            sync_requests = self.requests - self._async_requests
+            return {
+                "pool_size": self.pool_size,
+                "requests": self.requests,
+                "retried": self.retried,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "peak_utilization": self.peak_in_flight / self.pool_size,
+                "connections_opened": opened,
+                "connection_reuse_rate": 1 - opened / sync_requests if sync_requests else 0.0,
+            }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[HTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """The process-wide client, configured from HTTP_* environment variables on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient.from_env()
+        return _client
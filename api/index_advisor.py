@@ -0,0 +1,294 @@
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class LoggedQuery:
+    """Aggregated executions of one SQL statement."""
+    sql: str
+    count: int = 0
+    total_seconds: float = 0.0
+    last_rows: int = 0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+
+class QueryLog:
+    """
+    Thread-safe record of the SQL actually executed by `Analyst._execute_sql`.
+
+    Statements are aggregated in memory (bounded, least recently executed
+    dropped first) and, if `path` is given, also appended to a JSONL file so
+    the advisor can be run offline against a production workload.
+    """
+
+    def __init__(self, maxlen: int = 1000, path: Optional[str] = None):
+        self.maxlen = maxlen
+        self.path = path
+        self._queries: "OrderedDict[str, LoggedQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, seconds: float, rows: int) -> None:
+        key = " ".join(sql.split())
+        with self._lock:
+            entry = self._queries.pop(key, None) or LoggedQuery(sql=key)
+            entry.count += 1
+            entry.total_seconds += seconds
+            entry.last_rows = rows
+            self._queries[key] = entry
+            while len(self._queries) > self.maxlen:
+                self._queries.popitem(last=False)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"sql": key, "seconds": seconds, "rows": rows, "ts": time.time()}) + "\n")
+
+    def queries(self) -> List[LoggedQuery]:
+        with self._lock:
+            return list(self._queries.values())
+
+    @classmethod
+    def from_file(cls, path: str, maxlen: int = 1000) -> "QueryLog":
+        """Rebuild a log from a JSONL file written by a running service."""
+        log = cls(maxlen=maxlen)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    log.record(entry["sql"], entry.get("seconds", 0.0), entry.get("rows", 0))
+        return log
+
+
+@dataclass
+class IndexCandidate:
+    table: str
+    columns: Tuple[str, ...]
+    queries: List[str] = field(default_factory=list)
+    weight: int = 0
+
+    @property
+    def name(self) -> str:
+        slug = "_".join(re.sub(r"\W+", "_", c) for c in self.columns)
+        return f"idx_advisor_{self.table}_{slug}"
+
+    @property
+    def ddl(self) -> str:
+        cols = ", ".join(self.columns)
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({cols})"
+
+
+class IndexAdvisor:
+    """
+    Proposes and builds indexes for a logged SQL workload.
+
+    For every distinct logged statement it records `EXPLAIN QUERY PLAN`,
+    finds full-table scans, and proposes one composite index per scanned
+    table: equality-filtered columns first, then the first range-filtered
+    column, then GROUP BY columns, then (while the index stays narrow) the
+    remaining referenced columns so the query can be answered from the
+    index alone. Candidates that are a prefix of another are merged.
+    """
+
+    MAX_INDEX_COLUMNS = 6
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Path to the SQLite database (opened read-write to build indexes)
+        """
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self.schema = self._load_schema()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _load_schema(self) -> Dict[str, List[str]]:
+        tables = [r[0] for r in self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        return {t: [r[1] for r in self._conn.execute(f"PRAGMA table_info({t})")] for t in tables}
+
+    def explain(self, sql: str) -> List[str]:
+        """`EXPLAIN QUERY PLAN` detail lines for a statement."""
+        return [row[-1] for row in self._conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+    def _aliases(self, sql: str) -> Dict[str, str]:
+        """Map every name a table is referred to by (itself or an alias) to the table."""
+        aliases = {}
+        for table in self.schema:
+            aliases[table] = table
+            pattern = rf"\b{re.escape(table)}\b\s+(?:AS\s+)?([A-Za-z_]\w*)"
+            for alias in re.findall(pattern, sql, flags=re.IGNORECASE):
+                if alias.upper() not in {"WHERE", "GROUP", "ORDER", "JOIN", "LEFT", "INNER", "ON", "LIMIT", "UNION", "AS"}:
+                    aliases[alias] = table
+        return aliases
+
+    def scanned_tables(self, sql: str) -> List[str]:
+        aliases = self._aliases(sql)
+        tables = []
+        for detail in self.explain(sql):
+            match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if match and "USING" not in detail and match.group(1) in aliases:
+                table = aliases[match.group(1)]
+                if table not in tables:
+                    tables.append(table)
+        return tables
+
+    def _columns_for(self, sql: str, table: str) -> Tuple[List[str], List[str], List[str], List[str]]:
+        """(equality, range, group_by, other) columns of `table` referenced by `sql`."""
+        text = re.sub(r"'(?:[^']|'')*'", "''", sql)  # literals can't be confused with columns
+        columns = [c for c in self.schema[table] if c != "_id"]
+        group_match = re.search(r"\bGROUP\s+BY\b(.*?)(?:\bHAVING\b|\bORDER\b|\bLIMIT\b|\)|;|$)", text, re.IGNORECASE | re.DOTALL)
+        group_text = group_match.group(1) if group_match else ""
+
+        equality, ranged, grouped, other = [], [], [], []
+        for col in columns:
+            ref = rf"(?:\b\w+\.)?\b{re.escape(col)}\b"
+            if not re.search(ref, text):
+                continue
+            if re.search(ref + r"\s*(?:=|\bIN\b|\bIS\b)", text, re.IGNORECASE):
+                equality.append(col)
+            elif re.search(ref + r"\s*(?:<|>|\bBETWEEN\b|\bLIKE\b)", text, re.IGNORECASE):
+                ranged.append(col)
+            elif re.search(ref, group_text):
+                grouped.append(col)
+            else:
+                other.append(col)
+        return equality, ranged, grouped, other
+
+    def propose(self, log: QueryLog) -> List[IndexCandidate]:
+        """Candidate indexes for the logged workload, most used first."""
+        candidates: Dict[Tuple[str, Tuple[str, ...]], IndexCandidate] = {}
+        for query in log.queries():
+            try:
+                scanned = self.scanned_tables(query.sql)
+            except sqlite3.Error:
+                continue
+            for table in scanned:
+                equality, ranged, grouped, other = self._columns_for(query.sql, table)
+                key_cols = equality + ranged[:1] + [c for c in grouped if c not in equality]
+                if not key_cols:
+                    continue
+                cols = key_cols + [c for c in ranged[1:] + other if c not in key_cols]
+                if len(cols) > self.MAX_INDEX_COLUMNS:
+                    cols = key_cols[:self.MAX_INDEX_COLUMNS]
+                candidate = candidates.setdefault((table, tuple(cols)), IndexCandidate(table, tuple(cols)))
+                candidate.queries.append(query.sql)
+                candidate.weight += query.count
+
+        # fold candidates whose columns are a prefix of a wider one on the same table
+        merged = sorted(candidates.values(), key=lambda c: -len(c.columns))
+        kept: List[IndexCandidate] = []
+        for candidate in merged:
+            wider = next((k for k in kept if k.table == candidate.table
+                          and k.columns[:len(candidate.columns)] == candidate.columns), None)
+            if wider:
+                wider.queries.extend(candidate.queries)
+                wider.weight += candidate.weight
+            else:
+                kept.append(candidate)
+        return sorted(kept, key=lambda c: -c.weight)
+
+    def build(self, candidates: List[IndexCandidate]) -> None:
+        """Create the indexes and refresh planner statistics."""
+        for candidate in candidates:
+            self._conn.execute(candidate.ddl)
+        self._conn.execute("ANALYZE")
+        self._conn.commit()
+
+    def time_query(self, sql: str, repeat: int = 5) -> float:
+        """Median wall-clock seconds to run `sql` to completion."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self._conn.execute(sql).fetchall()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def run(self, log: QueryLog, build: bool = False, repeat: int = 5) -> Dict:
+        """
+        Analyze the workload and optionally build the proposed indexes.
+
+        Args:
+            log: Logged workload
+            build: Whether to create the proposed indexes
+            repeat: Executions per query when timing
+
+        Returns:
+            Report with per-query plans, proposed DDL and before/after latency
+        """
+        queries = [q for q in log.queries() if self._explains(q.sql)]
+        before = {q.sql: self.time_query(q.sql, repeat) for q in queries}
+        plans_before = {q.sql: self.explain(q.sql) for q in queries}
+        candidates = self.propose(log)
+
+        after = {}
+        plans_after = {}
+        if build and candidates:
+            self.build(candidates)
+            after = {q.sql: self.time_query(q.sql, repeat) for q in queries}
+            plans_after = {q.sql: self.explain(q.sql) for q in queries}
+
+        return {
+            "indexes": [{"ddl": c.ddl, "weight": c.weight, "queries": len(c.queries)} for c in candidates],
+            "built": bool(build and candidates),
+            "queries": [
+                {
+                    "sql": q.sql,
+                    "executions": q.count,
+                    "plan_before": plans_before[q.sql],
+                    "plan_after": plans_after.get(q.sql),
+                    "seconds_before": before[q.sql],
+                    "seconds_after": after.get(q.sql),
+                }
+                for q in queries
+            ],
+        }
+
+    def _explains(self, sql: str) -> bool:
+        try:
+            self.explain(sql)
+            return True
+        except sqlite3.Error:
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose and build indexes for the logged Analyst workload.")
+    parser.add_argument("--db", default="data/hdb_prices.db", help="SQLite database")
+    parser.add_argument("--log", required=True, help="JSONL query log (set ANALYST_QUERY_LOG on the service)")
+    parser.add_argument("--build", action="store_true", help="create the proposed indexes")
+    parser.add_argument("--repeat", type=int, default=5, help="timed executions per query")
+    args = parser.parse_args()
+
+    advisor = IndexAdvisor(args.db)
+    report = advisor.run(QueryLog.from_file(args.log), build=args.build, repeat=args.repeat)
+    advisor.close()
+
+    print("Proposed indexes:")
+    for index in report["indexes"]:
+        print(f"  {index['ddl']};  -- {index['queries']} queries, {index['weight']} executions")
+    print()
+    for q in report["queries"]:
+        print(q["sql"])
+        print(f"  plan:   {' | '.join(q['plan_before'])}")
+        if q["plan_after"] is not None:
+            print(f"  now:    {' | '.join(q['plan_after'])}")
+            speedup = q["seconds_before"] / q["seconds_after"] if q["seconds_after"] else float("inf")
+            print(f"  before: {q['seconds_before'] * 1000:.2f} ms  after: {q['seconds_after'] * 1000:.2f} ms  ({speedup:.1f}x)")
+        else:
+            print(f"  latency: {q['seconds_before'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from api.digest import estimate_tokens
+from api.prompts import Prompt, PromptUsage, ledger
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Provider status codes worth retrying: rate limited, or a transient server error
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+# Recorded responses the stub backend replays
+DEFAULT_FIXTURES = "benchmarks/fixtures/llm.jsonl"
+
+
+def _tools_key(tools: Optional[List[dict]], tool_config: Optional[dict]) -> str:
+    if not tools:
+        return ""
+    return hashlib.sha256(json.dumps([tools, tool_config], sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def request_key(prompt: Prompt, tools: Optional[List[dict]] = None, tool_config: Optional[dict] = None,
+                model: str = "") -> str:
+    """Identity of one call: identical keys get identical answers."""
+    body = "\0".join([model, prompt.key, _tools_key(tools, tool_config), prompt.dynamic])
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:24]
+
+
+class GenaiBackend:
+    """
+    Gemini through one shared `google.genai.Client`.
+
+    One `GenerateContentConfig` is built per static prefix, tool set and
+    model and then reused, so each call only sends the dynamic suffix. With
+    `explicit=True` each prefix is uploaded once with `client.caches.create`
+    and later calls reference it by name. Prefixes the provider refuses to
+    cache (e.g. below its minimum size) fall back to being sent as the
+    system instruction, where Gemini's implicit prefix caching still
+    applies; the refusal is remembered per prefix. A cache is recreated
+    before its TTL runs out, and at once if the provider no longer finds it.
+    """
+
+    name = "genai"
+
+    # Context caches are recreated once this fraction of their TTL has passed
+    REFRESH_AFTER = 0.9
+
+    def __init__(self, api_key: str, explicit: bool = False, ttl_seconds: int = 3600):
+        # Imported here so the stub backend never needs the SDK
+        from google import genai
+
+        self.client = genai.Client(api_key=api_key)
+        self.explicit = explicit
+        self.ttl_seconds = ttl_seconds
+        # key -> (config, monotonic time after which it is rebuilt, or None for never)
+        self._configs: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> str:
+        return f"{model}:{prompt.key}:{_tools_key(tools, tool_config)}"
+
+    def config(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Any:
+        from google.genai import types
+
+        key = self._key(prompt, tools, tool_config, model)
+        with self._lock:
+            config, refresh_at = self._configs.get(key, (None, None))
+            if config is not None and (refresh_at is None or time.monotonic() < refresh_at):
+                return config
+            config = types.GenerateContentConfig(system_instruction=prompt.static, tools=tools, tool_config=tool_config)
+            refresh_at = None
+            if self.explicit:
+                try:
+                    cache = self.client.caches.create(
+                        model=model,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=prompt.static, tools=tools, tool_config=tool_config,
+                            ttl=f"{self.ttl_seconds}s",
+                        ),
+                    )
+                    config = types.GenerateContentConfig(cached_content=cache.name)
+                    refresh_at = time.monotonic() + self.ttl_seconds * self.REFRESH_AFTER
+                except Exception as e:
+                    logger.info(f"Context cache unavailable for {prompt.name}, using system instruction: {e}")
+            self._configs[key] = (config, refresh_at)
+            return config
+
+    def _evict(self, key: str, config: Any) -> None:
+        with self._lock:
+            if self._configs.get(key, (None,))[0] is config:
+                del self._configs[key]
+
+    @staticmethod
+    def _cache_missing(error: Exception, config: Any) -> bool:
+        # an expired or deleted cache is reported as 403 "CachedContent not found (or permission denied)" or 404
+        return getattr(config, "cached_content", None) is not None and getattr(error, "code", None) in (403, 404)
+
+    def generate(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Any:
+        config = self.config(prompt, tools, tool_config, model)
+        try:
+            return self.client.models.generate_content(model=model, contents=prompt.dynamic, config=config)
+        except Exception as e:
+            if not self._cache_missing(e, config):
+                raise
+            logger.info(f"Context cache for {prompt.name} is gone, recreating it: {e}")
+            self._evict(self._key(prompt, tools, tool_config, model), config)
+            return self.client.models.generate_content(
+                model=model, contents=prompt.dynamic, config=self.config(prompt, tools, tool_config, model)
+            )
+
+    def stream(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Iterator[Any]:
+        config = self.config(prompt, tools, tool_config, model)
+        chunks = iter(self.client.models.generate_content_stream(model=model, contents=prompt.dynamic, config=config))
+        try:
+            # the request is only sent once the first chunk is read
+            first = next(chunks, None)
+        except Exception as e:
+            if not self._cache_missing(e, config):
+                raise
+            logger.info(f"Context cache for {prompt.name} is gone, recreating it: {e}")
+            self._evict(self._key(prompt, tools, tool_config, model), config)
+            chunks = iter(self.client.models.generate_content_stream(
+                model=model, contents=prompt.dynamic, config=self.config(prompt, tools, tool_config, model)
+            ))
+            first = next(chunks, None)
+        if first is not None:
+            yield first
+        yield from chunks
+
+
+class StubBackend:
+    """
+    Deterministic offline backend that replays recorded fixtures.
+
+    Fixtures are JSON lines of `{"prompt": name, "response": {...}}`, where
+    the response is a `GenerateContentResponse` as JSON (what the gateway
+    records with LLM_RECORD_FIXTURES), plus one way to pick the entry:
+
+        "key": a `request_key`, for an exact recorded call
+        "contains": [substrings], all found in the lower-cased dynamic prompt
+        neither: a default for that prompt name
+
+    Lookups try exact keys, then `contains` entries in file order, then the
+    defaults (one chosen by hashing the prompt, so repeats get the same
+    answer). A prompt with no fixture at all gets a short placeholder text.
+    Responses are parsed once, on load, and shared by every call that
+    matches them. `latency` seconds are slept per call to simulate the
+    provider.
+    """
+
+    name = "stub"
+
+    def __init__(self, path: str = DEFAULT_FIXTURES, latency: float = 0.0):
+        from google.genai import types
+
+        self.types = types
+        self.path = path
+        self.latency = latency
+        self.exact: Dict[str, Any] = {}
+        self.contains: Dict[str, List[dict]] = {}
+        self.defaults: Dict[str, List[Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.add(json.loads(line))
+        else:
+            logger.warning(f"No LLM fixtures at {path}; every stub call returns placeholder text")
+
+    def add(self, fixture: dict) -> None:
+        response = self.types.GenerateContentResponse.model_validate(fixture["response"])
+        if "key" in fixture:
+            self.exact[fixture["key"]] = response
+        elif "contains" in fixture:
+            self.contains.setdefault(fixture["prompt"], []).append({**fixture, "response": response})
+        else:
+            self.defaults.setdefault(fixture["prompt"], []).append(response)
+
+    def lookup(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Any:
+        exact = self.exact.get(request_key(prompt, tools, tool_config, model))
+        if exact is not None:
+            return exact
+        text = prompt.dynamic.lower()
+        for fixture in self.contains.get(prompt.name, []):
+            if all(s.lower() in text for s in fixture["contains"]):
+                return fixture["response"]
+        defaults = self.defaults.get(prompt.name)
+        if defaults:
+            digest = int(hashlib.sha256(prompt.dynamic.encode("utf-8")).hexdigest(), 16)
+            return defaults[digest % len(defaults)]
+        return self.types.GenerateContentResponse.model_validate(
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": f"[stub answer for {prompt.name}]"}]}}]}
+        )
+
+    def generate(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Any:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.lookup(prompt, tools, tool_config, model)
+
+    def stream(self, prompt: Prompt, tools: Optional[List[dict]], tool_config: Optional[dict], model: str) -> Iterator[Any]:
+        response = self.generate(prompt, tools, tool_config, model)
+        text = response.text or ""
+        words = re.findall(r"\S+\s*", text) or [text]
+        for i, word in enumerate(words):
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": word}]}}]}
+            if i == len(words) - 1 and response.usage_metadata is not None:
+                chunk["usage_metadata"] = response.usage_metadata.model_dump(mode="json", exclude_none=True)
+            yield self.types.GenerateContentResponse.model_validate(chunk)
+
+
+class LLMGateway:
+    """
+    The one way every component calls the LLM.
+
+    - one backend (and so one client) per process, shared by Analyst,
+      Orchestrator and Synthesizer
+    - a global concurrency limit plus optional per-route limits (route =
+      prompt name); callers beyond a limit wait
+    - retries on rate limits (429) and transient errors (5xx, connection
+      errors) with exponential backoff and full jitter, waiting at least
+      as long as the provider's retryDelay
+    - identical concurrent requests (same model, prompt, tools) are sent
+      once and share the response; each is still charged to its own
+      request's token budget
+    - token charging in `ledger` and an `llm.<prompt>` trace span per call
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        model: str = DEFAULT_MODEL,
+        max_concurrency: int = 8,
+        route_limits: Optional[Dict[str, int]] = None,
+        retries: int = 3,
+        backoff: float = 1.0,
+        record_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            backend: `GenaiBackend` or `StubBackend`
+            model: Model used when a call does not name one
+            max_concurrency: Calls in flight across all routes
+            route_limits: Prompt name -> calls in flight for that route
+            retries: Extra attempts after a retryable error
+            backoff: Base delay in seconds; attempt n waits up to backoff * 2**n
+            record_path: Append every response as a stub fixture to this JSONL file
+        """
+        self.backend = backend
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.route_limits = dict(route_limits or {})
+        self.retries = retries
+        self.backoff = backoff
+        self.record_path = record_path
+
+        self._global = threading.BoundedSemaphore(max_concurrency)
+        self._routes = {name: threading.BoundedSemaphore(n) for name, n in self.route_limits.items()}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deduplicated = 0
+        self.retried = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.wait_seconds = 0.0
+        self.by_route: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        """
+        Configured from LLM_BACKEND (genai | stub), LLM_MODEL, LLM_MAX_CONCURRENCY,
+        LLM_ROUTE_CONCURRENCY ("analyst.sql=2,orchestrator.route=4"), LLM_RETRIES,
+        LLM_BACKOFF, LLM_RECORD_FIXTURES, and for the stub LLM_FIXTURES and
+        LLM_STUB_LATENCY; GEMINI_API_KEY and PROMPT_CONTEXT_CACHE for Gemini.
+        """
+        kind = os.getenv("LLM_BACKEND", "genai").lower()
+        if kind == "stub":
+            backend = StubBackend(os.getenv("LLM_FIXTURES", DEFAULT_FIXTURES), float(os.getenv("LLM_STUB_LATENCY", "0")))
+        elif kind == "genai":
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found in environment variables")
+            backend = GenaiBackend(api_key, explicit=os.getenv("PROMPT_CONTEXT_CACHE", "0") == "1")
+        else:
+            raise ValueError(f"Unknown LLM_BACKEND {kind!r} (expected 'genai' or 'stub')")
+        routes = {}
+        for item in filter(None, os.getenv("LLM_ROUTE_CONCURRENCY", "").split(",")):
+            name, _, limit = item.partition("=")
+            routes[name.strip()] = int(limit)
+        return cls(
+            backend,
+            model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            route_limits=routes,
+            retries=int(os.getenv("LLM_RETRIES", "3")),
+            backoff=float(os.getenv("LLM_BACKOFF", "1.0")),
+            record_path=os.getenv("LLM_RECORD_FIXTURES"),
+        )
+
+    # ---------- limits and retries ----------
+    def _acquire(self, route: str) -> None:
+        start = time.perf_counter()
+        route_limit = self._routes.get(route)
+        if route_limit is not None:
+            route_limit.acquire()
+        self._global.acquire()
+        with self._lock:
+            self.wait_seconds += time.perf_counter() - start
+            self.calls += 1
+            self.by_route[route] = self.by_route.get(route, 0) + 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self, route: str) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._global.release()
+        route_limit = self._routes.get(route)
+        if route_limit is not None:
+            route_limit.release()
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        import httpx
+
+        # connection resets and timeouts below the SDK carry no status code
+        if isinstance(error, httpx.TransportError):
+            return True
+        return getattr(error, "code", None) in RETRY_CODES
+
+    def _delay(self, error: Exception, attempt: int) -> float:
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        # RESOURCE_EXHAUSTED errors may say how long to wait, e.g. "retryDelay": "7s"
+        hinted = re.search(r"retryDelay'?\"?:\s*'?\"?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "") or error))
+        return max(delay, float(hinted.group(1))) if hinted else delay
+
+    def _with_retries(self, prompt: Prompt, send) -> Any:
+        for attempt in range(self.retries + 1):
+            try:
+                return send()
+            except Exception as e:
+                if attempt >= self.retries or not self._retryable(e):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self._delay(e, attempt)
+                logger.warning(f"LLM call {prompt.name} failed ({e}); retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(delay)
+
+    def _record_fixture(self, prompt: Prompt, key: str, response: Any) -> None:
+        if not self.record_path:
+            return
+        fixture = {"prompt": prompt.name, "key": key, "response": response.model_dump(mode="json", exclude_none=True)}
+        with self._lock, open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(fixture) + "\n")
+
+    # ---------- calls ----------
+    def generate(self, prompt: Prompt, tools: Optional[List[dict]] = None, tool_config: Optional[dict] = None,
+                 model: Optional[str] = None) -> Any:
+        """
+        Send `prompt` (static prefix as system instruction, dynamic suffix as
+        content) and return the `GenerateContentResponse`.
+
+        Raises:
+            TokenBudgetExceeded: If the call would exceed the request's token budget
+        """
+        model = model or self.model
+        key = request_key(prompt, tools, tool_config, model)
+        # charged to this request whether it sends the call or shares another's, and before
+        # it can lead: a leader's failure is then never another request's budget
+        charged = ledger.charge(prompt)
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is None:
+                future = self._inflight[key] = Future()
+            else:
+                self.deduplicated += 1
+        if leader is not None:
+            # an identical call is already in flight; share its answer
+            response = leader.result()
+            ledger.record(PromptUsage.from_response(prompt, response), shared=True, charged=charged)
+            return response
+
+        try:
+            self._acquire(prompt.name)
+            try:
+                with tracer.span(f"llm.{prompt.name}", backend=self.backend.name) as span:
+                    response = self._with_retries(prompt, lambda: self.backend.generate(prompt, tools, tool_config, model))
+                    ledger.record(PromptUsage.from_response(prompt, response), span, charged=charged)
+            finally:
+                self._release(prompt.name)
+            self._record_fixture(prompt, key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream(self, prompt: Prompt, tools: Optional[List[dict]] = None, tool_config: Optional[dict] = None,
+               model: Optional[str] = None) -> Iterator[str]:
+        """
+        Send `prompt` and yield the answer's text as the model produces it.
+        Streams are never deduplicated; a failure is retried only before the
+        first chunk arrives.
+        """
+        model = model or self.model
+        charged = ledger.charge(prompt)
+        self._acquire(prompt.name)
+        start = time.perf_counter()
+        first_token = None
+        metadata = None
+        parts: List[str] = []
+
+        def open_stream():
+            # the request is only sent once the first chunk is read
+            chunks = iter(self.backend.stream(prompt, tools, tool_config, model))
+            first = next(chunks, None)
+            return itertools.chain([first] if first is not None else [], chunks)
+
+        try:
+            for chunk in self._with_retries(prompt, open_stream):
+                metadata = chunk.usage_metadata or metadata
+                text = chunk.text
+                if text:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(text)
+                    yield text
+        finally:
+            self._release(prompt.name)
+        if metadata is not None and metadata.prompt_token_count:
+            usage = PromptUsage(
+                prompt.name, metadata.prompt_token_count,
+                metadata.cached_content_token_count or 0, metadata.candidates_token_count or 0,
+            )
+        else:
+            usage = PromptUsage(prompt.name, prompt.estimated_tokens, 0, estimate_tokens("".join(parts)), estimated=True)
+        ledger.record(usage, charged=charged)
+        tracer.record(
+            f"llm.{prompt.name}", time.perf_counter() - start,
+            backend=self.backend.name, first_token_seconds=first_token, **usage.counts(),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "model": self.model,
+                "max_concurrency": self.max_concurrency,
+                "route_limits": dict(self.route_limits),
+                "calls": self.calls,
+                "deduplicated": self.deduplicated,
+                "retried": self.retried,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "mean_wait_seconds": self.wait_seconds / self.calls if self.calls else 0.0,
+                "by_route": dict(self.by_route),
+            }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, configured from LLM_* environment variables on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway.from_env()
+        return _gateway
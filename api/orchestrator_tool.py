@@ -1,10 +1,17 @@
+import contextvars
 import os
 import logging
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Union
-import google.generativeai as genai
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from utils.utils import get_defaults, get_valid_values, create_function_declarations
+from api.llm_gateway import LLMGateway, get_gateway
+from api.prompts import Prompt, ledger
+from api.transport import Transport, transport_from_env
+from api.planner import ToolPlanner
+from api.streaming import emit, stream_events, streaming
+from utils.tracing import tracer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,14 +20,27 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class Orchestrator:
-    def __init__(self, api_base_url="http://localhost:8000", model="gemini-2.5-flash"):
+    def __init__(self, api_base_url="http://localhost:8000", model="gemini-2.5-flash",
+                 transport: Optional[Transport] = None, gateway: Optional[LLMGateway] = None):
         load_dotenv()
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model)
+        self.model = model
+        # Shared client, concurrency limits and retries for every LLM call in the process
+        self.llm = gateway or get_gateway()
+        self.token_budget = int(os.getenv("LLM_REQUEST_TOKEN_BUDGET", "0"))
         self.api_base_url = api_base_url  # where FastAPI is running 
+        # HTTP to the API at api_base_url, or the API in this process (ORCHESTRATOR_TRANSPORT)
+        self.transport = transport or transport_from_env(api_base_url)
+        # Skip LLM round trips the first-pass results make unnecessary
+        self.adaptive = os.getenv("ORCHESTRATOR_ADAPTIVE", "1") == "1"
+        self.planner = ToolPlanner()
+        # Independent tool calls from one model turn run concurrently, each given
+        # as long as the transport allows (HTTP_TIMEOUT_ANALYZE, 60s, by default)
+        self.tool_timeout = float(
+            os.getenv("TOOL_CALL_TIMEOUT") or max(self.transport.timeout(op) for op in ("predict", "analyze"))
+        )
+        self._tool_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TOOL_CALL_CONCURRENCY", "4")), thread_name_prefix="tool-call"
+        )
 
         # Load valid values and defaults from helper functions
         self.valid_values = get_valid_values()
@@ -60,6 +80,19 @@ class Orchestrator:
         For the analysis API, pass the original user query as the parameter.
         """
 
+        self.response_instructions = """
+        Generate a helpful, natural language response to the user's query based on the context given.
+        If there are multiple results, synthesize them into a coherent answer.
+        Be specific and include numbers and data points when available.
+        """
+
+        self.follow_up_instructions = """
+        You will be given a user query and what a first pass of API calls found for it.
+        Based on the first pass, do you need additional information?
+        If yes, suggest relevant API calls (e.g., call_analysis_api or call_prediction_api).
+        If no, return the final answer directly without making further API calls.
+        """
+
     def _ensure_prediction_params(self, params: Dict) -> Dict:
         """Ensure required parameters are present and fill defaults for missing optional ones"""
         # Start with a copy of the params
@@ -77,33 +110,38 @@ class Orchestrator:
         
         return final_params
       
-    def process_query(self, user_query: str) -> dict:
+    @staticmethod
+    def _function_calls(response) -> List[dict]:
+        """Function calls requested in a model response."""
+        function_calls = []
+        if response.candidates and response.candidates[0].content.parts:
+            for part in response.candidates[0].content.parts:
+                if hasattr(part, 'function_call') and part.function_call:
+                    function_calls.append({
+                        "name": part.function_call.name,
+                        "args": dict(part.function_call.args) if part.function_call.args else {}
+                    })
+        return function_calls
+
+    @ledger.budgeted
+    def process_query(self, user_query: str, respond: bool = True) -> dict:
         """
         Process the user query using function calling to determine intent and extract parameters
+
+        With `respond=False` the tool results are returned without generating
+        a response for them ("response" is None).
         """
         try:
-            response = self.model.generate_content(
-                contents=[
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": self.system_prompt + "\n\nUser query: " + user_query}
-                        ]
-                    }
-                ],
+            response = self.llm.generate(
+                Prompt("orchestrator.route", static=self.system_prompt, dynamic="User query: " + user_query),
                 tools=[{"function_declarations": self.function_declarations}],
-                tool_config={"function_calling_config": {"mode": "any"}}
+                tool_config={"function_calling_config": {"mode": "any"}},
+                model=self.model,
             )
             
             # Extract function calls from response
-            function_calls = []
-            if response.candidates and response.candidates[0].content.parts:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'function_call') and part.function_call:
-                        function_calls.append({
-                            "name": part.function_call.name,
-                            "args": dict(part.function_call.args) if part.function_call.args else {}
-                        })
+            function_calls = self._function_calls(response)
+            emit("routing", stage=1, calls=function_calls)
             
             # If no function calls were made, return a helpful response
             if not function_calls:
@@ -112,26 +150,10 @@ class Orchestrator:
                     "sources": []
                 }
             
-            # Execute the function calls and collect results
-            results = []
-            for call in function_calls:
-                if call["name"] == "call_prediction_api":
-                    # Ensure parameters are complete with defaults
-                    final_params = self._ensure_prediction_params(call["args"])
-                    result = self._call_predict_endpoint(final_params)
-                    results.append({
-                        "type": "prediction",
-                        "data": result,
-                        "parameters": final_params,
-                        "original_parameters": call["args"]
-                    })
-                elif call["name"] == "call_analysis_api":
-                    result = self._call_analyze_endpoint(call["args"]["query"])
-                    results.append({
-                        "type": "analysis",
-                        "data": result,
-                        "parameters": call["args"]
-                    })
+            # Execute the function calls concurrently and collect results
+            results = self._execute_tool_calls(function_calls)
+            if not respond:
+                return {"response": None, "sources": results}
             
             # Generate a natural language response based on the results
             return self._generate_response(user_query, results)
@@ -143,11 +165,80 @@ class Orchestrator:
                 "sources": []
             }
     
-    def _generate_response(self, user_query: str, results: list) -> dict:
+    def _run_tool_call(self, call: dict) -> Optional[dict]:
+        """Execute one function call from the model; None for unknown functions."""
+        if call["name"] == "call_prediction_api":
+            # Ensure parameters are complete with defaults
+            final_params = self._ensure_prediction_params(call["args"])
+            result = self._call_predict_endpoint(final_params)
+            emit("prediction", predicted_price=result.get("predicted_price"), parameters=final_params)
+            return {
+                "type": "prediction",
+                "data": result,
+                "parameters": final_params,
+                "original_parameters": call["args"]
+            }
+        elif call["name"] == "call_analysis_api":
+            result = self._call_analyze_endpoint(call["args"]["query"])
+            emit("sql", sql=result.get("sql"), rows=len(result.get("results") or []), explanation=result.get("explanation"))
+            return {
+                "type": "analysis",
+                "data": result,
+                "parameters": call["args"]
+            }
+        return None
+
+    def _timed_out_result(self, call: dict) -> Optional[dict]:
+        """Result recorded for a call that did not finish within `tool_timeout`."""
+        message = f"Timed out after {self.tool_timeout}s"
+        if call["name"] == "call_prediction_api":
+            return {
+                "type": "prediction",
+                "data": {"predicted_price": None, "error": message},
+                "parameters": self._ensure_prediction_params(call["args"]),
+                "original_parameters": call["args"]
+            }
+        elif call["name"] == "call_analysis_api":
+            return {
+                "type": "analysis",
+                "data": {"sql": "", "results": [], "columns": [], "explanation": f"Error calling analyze: {message}"},
+                "parameters": call["args"]
+            }
+        return None
+
+    def _execute_tool_calls(self, function_calls: List[dict]) -> List[dict]:
         """
-        Generate a natural language response based on the API results
+        Execute independent function calls concurrently on the tool pool.
+
+        Results keep the order of `function_calls`. Each call, including a
+        lone one, gets `tool_timeout` seconds from submission; calls still
+        queued at that point are cancelled, and running ones are abandoned
+        (the transport's own timeout frees their worker) and reported as
+        timed out. Calls run in a copy of the caller's context, so
+        per-request state such as the token budget carries over.
         """
-        # Prepare context for the model
+        started = time.monotonic()
+        futures = [
+            self._tool_pool.submit(contextvars.copy_context().run, self._run_tool_call, call)
+            for call in function_calls
+        ]
+        results = []
+        for call, future in zip(function_calls, futures):
+            remaining = max(0.0, started + self.tool_timeout - time.monotonic())
+            try:
+                result = future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                future.cancel()
+                logger.error(f"{call['name']} timed out after {self.tool_timeout}s")
+                result = self._timed_out_result(call)
+            if result is not None:
+                results.append(result)
+        logger.info(f"Executed {len(function_calls)} tool calls in {time.monotonic() - started:.2f}s")
+        return results
+
+    @staticmethod
+    def _results_context(results: list) -> List[str]:
+        """Prompt lines describing the API results"""
         context_parts = []
         
         for result in results:
@@ -179,23 +270,41 @@ class Orchestrator:
                         context_parts.append(f"Sample data: {sample_data}")
                 else:
                     context_parts.append("Analysis result: No data found for the query")
+        return context_parts
+
+    def _generate_response(self, user_query: str, results: list, stream: bool = True) -> dict:
+        """
+        Generate a natural language response based on the API results
+
+        In a streamed request the response is also sent as "token" events,
+        unless `stream` is False (an intermediate answer the client should
+        not see).
+        """
+        # Prepare context for the model
+        context_parts = self._results_context(results)
         
         # Create prompt for response generation
-        prompt = f"""
-        User query: {user_query}
-        
-        Context from API calls:
-        {' '.join(context_parts)}
-        
-        Generate a helpful, natural language response to the user's query based on the context above.
-        If there are multiple results, synthesize them into a coherent answer.
-        Be specific and include numbers and data points when available.
-        """
+        prompt = Prompt(
+            "orchestrator.response",
+            static=self.response_instructions,
+            dynamic=f"User query: {user_query}\n\nContext from API calls:\n{' '.join(context_parts)}",
+        )
         
         try:
-            response = self.model.generate_content(
-                contents=[{"role": "user", "parts": [{"text": prompt}]}]
-            )
+            if stream and streaming():
+                # Same answer, sent to the client token by token as it is generated
+                chunks = []
+                for chunk in self.llm.stream(prompt, model=self.model):
+                    chunks.append(chunk)
+                    emit("token", stage="response", text=chunk)
+                if chunks:
+                    return {"response": "".join(chunks), "sources": results}
+                return {
+                    "response": "I'm sorry, I couldn't generate a response to your query.",
+                    "sources": results
+                }
+
+            response = self.llm.generate(prompt, model=self.model)
             
             if response.candidates and response.candidates[0].content.parts:
                 response_text = response.candidates[0].content.parts[0].text
@@ -218,82 +327,136 @@ class Orchestrator:
     
     def _call_predict_endpoint(self, payload: dict) -> dict:
         """Call /predict endpoint with structured payload"""
-        url = f"{self.api_base_url}/predict"
         try:
-            resp = requests.post(url, json=payload, timeout=10)
-            resp.raise_for_status()
-            return resp.json()  # {"predicted_price": ...}
+            return self.transport.predict(payload)  # {"predicted_price": ...}
         except Exception as e:
             logger.error(f"Error calling /predict: {e}")
             return {"predicted_price": None}
     
     def _call_analyze_endpoint(self, query: str) -> dict:
         """Call /analyze endpoint with query"""
-        url = f"{self.api_base_url}/analyze"
         try:
-            resp = requests.post(url, json={"query": query}, timeout=10)
-            resp.raise_for_status()
-            return resp.json()  # {sql, results, columns, explanation}
+            return self.transport.analyze(query)  # {sql, results, columns, explanation}
         except Exception as e:
             logger.error(f"Error calling /analyze: {e}")
             return {"sql": "", "results": [], "columns": [], "explanation": f"Error calling analyze: {str(e)}"}
 
+    @ledger.budgeted
     def run_two_pass(self, user_query: str) -> dict:
+        """
+        Answer a query with up to two rounds of tool calls.
+
+        Adaptive (ORCHESTRATOR_ADAPTIVE=1, the default): the first pass only
+        runs tools. If `ToolPlanner.covered` finds its results answer the
+        query, one response call follows (2 LLM calls). Otherwise a second
+        pass sees the results and may call more tools or answer directly
+        (2-3 LLM calls). Otherwise every query takes a first pass with its
+        own response plus a forced second pass (4 LLM calls).
+
+        The result carries "plan": exit path, LLM calls made in this process,
+        seconds taken and the trace ID (sent to the API server with each
+        HTTP tool call, so its spans join the same trace).
+        """
+        started = time.perf_counter()
+        request = ledger.current()
+        calls_before = request["calls"] if request else 0
+        with tracer.trace() as trace, tracer.span("orchestrator.run_two_pass") as span:
+            if self.adaptive:
+                result, path = self._run_adaptive(user_query)
+            else:
+                result, path = self._run_forced(user_query), "forced"
+            calls = (request["calls"] - calls_before) if request else 0
+            span.set(exit=path, llm_calls=calls)
+        result["plan"] = dict(self.planner.record(path, calls, time.perf_counter() - started), trace_id=trace.trace_id)
+        logger.info(f"run_two_pass: {result['plan']}")
+        return result
+
+    def stream_two_pass(self, user_query: str) -> Iterator[dict]:
+        """
+        `run_two_pass` as a stream of events:
+
+            routing     tools chosen by the model (stage 1 / 2)
+            prediction  a /predict result
+            sql         the SQL an /analyze call ran, with its row count
+            plan        whether the first pass covered the query
+            token       a piece of the answer, as the model produces it
+            done        the full response, plan and stream timings (or "error")
+        """
+        def run() -> dict:
+            result = self.run_two_pass(user_query)
+            return {"response": result["response"], "plan": result.get("plan")}
+        return stream_events(run)
+
+    def _follow_up(self, user_query: str, first_pass: str, mode: str) -> object:
+        prompt = Prompt(
+            "orchestrator.follow_up",
+            static=self.follow_up_instructions,
+            dynamic=f"User query: {user_query}\n\nFirst-pass response: {first_pass}",
+        )
+        return self.llm.generate(
+            prompt,
+            tools=[{"function_declarations": self.function_declarations}],
+            tool_config={"function_calling_config": {"mode": mode}},
+            model=self.model,
+        )
+
+    def _run_adaptive(self, user_query: str) -> Tuple[dict, str]:
+        # ---------- Pass 1: tools only ----------
+        result1 = self.process_query(user_query, respond=False)
+        sources1 = result1.get("sources", [])
+        covered, reason = self.planner.covered(user_query, sources1)
+        emit("plan", covered=covered, reason=reason)
+        if covered:
+            return self._generate_response(user_query, sources1), "covered"
+        logger.info(f"First pass does not cover the query ({reason}); running a second pass")
+        if reason == "ungrounded_town":
+            # predicted in the same turn as the analysis naming the town, so the town was a guess
+            sources1 = [r for r in sources1 if r["type"] != "prediction"]
+
+        # ---------- Pass 2: more tools only if the model asks for them ----------
+        first_pass = result1["response"] or " ".join(self._results_context(sources1)) or "No API results."
+        try:
+            second_response = self._follow_up(user_query, first_pass, mode="auto")
+            function_calls = self._function_calls(second_response)
+            emit("routing", stage=2, calls=function_calls)
+            if not function_calls:
+                parts = second_response.candidates[0].content.parts if second_response.candidates else []
+                text = "".join(getattr(part, "text", "") or "" for part in parts).strip()
+                if text:
+                    emit("token", stage="response", text=text)
+                    return {"response": text, "sources": sources1}, "no_more_tools"
+                return self._generate_response(user_query, sources1), "no_more_tools"
+            results2 = self._execute_tool_calls(function_calls)
+            return self._generate_response(user_query, sources1 + results2), "second_pass"
+        except Exception as e:
+            logger.error(f"Error during second pass: {e}")
+            return {
+                "response": f"An error occurred during the second pass: {str(e)}",
+                "sources": sources1
+            }, "error"
+
+    def _run_forced(self, user_query: str) -> dict:
         # ---------- Pass 1 ----------
-        result1 = self.process_query(user_query)
+        result1 = self.process_query(user_query, respond=False)
         sources1 = result1.get("sources", [])
+        if result1["response"] is None:
+            # this answer only feeds the follow-up, so only the final one is streamed
+            result1 = self._generate_response(user_query, sources1, stream=False)
 
         # ---------- Pass 2 ----------
         # Get the raw response text from the first pass
         first_response_text = result1["response"]
 
-        # Prompt the model again with the first result and ask if more info is needed
-        prompt = f"""
-        User query: {user_query}
-
-        First-pass response: {first_response_text}
-
-        Based on the initial response, do you need additional information?
-        If yes, suggest relevant API calls (e.g., call_analysis_api or call_prediction_api).
-        If no, return the final answer directly without making further API calls.
-        """
-
         try:
-            second_response = self.model.generate_content(
-                contents=[{"role": "user", "parts": [{"text": prompt}]}],
-                tools=[{"function_declarations": self.function_declarations}],
-                tool_config={"function_calling_config": {"mode": "any"}}
-            )
+            # Prompt the model again with the first result and ask if more info is needed
+            second_response = self._follow_up(user_query, first_response_text, mode="any")
 
             # Extract function calls from the second response
-            function_calls = []
-            if second_response.candidates and second_response.candidates[0].content.parts:
-                for part in second_response.candidates[0].content.parts:
-                    if hasattr(part, 'function_call') and part.function_call:
-                        function_calls.append({
-                            "name": part.function_call.name,
-                            "args": dict(part.function_call.args) if part.function_call.args else {}
-                        })
+            function_calls = self._function_calls(second_response)
+            emit("routing", stage=2, calls=function_calls)
 
             # Execute any function calls made in the second pass
-            results2 = []
-            for call in function_calls:
-                if call["name"] == "call_prediction_api":
-                    final_params = self._ensure_prediction_params(call["args"])
-                    result = self._call_predict_endpoint(final_params)
-                    results2.append({
-                        "type": "prediction",
-                        "data": result,
-                        "parameters": final_params,
-                        "original_parameters": call["args"]
-                    })
-                elif call["name"] == "call_analysis_api":
-                    result = self._call_analyze_endpoint(call["args"]["query"])
-                    results2.append({
-                        "type": "analysis",
-                        "data": result,
-                        "parameters": call["args"]
-                    })
+            results2 = self._execute_tool_calls(function_calls)
 
             # Combine all results
             all_results = sources1 + results2
@@ -0,0 +1,127 @@
+import re
+import statistics
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from api.sql_cache import SemanticSQLCache
+
+# Wording that asks for a price estimate (a prediction call)
+PREDICTION_INTENT = re.compile(r"\b(predict\w*|recommend\w*|estimat\w*|worth|how\s+much|valu(?:e|ation))\b")
+# Wording that asks for historical data (an analysis call)
+ANALYSIS_INTENT = re.compile(
+    r"\b(trend\w*|histor\w*|compar\w*|versus|vs|least|fewest|most|highest|lowest|cheapest|average|"
+    r"over\s+time|past|last|since|launch\w*|which\s+(?:estate|town)s?)\b"
+)
+# A prediction whose town depends on an earlier answer ("for this estate, recommend ...")
+REFERENCE = re.compile(r"\b(?:this|that|the\s+same|these|those)\s+(?:estate|town|area)s?\b")
+
+# Per-query records kept for percentiles
+HISTORY_SIZE = 1000
+
+
+class ToolPlanner:
+    """
+    Decides locally whether first-pass tool results already answer a query.
+
+    `covered` checks the results against what the query asks for: a
+    prediction when it asks for a price estimate, an analysis when it asks
+    for historical data, every named town and flat type present, no failed
+    call, and every predicted town either named in the query or taken from
+    an analysis result (a prediction made in the same turn as the analysis
+    it depends on guessed its town). When it returns False a second pass
+    is needed; the reason names the first check that failed.
+
+    Also keeps per-query LLM call counts, latency and exit path, recorded
+    by `Orchestrator.run_two_pass`.
+    """
+
+    def __init__(self, entities=None):
+        """
+        Args:
+            entities: Entity extractor (default a fresh `SemanticSQLCache().extract_entities`)
+        """
+        self.entities = entities or SemanticSQLCache().extract_entities
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.llm_calls = 0
+        self.exits: Dict[str, int] = {}
+        self._history: deque = deque(maxlen=HISTORY_SIZE)
+
+    @staticmethod
+    def failed(result: dict) -> bool:
+        """Whether a tool call came back without a prediction or any rows."""
+        data = result.get("data") or {}
+        if result["type"] == "prediction":
+            return data.get("predicted_price") is None
+        return not data.get("results")
+
+    @staticmethod
+    def _answer_towns(analyses: List[dict]) -> set:
+        """Text values in the first rows of the analysis results."""
+        towns = set()
+        for result in analyses:
+            for row in (result["data"].get("results") or [])[:5]:
+                towns.update(str(v).strip().lower() for v in row if isinstance(v, str))
+        return towns
+
+    def covered(self, query: str, results: List[dict]) -> Tuple[bool, str]:
+        """(True, "covered") if `results` answer `query`, else (False, reason)."""
+        if not results:
+            return False, "no_results"
+        if any(self.failed(r) for r in results):
+            return False, "failed_call"
+
+        text = query.lower()
+        predictions = [r for r in results if r["type"] == "prediction"]
+        analyses = [r for r in results if r["type"] == "analysis"]
+        if PREDICTION_INTENT.search(text) and not predictions:
+            return False, "missing_prediction"
+        if ANALYSIS_INTENT.search(text) and not analyses:
+            return False, "missing_analysis"
+
+        entities = self.entities(query)
+        predicted_towns = {str(r["parameters"].get("town", "")).lower() for r in predictions}
+        analysed = " ".join(str(r["data"].get("sql", "")).lower() for r in analyses)
+        for town in entities.towns:
+            if town not in predicted_towns and town not in analysed:
+                return False, "missing_town"
+        if entities.flat_types and predictions:
+            if not {str(r["parameters"].get("flat_type", "")).lower() for r in predictions} & entities.flat_types:
+                return False, "missing_flat_type"
+
+        if predictions and (REFERENCE.search(text) or not entities.towns):
+            if analyses and not predicted_towns <= set(entities.towns) | self._answer_towns(analyses):
+                return False, "ungrounded_town"
+            if not analyses and REFERENCE.search(text):
+                return False, "unresolved_reference"
+        return True, "covered"
+
+    # ---------- metrics ----------
+    def record(self, path: str, llm_calls: int, seconds: float) -> Dict[str, Any]:
+        """Account for one query; returns its record."""
+        plan = {"exit": path, "llm_calls": llm_calls, "seconds": round(seconds, 4)}
+        with self._lock:
+            self.queries += 1
+            self.llm_calls += llm_calls
+            self.exits[path] = self.exits.get(path, 0) + 1
+            self._history.append((llm_calls, seconds))
+        return plan
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            seconds = sorted(s for _, s in self._history)
+            calls = [c for c, _ in self._history]
+
+        def percentile(q: float) -> Optional[float]:
+            return seconds[min(len(seconds) - 1, int(q * len(seconds)))] if seconds else None
+
+        return {
+            "queries": self.queries,
+            "llm_calls": self.llm_calls,
+            "llm_calls_per_query": self.llm_calls / self.queries if self.queries else 0.0,
+            "max_llm_calls": max(calls) if calls else 0,
+            "exits": dict(self.exits),
+            "p50_seconds": percentile(0.5),
+            "p95_seconds": percentile(0.95),
+            "mean_seconds": statistics.fmean(seconds) if seconds else None,
+        }
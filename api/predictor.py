@@ -1,15 +1,62 @@
-import requests, os
+import os
 from dotenv import load_dotenv
+from api.http_client import get_http_client
 
 class Predictor:
     def __init__(self, url: str = None):
-        load_dotenv
+        load_dotenv()
         self.url = url or os.getenv("PREDICTOR_URL")
+        self.http = get_http_client()
 
     def predict(self, payload: dict) -> dict:
         try:
-            resp = requests.post(self.url, json=payload, timeout=10)
-            resp.raise_for_status()
+            resp = self.http.post(self.url, json=payload, endpoint="predict", idempotent=True)
+            return resp.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def predict_batch(self, payloads, columnar: bool = False) -> dict:
+        """
+        Price many flats in one request via /predict/batch.
+
+        Args:
+            payloads: List of payload dicts, or a dict of equal-length lists
+            columnar: Whether `payloads` is already in columnar form
+
+        Returns:
+            {"predicted_prices": [...]} in input order, or {"error": ...}
+        """
+        body = {"columns": payloads} if columnar else {"rows": payloads}
+        try:
+            resp = self.http.post(f"{self.url.rstrip('/')}/batch", json=body, endpoint="predict_batch", idempotent=True)
+            return resp.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def sweep(self, base: dict, axes: list) -> dict:
+        """
+        Price a grid of variants of one flat via /predict/sweep.
+
+        Args:
+            base: Prediction payload for the flat
+            axes: Axis specs, e.g. [{"field": "storey_range"},
+                  {"field": "month", "start": "2025-01", "stop": "2026-12"}]
+
+        Returns:
+            {"columns": [...], "rows": [[...axis values, price], ...]}, or {"error": ...}
+        """
+        try:
+            resp = self.http.post(
+                f"{self.url.rstrip('/')}/sweep", json={"base": base, "axes": axes}, endpoint="predict_sweep", idempotent=True
+            )
+            return resp.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def apredict(self, payload: dict) -> dict:
+        """Async `predict` on the shared client's pooled `httpx.AsyncClient`."""
+        try:
+            resp = await self.http.apost(self.url, json=payload, endpoint="predict", idempotent=True)
             return resp.json()
         except Exception as e:
             return {"error": str(e)}
@@ -0,0 +1,224 @@
+import contextvars
+import functools
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+from api.digest import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# Market background shared by every prompt; kept in one place so all of them
+# share one cacheable prefix instead of three slightly different copies.
+BACKGROUND = """You are a housing market intelligence assistant designed to support analysis of BTO (Build-To-Order) pricing in Singapore, leveraging trends from HDB resale transactions. Provide explanations and predictions for BTO prices based on past resale data and contextual factors.
+1. **Pricing Framework**
+- BTO flat prices are informed by nearby resale flat transactions: HDB benchmarks BTO “market value” by comparing transacted resale flat prices in the vicinity
+
+2. **Trends in BTO–Resale Price Gaps**
+- In **mature estates**, resale prices have risen faster than BTO prices
+- In **non-mature estates**, BTO price growth sometimes outpaces resale growth
+
+3. **Other Market Influences**
+- BTO supply levels significantly affect resale demand and prices. Over-supply of BTO units historically led to resale price stagnation, while undersupply—or demand exceeding supply—increases pressure on resale prices
+- Micro-level price drivers include: location/town attributes, estate maturity, flat type and size, remaining lease, floor level, and time of year. Empirical analyses confirm that higher floors, central/mature locations, larger flat sizes, newer builds (longer leases) command higher resale prices
+"""
+
+SCHEMA = """Schema
+------
+bto_prices(
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    financial_year TEXT,
+    room_type TEXT,
+    town TEXT,
+    min_selling_price REAL,
+    max_selling_price REAL,
+    min_selling_price_less_ahg_shg REAL,
+    max_selling_price_less_ahg_shg REAL
+)
+
+resale_prices (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    month TEXT,
+    town TEXT,
+    flat_type TEXT,
+    flat_model TEXT,
+    block TEXT,
+    street_name TEXT,
+    storey_range TEXT,
+    floor_area_sqm REAL,
+    lease_commence_date TEXT,
+    resale_price REAL
+)
+"""
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A prompt split into a static prefix, identical across calls and sent as
+    the system instruction (or provider cache), and the per-call suffix.
+    """
+    name: str
+    static: str
+    dynamic: str
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(self.static.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.static) + estimate_tokens(self.dynamic)
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised before an LLM call that would take a request past its token budget."""
+
+
+@dataclass
+class PromptUsage:
+    """Tokens of one LLM call, from the provider's usage metadata when available."""
+    name: str
+    prompt_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    estimated: bool = False
+
+    def counts(self) -> Dict[str, int]:
+        return {"prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens, "output_tokens": self.output_tokens}
+
+    @classmethod
+    def from_response(cls, prompt: Prompt, response: Any) -> "PromptUsage":
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None or not getattr(usage, "prompt_token_count", None):
+            text = getattr(response, "text", "") or ""
+            return cls(prompt.name, prompt.estimated_tokens, 0, estimate_tokens(text), estimated=True)
+        return cls(
+            prompt.name,
+            int(usage.prompt_token_count or 0),
+            int(getattr(usage, "cached_content_token_count", 0) or 0),
+            int(getattr(usage, "candidates_token_count", 0) or 0),
+        )
+
+
+class TokenLedger:
+    """
+    Per-prompt token totals for the process, plus optional per-request budgets.
+
+    Inside `with ledger.request(budget):` every `charge` adds a call's
+    estimated prompt tokens to the request's running total (then corrected
+    by `record`, given the estimate `charge` returned, to the provider's
+    count) and raises `TokenBudgetExceeded`
+    before a call that would overshoot. Requests are tracked per context,
+    so concurrent requests in threads or tasks have separate totals.
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._request: contextvars.ContextVar = contextvars.ContextVar("token_request", default=None)
+
+    @contextmanager
+    def request(self, budget: Optional[int] = None) -> Iterator[Dict[str, int]]:
+        """Track one request's tokens; nested calls join the outer request."""
+        if self._request.get() is not None:
+            yield self._request.get()
+            return
+        state = {"budget": budget or 0, "tokens": 0, "calls": 0}
+        token = self._request.set(state)
+        try:
+            yield state
+        finally:
+            self._request.reset(token)
+
+    def current(self) -> Optional[Dict[str, int]]:
+        """The running totals (`tokens`, `calls`) of the request in this context, if any."""
+        return self._request.get()
+
+    def budgeted(self, method: Callable) -> Callable:
+        """Decorator running a method inside `request(self.token_budget)` of its owner."""
+        @functools.wraps(method)
+        def wrapper(owner, *args, **kwargs):
+            with self.request(getattr(owner, "token_budget", 0)):
+                return method(owner, *args, **kwargs)
+        return wrapper
+
+    def charge(self, prompt: Prompt) -> int:
+        """
+        Check a call against the current request's budget before sending it.
+
+        Returns:
+            The estimate charged, to pass to `record` once the call finishes
+            (0 outside a request)
+
+        Raises:
+            TokenBudgetExceeded: If the estimated prompt would exceed the budget
+        """
+        state = self._request.get()
+        if state is None:
+            return 0
+        estimate = prompt.estimated_tokens
+        # one request's calls may run in several threads (tool calls, shared LLM calls)
+        with self._lock:
+            if state["budget"] and state["tokens"] + estimate > state["budget"]:
+                raise TokenBudgetExceeded(
+                    f"{prompt.name} needs ~{estimate} tokens; request has used "
+                    f"{state['tokens']} of its {state['budget']} token budget"
+                )
+            state["tokens"] += estimate
+            state["calls"] += 1
+        return estimate
+
+    def record(self, usage: PromptUsage, span: Any = None, shared: bool = False, charged: int = 0) -> None:
+        """
+        Add a finished call's tokens to the totals (and to its trace span, if given).
+
+        `charged` is what `charge` returned for the call; the request's
+        running total swaps it for the actual count. A `shared` call got the
+        response of an identical call already in flight: it counts in full
+        against the current request, but the provider only served it once,
+        so the process totals just count it under `shared_calls`.
+        """
+        if span is not None:
+            span.set(**usage.counts())
+        state = self._request.get()
+        if state is not None:
+            with self._lock:
+                state["tokens"] += usage.prompt_tokens + usage.output_tokens - charged
+        with self._lock:
+            totals = self._totals.setdefault(
+                usage.name,
+                {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "estimated_calls": 0, "shared_calls": 0},
+            )
+            if shared:
+                totals["shared_calls"] += 1
+                return
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["cached_tokens"] += usage.cached_tokens
+            totals["output_tokens"] += usage.output_tokens
+            totals["estimated_calls"] += int(usage.estimated)
+        logger.info(
+            f"LLM call {usage.name}: {usage.prompt_tokens} prompt tokens "
+            f"({usage.cached_tokens} cached), {usage.output_tokens} output tokens"
+            + (" (estimated)" if usage.estimated else "")
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {}
+            for name, totals in self._totals.items():
+                calls = totals["calls"] or 1
+                out[name] = dict(
+                    totals,
+                    mean_prompt_tokens=totals["prompt_tokens"] / calls,
+                    cached_share=totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0,
+                )
+            return out
+
+
+# Shared by every prompt user in the process
+ledger = TokenLedger()
@@ -0,0 +1,138 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def canonical_sql(sql: str) -> str:
+    """
+    Canonical text of a statement for cache keys.
+
+    Whitespace is collapsed, trailing semicolons dropped and everything
+    outside string literals lower-cased (SQLite keywords and identifiers are
+    case-insensitive; literal values are not).
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(";").strip())
+    out = []
+    for i, part in enumerate(parts):
+        out.append(part if i % 2 else " ".join(part.split()).lower())
+    return "".join(out)
+
+
+def database_version(db_path: str) -> Tuple[int, ...]:
+    """
+    Version stamp of a SQLite database that changes whenever rows are written.
+
+    Uses (mtime_ns, size) of the database file and of its WAL file if one
+    exists, so writes from any process (e.g. the ingestion notebook) are seen
+    without a shared counter.
+    """
+    stamp: Tuple[int, ...] = ()
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stamp += (stat.st_mtime_ns, stat.st_size)
+    return stamp
+
+
+def estimate_bytes(results: List[tuple], columns: List[str]) -> int:
+    """Approximate memory held by a result set."""
+    total = sys.getsizeof(results) + sum(sys.getsizeof(c) for c in columns)
+    for row in results:
+        total += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return total
+
+
+class ResultCache:
+    """
+    Thread-safe cache of SQL result sets, bounded by bytes rather than entries.
+
+    Keys are canonicalized SQL; every entry carries the database version it
+    was read at, and a lookup under a newer version drops the whole cache.
+    Result sets larger than `max_entry_bytes` are never cached, so one huge
+    query cannot flush everything else out.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: Optional[int] = None):
+        """
+        Args:
+            max_bytes: Total approximate bytes of cached results
+            max_entry_bytes: Largest single result set to cache (default max_bytes / 8)
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self._entries: "OrderedDict[str, Tuple[List[tuple], List[str], int]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Any = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def _check_version(self, version: Any) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, sql: str, version: Any) -> Optional[Tuple[List[tuple], List[str]]]:
+        """Return (results, columns) for `sql` read at `version`, or None."""
+        key = canonical_sql(sql)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, sql: str, version: Any, results: List[tuple], columns: List[str]) -> bool:
+        """
+        Cache a result set.
+
+        Returns:
+            False if the result set was too large to cache
+        """
+        size = estimate_bytes(results, columns)
+        key = canonical_sql(sql)
+        with self._lock:
+            self._check_version(version)
+            if size > self.max_entry_bytes:
+                self.rejected += 1
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (results, columns, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rejected": self.rejected,
+            }
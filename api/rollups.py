@@ -0,0 +1,335 @@
+import argparse
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from api.result_cache import database_version
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """
+    A summary table maintained from one source table.
+
+    `select_sql` computes summary rows for the source rows matched by
+    `{scope}` (a WHERE clause, empty for a full build). `rewrites` maps a
+    source aggregate (regex, case-insensitive) to the equivalent expression
+    over the summary table; only those aggregates and the `dimensions` may
+    appear in a statement routed to the rollup.
+    """
+    name: str
+    source: str
+    dimensions: Tuple[str, ...]
+    ddl: str
+    select_sql: str
+    rewrites: Dict[str, str] = field(default_factory=dict)
+    description: str = ""
+
+
+RESALE_MONTHLY = Rollup(
+    name="resale_monthly_summary",
+    source="resale_prices",
+    dimensions=("month", "town", "flat_type"),
+    ddl="""
+    CREATE TABLE IF NOT EXISTS resale_monthly_summary (
+        month TEXT,
+        town TEXT,
+        flat_type TEXT,
+        txn_count INTEGER,
+        sum_price REAL,
+        avg_price REAL,
+        min_price REAL,
+        max_price REAL,
+        median_price REAL,
+        sum_floor_area_sqm REAL,
+        avg_floor_area_sqm REAL,
+        PRIMARY KEY (month, town, flat_type)
+    )""",
+    select_sql="""
+    WITH scoped AS (
+        SELECT month, town, flat_type, resale_price, floor_area_sqm FROM resale_prices {scope}
+    ),
+    ranked AS (
+        SELECT month, town, flat_type, resale_price,
+               ROW_NUMBER() OVER (PARTITION BY month, town, flat_type ORDER BY resale_price) AS rn,
+               COUNT(*) OVER (PARTITION BY month, town, flat_type) AS cnt
+        FROM scoped
+    ),
+    medians AS (
+        SELECT month, town, flat_type, AVG(resale_price) AS median_price
+        FROM ranked
+        WHERE rn IN ((cnt + 1) / 2, (cnt + 2) / 2)
+        GROUP BY month, town, flat_type
+    )
+    SELECT s.month, s.town, s.flat_type,
+           COUNT(*), SUM(s.resale_price), AVG(s.resale_price), MIN(s.resale_price), MAX(s.resale_price),
+           m.median_price, SUM(s.floor_area_sqm), AVG(s.floor_area_sqm)
+    FROM scoped s
+    JOIN medians m ON m.month IS s.month AND m.town IS s.town AND m.flat_type IS s.flat_type
+    GROUP BY s.month, s.town, s.flat_type""",
+    rewrites={
+        r"count\(\s*\*\s*\)": "SUM(txn_count)",
+        r"sum\(\s*resale_price\s*\)": "SUM(sum_price)",
+        r"avg\(\s*resale_price\s*\)": "(SUM(sum_price) * 1.0 / SUM(txn_count))",
+        r"min\(\s*resale_price\s*\)": "MIN(min_price)",
+        r"max\(\s*resale_price\s*\)": "MAX(max_price)",
+        r"avg\(\s*floor_area_sqm\s*\)": "(SUM(sum_floor_area_sqm) * 1.0 / SUM(txn_count))",
+    },
+    description="Resale transactions pre-aggregated per month x town x flat_type "
+                "(txn_count, sum/avg/min/max/median price, sum/avg floor area).",
+)
+
+BTO_LAUNCHES = Rollup(
+    name="bto_launch_summary",
+    source="bto_prices",
+    dimensions=("financial_year", "town", "room_type"),
+    ddl="""
+    CREATE TABLE IF NOT EXISTS bto_launch_summary (
+        financial_year TEXT,
+        town TEXT,
+        room_type TEXT,
+        launch_count INTEGER,
+        sum_min_selling_price REAL,
+        sum_max_selling_price REAL,
+        min_selling_price REAL,
+        max_selling_price REAL,
+        PRIMARY KEY (financial_year, town, room_type)
+    )""",
+    select_sql="""
+    SELECT financial_year, town, room_type,
+           COUNT(*), SUM(min_selling_price), SUM(max_selling_price),
+           MIN(min_selling_price), MAX(max_selling_price)
+    FROM bto_prices {scope}
+    GROUP BY financial_year, town, room_type""",
+    rewrites={
+        r"count\(\s*\*\s*\)": "SUM(launch_count)",
+        r"avg\(\s*min_selling_price\s*\)": "(SUM(sum_min_selling_price) * 1.0 / SUM(launch_count))",
+        r"avg\(\s*max_selling_price\s*\)": "(SUM(sum_max_selling_price) * 1.0 / SUM(launch_count))",
+        r"min\(\s*min_selling_price\s*\)": "MIN(min_selling_price)",
+        r"max\(\s*max_selling_price\s*\)": "MAX(max_selling_price)",
+    },
+    description="BTO launches per financial_year x town x room_type "
+                "(launch_count, sum/min/max of min and max selling prices).",
+)
+
+ROLLUPS = [RESALE_MONTHLY, BTO_LAUNCHES]
+
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    rollup TEXT PRIMARY KEY,
+    source_max_id INTEGER,
+    refreshed_at REAL
+)"""
+
+
+def refresh_rollups(db_path: str, full: bool = False, rollups: List[Rollup] = ROLLUPS) -> Dict[str, int]:
+    """
+    Build or incrementally refresh the summary tables. Run after each ingest.
+
+    Incremental refresh recomputes only the groups touched by source rows
+    with `_id` above the stored watermark. Updates or deletes of existing
+    source rows are not tracked; use `full=True` after those.
+
+    Args:
+        db_path: Path to the SQLite database
+        full: Rebuild every summary table from scratch
+        rollups: Rollups to maintain
+
+    Returns:
+        Number of summary groups (re)written per rollup
+    """
+    written = {}
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(STATE_DDL)
+        for rollup in rollups:
+            conn.execute(rollup.ddl)
+            max_id = conn.execute(f"SELECT COALESCE(MAX(_id), 0) FROM {rollup.source}").fetchone()[0]
+            state = conn.execute("SELECT source_max_id FROM rollup_state WHERE rollup = ?", (rollup.name,)).fetchone()
+            # NULL is a group of its own, so keys are compared NULL-safely
+            keys = ", ".join(f"COALESCE({d}, '')" for d in rollup.dimensions)
+            matches = " AND ".join(f"{d} IS ?" for d in rollup.dimensions)
+
+            if full or state is None:
+                conn.execute(f"DELETE FROM {rollup.name}")
+                rows = conn.execute(rollup.select_sql.format(scope="")).fetchall()
+            elif max_id > state[0]:
+                scope = f"WHERE ({keys}) IN (SELECT {keys} FROM {rollup.source} WHERE _id > {int(state[0])})"
+                rows = conn.execute(rollup.select_sql.format(scope=scope)).fetchall()
+                conn.executemany(
+                    f"DELETE FROM {rollup.name} WHERE {matches}",
+                    [row[:len(rollup.dimensions)] for row in rows],
+                )
+            else:
+                rows = []
+
+            if rows:
+                width = len(rows[0])
+                conn.executemany(
+                    f"INSERT INTO {rollup.name} VALUES ({', '.join('?' for _ in range(width))})", rows
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_state (rollup, source_max_id, refreshed_at) VALUES (?, ?, ?)",
+                (rollup.name, max_id, time.time()),
+            )
+            written[rollup.name] = len(rows)
+    return written
+
+
+class RollupRouter:
+    """
+    Rewrites eligible aggregate SQL over a source table to its summary table.
+
+    A statement is eligible when it is a single SELECT (no joins, unions,
+    CTEs, subqueries or window functions) from exactly one rollup's source
+    table without an alias, aggregates (an aggregate function, GROUP BY or
+    SELECT DISTINCT), and references only that rollup's dimensions plus
+    aggregates listed in its `rewrites`. Unaliased rewritten select
+    items keep their original column names. Routing is skipped while a
+    summary table is behind its source (rows above the watermark).
+    """
+
+    def __init__(self, connection: Callable, db_path: str, rollups: List[Rollup] = ROLLUPS):
+        """
+        Args:
+            connection: Context manager factory yielding a SQLite connection
+                (e.g. `ConnectionPool.connection`)
+            db_path: Path to the database, for freshness checks
+            rollups: Rollups to route to
+        """
+        self.connection = connection
+        self.db_path = db_path
+        self.rollups = rollups
+        self._fresh: Dict[str, bool] = {}
+        self._fresh_version = None
+        self.routed = 0
+        self.checked = 0
+
+    def available(self) -> List[Rollup]:
+        """Rollups whose summary tables are present and up to date."""
+        version = database_version(self.db_path)
+        if version != self._fresh_version:
+            fresh = {}
+            with self.connection() as conn:
+                tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                for rollup in self.rollups:
+                    if rollup.name not in tables or "rollup_state" not in tables:
+                        fresh[rollup.name] = False
+                        continue
+                    state = conn.execute("SELECT source_max_id FROM rollup_state WHERE rollup = ?", (rollup.name,)).fetchone()
+                    max_id = conn.execute(f"SELECT COALESCE(MAX(_id), 0) FROM {rollup.source}").fetchone()[0]
+                    fresh[rollup.name] = state is not None and state[0] >= max_id
+            self._fresh, self._fresh_version = fresh, version
+        return [r for r in self.rollups if self._fresh.get(r.name)]
+
+    def schema_prompt(self) -> str:
+        """Summary-table section for the SQL generation prompt ('' if none are available)."""
+        rollups = self.available()
+        if not rollups:
+            return ""
+        parts = ["Pre-aggregated summary tables (prefer these for aggregates; they are much faster)"]
+        for rollup in rollups:
+            ddl = re.sub(r"CREATE TABLE IF NOT EXISTS ", "", rollup.ddl.strip())
+            parts.append(f"-- {rollup.description}\n    {ddl}")
+        return "\n    ".join(parts)
+
+    @staticmethod
+    def _split_top_level(text: str) -> List[str]:
+        items, depth, start = [], 0, 0
+        for i, ch in enumerate(text):
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+            elif ch == "," and depth == 0:
+                items.append(text[start:i])
+                start = i + 1
+        items.append(text[start:])
+        return items
+
+    def _eligible(self, sql: str, rollup: Rollup) -> bool:
+        masked = re.sub(r"'(?:[^']|'')*'", "''", sql).lower()
+        if re.search(r"\b(join|union|intersect|except|with|over|window)\b", masked):
+            return False
+        if len(re.findall(r"\bselect\b", masked)) != 1 or len(re.findall(r"\bfrom\b", masked)) != 1:
+            return False
+        if not re.search(rf"\bfrom\s+{rollup.source}\s*(?:$|;|\bwhere\b|\bgroup\b|\border\b|\blimit\b)", masked):
+            return False
+        if re.search(r"\bselect\s+(distinct\s+)?\*|\.\*", masked):
+            return False
+        # the summary holds one row per group: a plain SELECT would get groups instead of source rows
+        if not re.search(r"\bgroup\s+by\b|\bselect\s+distinct\b|\b(count|sum|avg|min|max|total)\s*\(", masked):
+            return False
+
+        rest = masked
+        for pattern in rollup.rewrites:
+            rest = re.sub(pattern, " ", rest)
+        dims = "|".join(rollup.dimensions)
+        rest = re.sub(rf"count\(\s*distinct\s+(?:{dims})\s*\)", " ", rest)
+        if re.search(r"\b(count|sum|avg|total|group_concat)\s*\(", rest):
+            return False
+
+        with self.connection() as conn:
+            columns = [r[1] for r in conn.execute(f"PRAGMA table_info({rollup.source})")]
+        other = [c for c in columns if c not in rollup.dimensions]
+        return not any(re.search(rf"\b{re.escape(c)}\b", rest) for c in other)
+
+    def _apply(self, sql: str, rollup: Rollup) -> str:
+        def rewrite(text: str) -> str:
+            for pattern, replacement in rollup.rewrites.items():
+                text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+            return text
+
+        match = re.search(r"\bselect\b(.*?)\bfrom\b", sql, flags=re.IGNORECASE | re.DOTALL)
+        items = []
+        for item in self._split_top_level(match.group(1)):
+            new = rewrite(item)
+            stripped = item.strip()
+            if new != item and stripped.endswith(")") and not re.search(r"\bas\b", stripped, re.IGNORECASE):
+                name = stripped.replace('"', '""')
+                new = f'{new.rstrip()} AS "{name}"'
+            items.append(new)
+        head = sql[:match.start(1)] + ",".join(items)
+        if not head[-1].isspace():
+            head += " "
+        tail = rewrite(sql[match.end(1):])
+        tail = re.sub(rf"\b{rollup.source}\b", rollup.name, tail, count=1)
+        return head + tail
+
+    def rewrite(self, sql: str) -> Optional[str]:
+        """
+        Rewrite `sql` against a summary table if it is eligible.
+
+        Returns:
+            The rewritten SQL, or None if the statement must run as is
+        """
+        self.checked += 1
+        for rollup in self.available():
+            if self._eligible(sql, rollup):
+                self.routed += 1
+                return self._apply(sql, rollup)
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "checked": self.checked,
+            "routed": self.routed,
+            "available": [r.name for r in self.available()],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the pre-aggregated summary tables.")
+    parser.add_argument("--db", default="data/hdb_prices.db", help="SQLite database")
+    parser.add_argument("--full", action="store_true", help="rebuild from scratch instead of incrementally")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = refresh_rollups(args.db, full=args.full)
+    for name, count in written.items():
+        print(f"{name}: {count} groups written")
+    print(f"done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional
+from utils.utils import get_valid_values
+
+
+# Words that carry no meaning for matching questions to SQL
+STOPWORDS = {
+    "a", "an", "the", "in", "of", "for", "to", "on", "at", "with", "and", "or",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "had", "has", "have",
+    "what", "which", "who", "how", "show", "me", "list", "give", "tell", "please", "find",
+    "there", "that", "this", "these", "those", "i", "we", "you", "my", "our", "can", "could",
+    "would", "should", "any", "all", "over", "from", "than", "it", "its", "as",
+}
+
+# Paraphrases mapped onto one canonical token
+SYNONYMS = {
+    "estate": "town", "estates": "town", "towns": "town",
+    "least": "min", "fewest": "min", "lowest": "min", "smallest": "min", "minimum": "min",
+    "cheapest": "min", "limited": "min", "fewer": "min",
+    "most": "max", "highest": "max", "largest": "max", "maximum": "max", "priciest": "max",
+    "greatest": "max", "more": "max",
+    "average": "avg", "mean": "avg", "typical": "avg",
+    "past": "last", "previous": "last", "recent": "last",
+    "launches": "launch", "launched": "launch", "projects": "launch", "supply": "launch",
+    "flats": "flat", "homes": "flat", "units": "flat", "apartments": "flat",
+    "prices": "price", "cost": "price", "costs": "price", "priced": "price",
+    "years": "year", "yrs": "year", "yr": "year",
+    "trends": "trend", "trending": "trend", "changed": "trend", "over_time": "trend",
+    "compare": "compare", "versus": "compare", "vs": "compare", "comparison": "compare",
+    "resale": "resale", "hdb": "resale", "btos": "bto",
+}
+
+# Aggregate a question asks for; the first pattern that matches wins, so
+# "total number of ..." is a count and "average number of ..." an average
+AGGREGATES = [
+    ("median", re.compile(r"\bmedian\b")),
+    ("avg", re.compile(r"\b(?:average|mean|avg|typical)\b")),
+    ("count", re.compile(r"\b(?:how\s+many|number\s+of|count)\b")),
+    ("sum", re.compile(r"\b(?:total|sum)\b")),
+    ("min", re.compile(r"\b(?:minimum|min|lowest|cheapest)\s+(?:\w+\s+)?price")),
+    ("max", re.compile(r"\b(?:maximum|max|highest|priciest|most\s+expensive)\s+(?:\w+\s+)?price")),
+]
+
+NUMBER_WORDS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+}
+
+# How many results a question asks for: "top 5", "which 2 towns", "3 estates"
+LIMIT = re.compile(
+    r"\b(?:top|which|what)\s+(\d{1,3})\b(?!\s*(?:-|to)\s*\d|\s*-?\s*(?:room|rm)\b)|\b(\d{1,3})\s+(?:towns?|estates?)\b"
+)
+
+# A count that is not a plain number ("a few towns", "top 3-5", "the 2nd most"); no limit can be taken from it
+_VAGUE = r"(?:a\s+)?(?:few|couple|several|handful|dozen|\w+teen|twenty|thirty|forty|fifty|hundred)"
+UNPARSED_LIMIT = re.compile(
+    rf"\b(?:top|which|what)\s+{_VAGUE}\b|\b{_VAGUE}\s+(?:of\s+)?(?:towns?|estates?)\b"
+    r"|\btop\s+\d+\s*(?:-|to)\s*\d+|\b\d+(?:st|nd|rd|th)\b"
+)
+
+
+# Dimensions a question can break its answer down by ("by flat type", "per storey range", "across towns")
+DIMENSIONS = [
+    ("flat_type", r"(?:flat|room)[\s_-]*types?"),
+    ("flat_model", r"(?:flat[\s_-]*)?models?"),
+    ("storey", r"(?:storey|floor)(?:[\s_-]*(?:ranges?|levels?))?|storeys|floors"),
+    ("town", r"towns?|estates?"),
+    ("month", r"months?"),
+    ("quarter", r"quarters?"),
+    ("year", r"(?:financial\s+)?years?"),
+]
+GROUP_BY = re.compile(
+    r"\b(?:by|per|each|every|across|for\s+(?:each|every)|broken\s+down\s+by)\s+(?:the\s+|different\s+|individual\s+)?("
+    + "|".join(pattern for _, pattern in DIMENSIONS) + r")\b"
+)
+
+# Time granularity of a series ("monthly", "per year")
+GRANULARITY = [
+    ("month", re.compile(r"\bmonthly\b|\b(?:by|per|each|every)\s+month\b|\bmonth[\s-]+(?:by|on)[\s-]+month\b")),
+    ("quarter", re.compile(r"\bquarterly\b|\b(?:by|per|each|every)\s+quarter\b")),
+    ("year", re.compile(r"\b(?:yearly|annual(?:ly)?)\b|\b(?:by|per|each|every)\s+year\b|\byear[\s-]+(?:by|on)[\s-]+year\b")),
+]
+
+# Words that exclude what follows them ("excluding 4-room", "not in bedok", "other than executive")
+NEGATION = re.compile(
+    r"\b(?:excluding|exclude|except(?:\s+for)?|not(?:\s+in(?:cluding)?)?|other\s+than|without|apart\s+from|besides|"
+    r"outside(?:\s+of)?|non)[\s-]+((?:[\w/-]+\s*){1,3})"
+)
+
+
+@dataclass(frozen=True)
+class QuestionEntities:
+    """Facts a reused SQL statement must agree on exactly."""
+    towns: FrozenSet[str] = frozenset()
+    flat_types: FrozenSet[str] = frozenset()
+    years: FrozenSet[str] = frozenset()
+    last_n_years: Optional[int] = None
+    direction: Optional[str] = None  # "min" / "max"
+    limit: Optional[int] = None      # "top 5 towns", "which 2 towns"
+    unparsed_limit: bool = False     # a count was asked for but is not a number ("a few towns")
+    aggregate: Optional[str] = None  # "avg" / "median" / "sum" / "count" / "min" / "max"
+    dataset: Optional[str] = None    # "bto" / "resale" / "both"
+    group_by: FrozenSet[str] = frozenset()   # "flat_type" / "flat_model" / "storey" / "town" / "month" / "quarter" / "year"
+    granularity: Optional[str] = None        # "month" / "quarter" / "year" for a time series
+    excluded: FrozenSet[str] = frozenset()   # towns, flat types or words after "excluding" / "not" / "except"
+
+
+@dataclass
+class CachedSQL:
+    question: str
+    tokens: FrozenSet[str]
+    entities: QuestionEntities
+    sql: str
+    created: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class SemanticSQLCache:
+    """
+    Offline similarity cache from natural-language questions to validated SQL.
+
+    Questions are normalized (lower-cased, punctuation stripped, synonyms
+    folded, stop words dropped) and their entities extracted: towns and
+    flat types from `get_valid_values`, explicit years, "last N years", a
+    min/max direction, a result count ("top 5", "which 2 towns"), the
+    aggregate asked for (average, median, total, count, min or max), the
+    dataset (BTO or resale prices), the dimensions the answer is broken
+    down by ("by flat type", "per storey range"), the time granularity
+    ("monthly") and what is excluded ("excluding 4-room"). A cached
+    statement is reused only
+    when the entities match exactly and the cosine similarity of the token
+    sets reaches `threshold`; no network call is involved.
+    """
+
+    def __init__(self, threshold: float = 0.8, maxsize: int = 500, ttl: Optional[float] = None):
+        """
+        Args:
+            threshold: Minimum token similarity (0-1) to reuse a statement
+            maxsize: Maximum cached questions (least recently used evicted)
+            ttl: Seconds a statement stays reusable (None for no expiry)
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        valid = get_valid_values()
+        # longest first so "bukit batok" wins over a shorter overlapping name
+        self._towns = sorted(valid["towns"], key=len, reverse=True)
+        self._entries: "OrderedDict[str, CachedSQL]" = OrderedDict()
+        self._by_entities: Dict[QuestionEntities, List[str]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.evictions = 0
+
+    def extract_entities(self, question: str) -> QuestionEntities:
+        text = question.lower()
+        for word, digit in NUMBER_WORDS.items():
+            text = re.sub(rf"\b{word}\b", digit, text)
+
+        excluded = set()
+        for match in NEGATION.finditer(text):
+            excluded.add(self._excluded(match.group(1)))
+
+        towns = set()
+        for town in self._towns:
+            if re.search(rf"\b{re.escape(town)}\b", text):
+                towns.add(town)
+                text = text.replace(town, " ")
+
+        flat_types = {f"{n}-room" for n in re.findall(r"\b([1-5])\s*-?\s*(?:room|rm)\b", text)}
+        if "executive" in text:
+            flat_types.add("executive")
+        if re.search(r"multi[\s-]?gen", text):
+            flat_types.add("multi-generation")
+
+        last_n = re.search(r"\b(?:past|last|previous|recent)\s+(\d+)\s+(?:years?|yrs?)\b", text)
+        limit = LIMIT.search(text)
+        tokens = set(self._tokens(text))
+        direction = None
+        if "min" in tokens and "max" not in tokens:
+            direction = "min"
+        elif "max" in tokens and "min" not in tokens:
+            direction = "max"
+
+        aggregate = next((name for name, pattern in AGGREGATES if pattern.search(text)), None)
+        bto = bool(re.search(r"\b(?:btos?|build[\s-]to[\s-]order)\b", text))
+        resale = bool(re.search(r"\bresale\b", text))
+        dataset = "both" if bto and resale else "bto" if bto else "resale" if resale else None
+
+        group_by = {name for phrase in GROUP_BY.findall(text) for name, pattern in DIMENSIONS
+                    if re.fullmatch(pattern, phrase)}
+        granularity = next((name for name, pattern in GRANULARITY if pattern.search(text)), None)
+
+        return QuestionEntities(
+            towns=frozenset(towns),
+            flat_types=frozenset(flat_types),
+            years=frozenset(re.findall(r"\b((?:19|20)\d{2})\b", text)),
+            last_n_years=int(last_n.group(1)) if last_n else None,
+            direction=direction,
+            limit=int(limit.group(1) or limit.group(2)) if limit else None,
+            unparsed_limit=bool(UNPARSED_LIMIT.search(text)),
+            aggregate=aggregate,
+            dataset=dataset,
+            group_by=frozenset(group_by),
+            granularity=granularity,
+            excluded=frozenset(excluded),
+        )
+
+    def _excluded(self, phrase: str) -> str:
+        """What a negation applies to: the town or flat type it names, else its first word."""
+        for town in self._towns:
+            if re.match(rf"(?:in\s+|the\s+)?{re.escape(town)}\b", phrase):
+                return town
+        flat_type = re.match(r"(?:the\s+)?([1-5])\s*-?\s*(?:room|rm)\b", phrase)
+        if flat_type:
+            return f"{flat_type.group(1)}-room"
+        words = [w for w in phrase.split() if w not in STOPWORDS]
+        return SYNONYMS.get(words[0], words[0]) if words else phrase.strip()
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        text = re.sub(r"over\s+time", "over_time", text.lower())
+        for word, digit in NUMBER_WORDS.items():
+            text = re.sub(rf"\b{word}\b", digit, text)
+        # "4 room", "4rm" and "4-room" are one token
+        text = re.sub(r"\b([1-5])\s*-?\s*(?:room|rm)\b", r"\1-room", text)
+        words = re.findall(r"[a-z0-9_/-]+", text)
+        tokens = []
+        for word in words:
+            word = SYNONYMS.get(word, word)
+            if word not in STOPWORDS:
+                tokens.append(word)
+        return tokens
+
+    def normalize(self, question: str) -> str:
+        return " ".join(self._tokens(question))
+
+    @staticmethod
+    def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / math.sqrt(len(a) * len(b))
+
+    def _expired(self, entry: CachedSQL) -> bool:
+        return self.ttl is not None and time.monotonic() - entry.created > self.ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        keys = self._by_entities.get(entry.entities, [])
+        if key in keys:
+            keys.remove(key)
+        if not keys:
+            self._by_entities.pop(entry.entities, None)
+
+    def get(self, question: str) -> Optional[str]:
+        """Return a previously validated SQL statement for an equivalent question."""
+        key = self.normalize(question)
+        entities = self.extract_entities(question)
+        tokens = frozenset(key.split())
+        with self._lock:
+            self.lookups += 1
+            best_key, best_score = None, 0.0
+            exact = self._entries.get(key)
+            if exact is not None and exact.entities == entities:
+                best_key, best_score = key, 1.0
+            else:
+                for candidate in self._by_entities.get(entities, []):
+                    score = self.similarity(tokens, self._entries[candidate].tokens)
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+
+            if best_key is None or best_score < self.threshold:
+                return None
+            entry = self._entries[best_key]
+            if self._expired(entry):
+                self._remove(best_key)
+                return None
+            entry.hits += 1
+            self.hits += 1
+            if best_score == 1.0:
+                self.exact_hits += 1
+            self._entries.move_to_end(best_key)
+            return entry.sql
+
+    def put(self, question: str, sql: str) -> None:
+        """Remember a validated SQL statement for `question`."""
+        key = self.normalize(question)
+        entities = self.extract_entities(question)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedSQL(question, frozenset(key.split()), entities, sql)
+            self._by_entities.setdefault(entities, []).append(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "exact_hits": self.exact_hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions,
+            }
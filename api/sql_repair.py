@@ -0,0 +1,227 @@
+import difflib
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from api.result_cache import database_version
+from utils.tracing import tracer
+
+
+# Text columns with few enough distinct values to index for literal fixes
+MAX_INDEXED_VALUES = 1000
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+FENCE = re.compile(r"```(?:sqlite|sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+LABEL = re.compile(r"^\s*(?:sql|a|answer|query)\s*:\s*", re.IGNORECASE)
+PARAMETER = re.compile(r"(?<![\w$])([$:@][A-Za-z_]\w*|\?\d*)")
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+CTE_NAME = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*([A-Za-z_]\w*)\s*(?:\([^)]*\))?\s+AS\s*\(", re.IGNORECASE)
+QUALIFIED = re.compile(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b")
+ALIAS = r"\b{table}\b\s+(?:AS\s+)?([A-Za-z_]\w*)"
+NOT_ALIASES = {"WHERE", "GROUP", "ORDER", "JOIN", "LEFT", "INNER", "CROSS", "ON", "LIMIT", "UNION", "AS", "HAVING", "USING"}
+
+
+@dataclass
+class RepairResult:
+    """Outcome of checking one generated statement."""
+    sql: str
+    error: Optional[str] = None
+    fixes: List[str] = field(default_factory=list)
+    local: bool = False  # rejected without asking SQLite to prepare it
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class SQLRepairer:
+    """
+    Local checks and deterministic fixes for LLM-generated SQL.
+
+    `repair` first applies fixes that never change intent (markdown fences
+    and "SQL:" labels stripped, data literals lower-cased or hyphenated to
+    match the stored values, e.g. 'Ang Mo Kio' -> 'ang mo kio' and
+    '4 room' -> '4-room'), then rejects locally what SQLite would reject or
+    silently mis-execute: incomplete or multiple statements, unbound
+    parameters such as `$town` (they bind NULL and return no rows), and
+    unknown tables or qualified columns. Only statements that pass are
+    prepared with EXPLAIN. Errors name the closest valid table or column so
+    a re-prompt can correct them.
+    """
+
+    def __init__(self, connection: Callable, db_path: str):
+        """
+        Args:
+            connection: Context manager factory yielding a SQLite connection
+                (e.g. `ConnectionPool.connection`)
+            db_path: Path to the database, to reload the schema after changes
+        """
+        self.connection = connection
+        self.db_path = db_path
+        self.schema: Dict[str, List[str]] = {}
+        self.values: Set[str] = set()
+        self._version = None
+        self._lock = threading.Lock()
+        # generation metrics, updated by `record`
+        self.statements = 0
+        self.failures = 0
+        self.llm_calls = 0
+        self.first_try = 0
+        self.auto_fixed = 0
+        self.local_rejections = 0
+        self.prepare_rejections = 0
+        self.fixes: Dict[str, int] = {}
+
+    def _load(self) -> None:
+        version = database_version(self.db_path)
+        if version == self._version:
+            return
+        with self.connection() as conn:
+            tables = [r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+            )]
+            schema = {t: [r[1] for r in conn.execute(f"PRAGMA table_info({t})")] for t in tables}
+            values = set()
+            for table, columns in schema.items():
+                for column, declared in ((r[1], r[2]) for r in conn.execute(f"PRAGMA table_info({table})")):
+                    if declared.upper() != "TEXT":
+                        continue
+                    rows = conn.execute(
+                        f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT {MAX_INDEXED_VALUES + 1}"
+                    ).fetchall()
+                    if len(rows) <= MAX_INDEXED_VALUES:
+                        values.update(str(r[0]).strip() for r in rows)
+        self.schema, self.values, self._version = schema, values, version
+
+    # ---------- deterministic fixes ----------
+    def fix(self, sql: str) -> Tuple[str, List[str]]:
+        """Apply intent-preserving fixes; returns (sql, names of fixes applied)."""
+        fixes = []
+        fenced = FENCE.search(sql)
+        if fenced:
+            sql = fenced.group(1)
+            fixes.append("markdown_fence")
+        unlabeled = LABEL.sub("", sql)
+        if unlabeled != sql:
+            sql = unlabeled
+            fixes.append("label")
+        sql = sql.strip()
+
+        def literal(match: re.Match) -> str:
+            text = match.group(0)[1:-1].replace("''", "'")
+            if text in self.values:
+                return match.group(0)
+            for candidate in (text.lower(), re.sub(r"\s+", "-", text.lower().strip())):
+                if candidate in self.values:
+                    if "literal_case" not in fixes:
+                        fixes.append("literal_case")
+                    return "'" + candidate.replace("'", "''") + "'"
+            return match.group(0)
+
+        sql = STRING_LITERAL.sub(literal, sql)
+        return sql, fixes
+
+    # ---------- local checks ----------
+    @staticmethod
+    def _code(sql: str) -> str:
+        """Statement text with string literals blanked out."""
+        return STRING_LITERAL.sub("''", sql)
+
+    def _suggest(self, name: str, options: List[str]) -> str:
+        close = difflib.get_close_matches(name, options, n=1) or [o for o in options if name in o][:3]
+        return f" (did you mean {' / '.join(close)}?)" if close else ""
+
+    def check(self, sql: str) -> Optional[str]:
+        """First problem found without executing anything, or None."""
+        code = self._code(sql)
+        if not code.strip():
+            return "empty statement"
+        terminated = sql if sql.rstrip().endswith(";") else sql + ";"
+        if not sqlite3.complete_statement(terminated):
+            return "incomplete SQL statement (unbalanced quotes, parentheses or unfinished clause)"
+        if [part for part in code.split(";") if part.strip()][1:]:
+            return "more than one SQL statement; return exactly one"
+        if not re.match(r"\s*(?:SELECT|WITH)\b", code, re.IGNORECASE):
+            return "only a single read-only SELECT (or WITH ... SELECT) statement is allowed"
+
+        parameter = PARAMETER.search(code)
+        if parameter:
+            return (f"unbound parameter {parameter.group(1)}; no parameters are bound, "
+                    f"so write the literal value (e.g. town = 'ang mo kio') instead")
+
+        ctes = {m.lower() for m in CTE_NAME.findall(code)}
+        tables = {t.lower(): cols for t, cols in self.schema.items()}
+        aliases = {}
+        for name in TABLE_REF.findall(code):
+            if name.lower() not in tables and name.lower() not in ctes:
+                return f"no such table: {name}{self._suggest(name.lower(), list(tables))}"
+            if name.lower() in tables:
+                aliases[name.lower()] = name.lower()
+                for alias in re.findall(ALIAS.format(table=re.escape(name)), code, re.IGNORECASE):
+                    if alias.upper() not in NOT_ALIASES:
+                        aliases[alias.lower()] = name.lower()
+
+        for qualifier, column in QUALIFIED.findall(code):
+            table = aliases.get(qualifier.lower())
+            if table is not None and column.lower() not in {c.lower() for c in tables[table]}:
+                return f"no such column: {qualifier}.{column}{self._suggest(column.lower(), tables[table])}"
+        return None
+
+    def prepare(self, sql: str) -> Optional[str]:
+        """SQLite's own error for the statement, or None if it prepares."""
+        try:
+            with tracer.span("sql.explain"), self.connection() as conn:
+                conn.execute(f"EXPLAIN {sql}")
+            return None
+        except sqlite3.Error as e:
+            message = str(e)
+            missing = re.match(r"no such column: (?:\w+\.)?(\w+)", message)
+            if missing:
+                columns = sorted({c for cols in self.schema.values() for c in cols})
+                message += self._suggest(missing.group(1), columns)
+            return message
+
+    def repair(self, sql: str) -> RepairResult:
+        """Fix, check locally, then prepare; stops at the first error."""
+        with self._lock:
+            self._load()
+        sql, fixes = self.fix(sql)
+        error = self.check(sql)
+        if error is not None:
+            return RepairResult(sql, error, fixes, local=True)
+        return RepairResult(sql, self.prepare(sql), fixes)
+
+    # ---------- metrics ----------
+    def record(self, attempts: List[RepairResult]) -> None:
+        """Account for the attempts (one LLM call each) spent on one statement."""
+        with self._lock:
+            self.llm_calls += len(attempts)
+            for attempt in attempts:
+                if attempt.error is not None:
+                    if attempt.local:
+                        self.local_rejections += 1
+                    else:
+                        self.prepare_rejections += 1
+                for fix in attempt.fixes:
+                    self.fixes[fix] = self.fixes.get(fix, 0) + 1
+            if attempts and attempts[-1].ok:
+                self.statements += 1
+                self.first_try += int(len(attempts) == 1)
+                self.auto_fixed += int(bool(attempts[-1].fixes))
+            else:
+                self.failures += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "statements": self.statements,
+                "failures": self.failures,
+                "llm_calls": self.llm_calls,
+                "llm_calls_per_statement": self.llm_calls / self.statements if self.statements else 0.0,
+                "first_try_rate": self.first_try / self.statements if self.statements else 0.0,
+                "auto_fixed": self.auto_fixed,
+                "local_rejections": self.local_rejections,
+                "prepare_rejections": self.prepare_rejections,
+                "fixes": dict(self.fixes),
+            }
@@ -0,0 +1,257 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+from api.sql_cache import QuestionEntities, SemanticSQLCache
+
+
+# Words that mean the question asks for something no template covers
+UNSUPPORTED = re.compile(
+    r"\b(predict\w*|forecast\w*|estimate\w*|storey|floor|area|sqm|lease|model|street|block|"
+    r"median|psf|per\s+square|percent\w*|growth|why|should)\b"
+)
+TREND = re.compile(r"\b(trend\w*|over\s+(?:the\s+)?(?:time|years)|changed?|history|historical|each\s+year|by\s+year|yearly|annual\w*|monthly|per\s+month|by\s+month)\b")
+COMPARE = re.compile(r"\b(compare\w*|comparison|vs\.?|versus|difference|differ|between)\b")
+LAUNCHES = re.compile(r"\b(bto|launch\w*|supply)\b")
+PRICE = re.compile(r"\b(price\w*|cost\w*|expensive|cheap\w*|worth|valu\w*)\b")
+
+
+def literal(value: Any) -> str:
+    """SQL literal of a vetted parameter value."""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(literal(v) for v in value)
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+@dataclass(frozen=True)
+class SQLTemplate:
+    """
+    A pre-vetted statement with `:name` placeholders.
+
+    Placeholders are only ever filled with values taken from
+    `utils.get_valid_values` or integers parsed from the question, and are
+    rendered as quoted literals so the statement shares the result cache,
+    query log and rollup routing with generated SQL.
+    """
+    name: str
+    sql: str
+
+    def render(self, params: Dict[str, Any]) -> str:
+        def fill(match: re.Match) -> str:
+            return literal(params[match.group(1)])
+        return re.sub(r":(\w+)", fill, self.sql).strip()
+
+
+FEWEST_LAUNCHES = SQLTemplate("bto_launches", """
+SELECT TRIM(town) AS town,
+       SUM(CAST(financial_year AS INTEGER) >= :start_year{end_filter}) AS launches
+FROM bto_prices
+GROUP BY TRIM(town)
+ORDER BY launches {direction}, town
+LIMIT :limit""")
+
+START_YEAR = "(SELECT MAX(CAST(financial_year AS INTEGER)) FROM bto_prices) - :years + 1"
+
+PRICE_TREND = SQLTemplate("resale_trend", """
+SELECT {period} AS period, flat_type, AVG(resale_price) AS avg_price, COUNT(*) AS transactions
+FROM resale_prices
+WHERE town = :town{flat_type_filter}{period_filter}
+GROUP BY period, flat_type
+ORDER BY period, flat_type""")
+
+COMPARE_RESALE = SQLTemplate("compare_resale", """
+SELECT town, flat_type, AVG(resale_price) AS avg_price, MIN(resale_price) AS min_price,
+       MAX(resale_price) AS max_price, COUNT(*) AS transactions
+FROM resale_prices
+WHERE town IN (:towns){flat_type_filter}{period_filter}
+GROUP BY town, flat_type
+ORDER BY flat_type, town""")
+
+COMPARE_BTO = SQLTemplate("compare_bto", """
+SELECT TRIM(town) AS town, TRIM(room_type) AS room_type,
+       AVG(min_selling_price) AS avg_min_price, AVG(max_selling_price) AS avg_max_price,
+       COUNT(*) AS launches
+FROM bto_prices
+WHERE TRIM(town) IN (:towns){room_type_filter}{period_filter}
+GROUP BY 1, 2
+ORDER BY 2, 1""")
+
+
+@dataclass
+class TemplateMatch:
+    template: str
+    sql: str
+    params: Dict[str, Any]
+
+
+class SQLTemplateEngine:
+    """
+    Rule-based fast path from common question shapes to SQL, with no LLM call.
+
+    Shapes:
+        - towns with the fewest / most BTO launches (optionally in the last N years)
+        - resale price of a flat type in one town over time
+        - TOWN A vs TOWN B (resale prices, or BTO prices when BTO is mentioned)
+
+    Towns, flat types, years, "last N years", direction and the result
+    count ("top N", "which N towns") come from
+    `SemanticSQLCache.extract_entities`. A question that mentions anything a
+    template cannot express (predictions, storeys, lease, a count that is
+    not a number, an exclusion, a breakdown by anything but time, ...) or that matches no shape returns None and goes to
+    the model.
+    """
+
+    def __init__(self, entities: Optional[Callable[[str], QuestionEntities]] = None):
+        """
+        Args:
+            entities: Entity extractor (default a fresh `SemanticSQLCache().extract_entities`)
+        """
+        self.entities = entities or SemanticSQLCache().extract_entities
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches: Dict[str, int] = {}
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        text = question.lower()
+        entities = self.entities(question)
+        found = None
+        # exclusions and breakdowns other than by time are beyond every template
+        expressible = not entities.excluded and entities.group_by <= {"month", "year"}
+        if not UNSUPPORTED.search(text) and not entities.unparsed_limit and expressible:
+            found = (self._launches(text, entities) or self._compare(text, entities)
+                     or self._trend(text, entities))
+        with self._lock:
+            self.lookups += 1
+            if found is not None:
+                self.matches[found.template] = self.matches.get(found.template, 0) + 1
+        return found
+
+    @staticmethod
+    def _period(text: str, entities: QuestionEntities) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        """
+        First and last year (inclusive, None if open) a question is limited to:
+        "since / from 2015", "after 2015" (from 2016), "to / until / through
+        2018", "before 2018" (to 2017), "2015-2018" or "2015-18", "between
+        2015 and 2018".
+        Returns None if the question names a year these do not account for.
+        """
+        year = r"((?:19|20)\d{2})"
+        first = last = None
+        used = set()
+        between = (re.search(rf"\bbetween\s+{year}\s+and\s+{year}\b", text)
+                   or re.search(rf"\b{year}\s*-\s*((?:19|20)?\d{{2}})\b", text))
+        if between:
+            first, end = between.group(1), between.group(2)
+            # "2015-18" ends in the same century
+            end = first[:2] + end if len(end) == 2 else end
+            first, last = int(first), int(end)
+            used.update((between.group(1), end))
+        else:
+            start = re.search(rf"\b(since|from|after)\s+{year}\b", text)
+            if start:
+                first = int(start.group(2)) + (start.group(1) == "after")
+                used.add(start.group(2))
+            end = re.search(rf"\b(to|until|till|through|before)\s+{year}\b", text)
+            if end:
+                last = int(end.group(2)) - (end.group(1) == "before")
+                used.add(end.group(2))
+        if set(entities.years) - used or (first is not None and last is not None and first > last):
+            return None
+        return first, last
+
+    @staticmethod
+    def _period_filter(first: Optional[int], last: Optional[int], column: str) -> Tuple[str, Dict[str, Any]]:
+        """Filter on `month` ("YYYY-MM" text) or `financial_year` for the years from `_period`."""
+        params: Dict[str, Any] = {}
+        filters = ""
+        if column == "month":
+            if first is not None:
+                params["since"] = f"{first}-01"
+                filters += " AND month >= :since"
+            if last is not None:
+                params["until"] = f"{last}-12"
+                filters += " AND month <= :until"
+        else:
+            if first is not None:
+                params["since"] = first
+                filters += " AND CAST(financial_year AS INTEGER) >= :since"
+            if last is not None:
+                params["until"] = last
+                filters += " AND CAST(financial_year AS INTEGER) <= :until"
+        return filters, params
+
+    def _launches(self, text: str, entities: QuestionEntities) -> Optional[TemplateMatch]:
+        if not LAUNCHES.search(text) or entities.direction is None or entities.towns or PRICE.search(text):
+            return None
+        period = self._period(text, entities)
+        if entities.flat_types or period is None or (entities.last_n_years and period != (None, None)):
+            return None
+        first, last = period
+        params: Dict[str, Any] = {"limit": entities.limit or 5}
+        end_filter = ""
+        if last is not None:
+            params["end_year"] = last
+            end_filter = " AND CAST(financial_year AS INTEGER) <= :end_year"
+        sql = FEWEST_LAUNCHES.sql.format(direction="ASC" if entities.direction == "min" else "DESC", end_filter=end_filter)
+        if entities.last_n_years:
+            params["years"] = entities.last_n_years
+            sql = sql.replace(":start_year", f"({START_YEAR})")
+        else:
+            params["start_year"] = first or 0
+        return TemplateMatch(FEWEST_LAUNCHES.name, SQLTemplate(FEWEST_LAUNCHES.name, sql).render(params), params)
+
+    @staticmethod
+    def _filters(entities: QuestionEntities, column: str = "flat_type") -> Tuple[str, Dict[str, Any]]:
+        params: Dict[str, Any] = {}
+        filters = ""
+        if entities.flat_types:
+            params["flat_types"] = sorted(entities.flat_types)
+            filters += f" AND {'TRIM(room_type)' if column == 'room_type' else column} IN (:flat_types)"
+        return filters, params
+
+    def _compare(self, text: str, entities: QuestionEntities) -> Optional[TemplateMatch]:
+        if len(entities.towns) < 2 or not COMPARE.search(text) or entities.direction or entities.limit:
+            return None
+        period = self._period(text, entities)
+        if period is None or entities.last_n_years:
+            return None
+        params: Dict[str, Any] = {"towns": sorted(entities.towns)}
+        bto = bool(LAUNCHES.search(text))
+        template = COMPARE_BTO if bto else COMPARE_RESALE
+        flat_filter, flat_params = self._filters(entities, "room_type" if bto else "flat_type")
+        period_filter, period_params = self._period_filter(*period, "financial_year" if bto else "month")
+        params.update(flat_params, **period_params)
+        sql = template.sql.format(flat_type_filter=flat_filter, room_type_filter=flat_filter, period_filter=period_filter)
+        return TemplateMatch(template.name, SQLTemplate(template.name, sql).render(params), params)
+
+    def _trend(self, text: str, entities: QuestionEntities) -> Optional[TemplateMatch]:
+        if len(entities.towns) != 1 or not TREND.search(text) or not PRICE.search(text):
+            return None
+        if LAUNCHES.search(text) or entities.direction or entities.limit or entities.last_n_years:
+            return None
+        period = self._period(text, entities)
+        if period is None:
+            return None
+        params: Dict[str, Any] = {"town": next(iter(entities.towns))}
+        flat_filter, flat_params = self._filters(entities)
+        period_filter, period_params = self._period_filter(*period, "month")
+        params.update(flat_params, **period_params)
+        monthly = re.search(r"\b(monthly|per\s+month|by\s+month|each\s+month)\b", text)
+        sql = PRICE_TREND.sql.format(
+            period="month" if monthly else "substr(month, 1, 4)",
+            flat_type_filter=flat_filter,
+            period_filter=period_filter,
+        )
+        return TemplateMatch(PRICE_TREND.name, SQLTemplate(PRICE_TREND.name, sql).render(params), params)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.matches.values())
+            return {
+                "lookups": self.lookups,
+                "hits": hits,
+                "hit_rate": hits / self.lookups if self.lookups else 0.0,
+                "by_template": dict(self.matches),
+            }
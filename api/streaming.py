@@ -0,0 +1,152 @@
+import contextvars
+import json
+import logging
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where `emit` sends events; set only while a request is being streamed
+_sink: contextvars.ContextVar = contextvars.ContextVar("stream_sink", default=None)
+
+# Per-stream timings kept for percentiles
+HISTORY_SIZE = 1000
+
+
+class StreamClosed(BaseException):
+    """
+    Raised by `emit` once the client of a streamed request has gone away.
+
+    A BaseException, so the `except Exception` fallbacks along the pipeline
+    let it through and the request stops at its next event.
+    """
+
+
+class _Sink:
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue()
+        self.closed = threading.Event()
+
+
+def streaming() -> bool:
+    """Whether the current call is part of a streamed request."""
+    return _sink.get() is not None
+
+
+def emit(event: str, **data: Any) -> None:
+    """
+    Send an event to the current stream; a no-op outside one.
+
+    Raises:
+        StreamClosed: If the stream's client has disconnected
+    """
+    sink = _sink.get()
+    if sink is not None:
+        if sink.closed.is_set():
+            raise StreamClosed()
+        sink.queue.put({"event": event, "data": data})
+
+
+def sse(event: Dict[str, Any]) -> str:
+    """One event in Server-Sent Events wire format."""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+class StreamMetrics:
+    """
+    Timings of streamed requests, measured from when the request starts.
+
+    - time to first byte: the first event written to the client (usually
+      the routing decision)
+    - time to first token: the first piece of answer text
+    - total: the "done" event
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.errors = 0
+        self._history: Dict[str, deque] = {
+            name: deque(maxlen=HISTORY_SIZE) for name in ("ttfb", "ttft", "total")
+        }
+
+    def record(self, timings: Dict[str, Optional[float]], failed: bool = False) -> None:
+        with self._lock:
+            self.streams += 1
+            self.errors += int(failed)
+            for name, seconds in timings.items():
+                if seconds is not None:
+                    self._history[name].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"streams": self.streams, "errors": self.errors}
+            for name, history in self._history.items():
+                values = sorted(history)
+                out[f"{name}_p50_seconds"] = statistics.median(values) if values else None
+                out[f"{name}_p95_seconds"] = values[min(len(values) - 1, int(0.95 * len(values)))] if values else None
+            return out
+
+
+# Shared by every streaming endpoint in the process
+metrics = StreamMetrics()
+
+
+def stream_events(run: Callable[[], Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Run `run` in a worker thread and yield the events it emits as they happen.
+
+    Ends with a "done" event carrying `run`'s result and the stream's
+    timings, or an "error" event if it raised. Timings are recorded in
+    `metrics`. If the consumer closes the generator (the client
+    disconnected), `run` is stopped at its next `emit` and nothing more is
+    queued.
+    """
+    sink = _Sink()
+    finished = object()
+    outcome: Dict[str, Any] = {}
+
+    def worker():
+        _sink.set(sink)
+        try:
+            outcome["result"] = run()
+        except StreamClosed:
+            logger.info("Stream client disconnected; request stopped")
+        except Exception as e:
+            logger.error(f"Streamed request failed: {e}")
+            outcome["error"] = str(e)
+        finally:
+            sink.queue.put(finished)
+
+    started = time.perf_counter()
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(worker,), daemon=True, name="stream").start()
+    timings: Dict[str, Optional[float]] = {"ttfb": None, "ttft": None, "total": None}
+    try:
+        while True:
+            event = sink.queue.get()
+            elapsed = time.perf_counter() - started
+            if event is finished:
+                break
+            if timings["ttfb"] is None:
+                timings["ttfb"] = elapsed
+            if event["event"] == "token" and timings["ttft"] is None:
+                timings["ttft"] = elapsed
+            yield event
+    finally:
+        # set on every exit; only matters when the consumer stopped reading early
+        sink.closed.set()
+
+    timings["total"] = time.perf_counter() - started
+    if timings["ttfb"] is None:
+        timings["ttfb"] = timings["total"]
+    metrics.record(timings, failed="error" in outcome)
+    rounded = {name: round(seconds, 4) if seconds is not None else None for name, seconds in timings.items()}
+    if "error" in outcome:
+        yield {"event": "error", "data": {"error": outcome["error"], "timings": rounded}}
+    else:
+        yield {"event": "done", "data": {**outcome["result"], "timings": rounded}}
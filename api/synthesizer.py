@@ -1,55 +1,72 @@
-from google import genai
 import os
-from dotenv import load_dotenv
+from typing import Optional
+from api.llm_gateway import LLMGateway, get_gateway
 from api.orchestrator_tool import Orchestrator
-from utils.utils import get_defaults, get_valid_values, create_function_declarations
+from api.prompts import BACKGROUND, Prompt, ledger
+from api.streaming import emit, stream_events, streaming
 
 
-class Synthesizer(Orchestrator):
+class Synthesizer:
     """
     Synthesizer that combines outputs (prediction, analysis, etc.)
     into a natural language final answer.
     """
 
-    def __init__(self, api_base_url="http://localhost:8000", model="gemini-2.5-flash"):
-        super().__init__(api_base_url=api_base_url, model=model)
+    def __init__(self, orchestrator: Optional[Orchestrator] = None, model="gemini-2.5-flash",
+                 gateway: Optional[LLMGateway] = None):
+        """
+        Args:
+            orchestrator: Runs the tool passes for `stream_answer`; not needed to `synthesize` alone
+            model: Gemini model for the final answer
+            gateway: LLM gateway (default the process-wide one)
+        """
+        self.orchestrator = orchestrator
+        self.model = model
+        self.llm = gateway or get_gateway()
+        self.token_budget = orchestrator.token_budget if orchestrator else int(os.getenv("LLM_REQUEST_TOKEN_BUDGET", "0"))
 
-        self.final_template  = """
-            You are a housing market intelligence assistant designed to support analysis of BTO (Build-To-Order) pricing in Singapore,
-            leveraging trends from HDB resale transactions. Provide explanations and predictions for BTO prices based on past resale data
-            and contextual factors.
+        # Static prefix shares the market background with every other prompt
+        self.final_template = BACKGROUND + """
+4. **BTO prices discounted against Resale prices**
+- Predictions use resale benchmarks with a 20–30% discount for BTO recommendations.
 
-            1. **Pricing Framework**
-            - BTO flat prices are informed by nearby resale flat transactions: HDB benchmarks BTO “market value” by comparing transacted resale flat prices in the vicinity
+You will be given one or more outputs from different models:
+- A resale price prediction model
+- An SQL/analyst model explaining BTO/resale trends
 
-            2. **Trends in BTO–Resale Price Gaps**
-            - In **mature estates**, resale prices have risen faster than BTO prices
-            - In **non-mature estates**, BTO price growth sometimes outpaces resale growth
+Your task:
+1. Read the available outputs
+2. Combine them into a coherent, user-facing explanation
+3. Keep the answer concise, factual, and helpful
 
-            3. **Other Market Influences**
-            - BTO supply levels significantly affect resale demand and prices.
-            - Micro-level price drivers: location/town attributes, estate maturity, flat type and size, remaining lease, floor level, time of year.
-
-            4. **BTO prices discounted against Resale prices**
-            - Predictions use resale benchmarks with a 20–30% discount for BTO recommendations.
-
-            You will be given one or more outputs from different models:
-            - A resale price prediction model
-            - An SQL/analyst model explaining BTO/resale trends
-
-            Your task:
-            1. Read the available outputs
-            2. Combine them into a coherent, user-facing explanation
-            3. Keep the answer concise, factual, and helpful
-
-            Provided outputs:
-            {outputs}
-
-            Respond with natural language only. Remember to quote the predicted resale price and
-            the discount applied to provide the final recommended BTO price.
-            """
+Respond with natural language only. Remember to quote the predicted resale price and
+the discount applied to provide the final recommended BTO price.
+"""
         
     # ----------  final plain-language synthesis ----------
+    @ledger.budgeted
     def synthesize(self, outputs: str) -> str:
-        prompt = self.final_template.format(outputs=outputs)
-        return self.model.generate_content(contents=prompt).text.strip()
\ No newline at end of file
+        prompt = Prompt("synthesizer.final", static=self.final_template, dynamic=f"Provided outputs:\n{outputs}")
+        if streaming():
+            chunks = []
+            for chunk in self.llm.stream(prompt, model=self.model):
+                chunks.append(chunk)
+                emit("token", stage="synthesis", text=chunk)
+            return "".join(chunks).strip()
+        return self.llm.generate(prompt, model=self.model).text.strip()
+
+    # ----------  whole pipeline, streamed ----------
+    def stream_answer(self, user_query: str):
+        """
+        `stream_two_pass` followed by `synthesize`, as one event stream; the
+        synthesized answer arrives as "token" events with stage "synthesis"
+        and in the "done" event as "final".
+        """
+        if self.orchestrator is None:
+            raise ValueError("stream_answer needs a Synthesizer built with an orchestrator")
+
+        def run() -> dict:
+            result = self.orchestrator.run_two_pass(user_query)
+            final = self.synthesize(str(result["response"]))
+            return {"response": result["response"], "final": final, "plan": result.get("plan")}
+        return stream_events(run)
\ No newline at end of file
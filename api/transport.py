@@ -0,0 +1,191 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Any, Dict, Optional
+import requests
+from api.http_client import HTTPClient, get_http_client, timeouts_from_env
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(RuntimeError):
+    """A tool call the backend rejected or could not serve."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Transport:
+    """
+    How the Orchestrator reaches the prediction and analysis backends.
+
+    `predict` returns `{"predicted_price": float}` and `analyze` returns the
+    `AnalystResponse` fields as a dict (rows as lists), whatever the
+    transport. Rejected or failed calls raise `TransportError` with the
+    HTTP status the server would have answered with (None when the server
+    could not be reached, or did not answer within `timeout(operation)`
+    seconds). Subclasses implement `_predict`, `_analyze` and `timeout`.
+    """
+
+    name = "transport"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def _timed(self, operation: str, fn, *args) -> Dict[str, Any]:
+        start = time.perf_counter()
+        failed = True
+        try:
+            with tracer.span(f"tool.{operation}", transport=self.name):
+                result = fn(*args)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self.calls[operation] = self.calls.get(operation, 0) + 1
+                self.errors[operation] = self.errors.get(operation, 0) + int(failed)
+                self.seconds[operation] = self.seconds.get(operation, 0.0) + time.perf_counter() - start
+
+    def predict(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self._timed("predict", self._predict, payload)
+
+    def analyze(self, query: str) -> Dict[str, Any]:
+        return self._timed("analyze", self._analyze, query)
+
+    def timeout(self, operation: str) -> float:
+        """Seconds a call to `operation` ("predict" / "analyze") may take before it fails."""
+        raise NotImplementedError
+
+    def _predict(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _analyze(self, query: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "transport": self.name,
+                "calls": dict(self.calls),
+                "errors": dict(self.errors),
+                "mean_ms": {op: 1000 * self.seconds[op] / n for op, n in self.calls.items() if n},
+            }
+
+
+class HTTPTransport(Transport):
+    """Calls a (possibly remote) API server over the shared pooled HTTP client."""
+
+    name = "http"
+
+    def __init__(self, base_url: str = "http://localhost:8000", http: Optional[HTTPClient] = None):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.http = http or get_http_client()
+
+    def _post(self, path: str, body: Dict[str, Any], endpoint: str, idempotent: bool) -> Dict[str, Any]:
+        try:
+            return self.http.post(f"{self.base_url}{path}", json=body, endpoint=endpoint, idempotent=idempotent).json()
+        except requests.HTTPError as e:
+            try:
+                detail = e.response.json().get("detail", e.response.text)
+            except ValueError:
+                detail = e.response.text
+            raise TransportError(str(detail), e.response.status_code) from e
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+
+    def timeout(self, operation: str) -> float:
+        return self.http.timeout(operation)
+
+    def _predict(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self._post("/predict", payload, "predict", idempotent=True)
+
+    def _analyze(self, query: str) -> Dict[str, Any]:
+        return self._post("/analyze", {"query": query}, "analyze", idempotent=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "http": self.http.stats()}
+
+
+class InProcessTransport(Transport):
+    """
+    Calls the API's endpoint functions directly, in this process.
+
+    Shares `server.app`'s components (model registry, feature encoder,
+    Analyst) and prediction cache, so requests get the same validation,
+    caching and model routing as over HTTP without the loopback hop or
+    JSON round trip. Components start loading in the background on
+    construction, as they do at server startup.
+
+    Calls run on the transport's own worker threads and give up after the
+    same per-endpoint timeouts as the HTTP client (HTTP_TIMEOUT_PREDICT,
+    HTTP_TIMEOUT_ANALYZE), so the caller's thread is freed when an HTTP
+    caller's would be. As with an HTTP server, an abandoned call still
+    finishes in the background.
+    """
+
+    name = "inprocess"
+
+    def __init__(self, warm_up: bool = True, timeouts: Optional[Dict[str, float]] = None, max_workers: int = 16):
+        """
+        Args:
+            warm_up: Start loading the server's components now
+            timeouts: Operation -> seconds (default from HTTP_TIMEOUT_* variables)
+            max_workers: Endpoint calls running at once
+        """
+        super().__init__()
+        # Imported here so HTTP-only clients never load the server and its models
+        import server.app as server
+        self.server = server
+        self.timeouts = dict(timeouts_from_env(), **(timeouts or {}))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inprocess")
+        if warm_up:
+            server.components.warm_up()
+
+    def timeout(self, operation: str) -> float:
+        return self.timeouts.get(operation, max(self.timeouts.values()))
+
+    def _call(self, operation: str, endpoint, request_model, **fields) -> Dict[str, Any]:
+        from fastapi import HTTPException
+        from pydantic import ValidationError
+        try:
+            request = request_model(**fields)
+            future = self._pool.submit(contextvars.copy_context().run, endpoint, request)
+            return future.result(timeout=self.timeout(operation))
+        except FuturesTimeoutError as e:
+            future.cancel()
+            raise TransportError(f"{operation} timed out after {self.timeout(operation)}s") from e
+        except ValidationError as e:
+            raise TransportError(str(e), 422) from e
+        except HTTPException as e:
+            raise TransportError(str(e.detail), e.status_code) from e
+
+    def _predict(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call("predict", self.server.predict, self.server.PredictionRequest, **payload)
+
+    def _analyze(self, query: str) -> Dict[str, Any]:
+        response = self._call("analyze", self.server.analyze, self.server.AnalystRequest, query=query)
+        # rows come back as tuples; match what the HTTP transport decodes
+        return {**response, "results": [list(row) for row in response["results"]]}
+
+
+def transport_from_env(api_base_url: str = "http://localhost:8000") -> Transport:
+    """
+    Transport named by ORCHESTRATOR_TRANSPORT: "http" (default) calls the
+    API at `api_base_url`, "inprocess" runs it in this process.
+    """
+    kind = os.getenv("ORCHESTRATOR_TRANSPORT", "http").lower()
+    if kind == "inprocess":
+        return InProcessTransport()
+    if kind != "http":
+        raise ValueError(f"Unknown ORCHESTRATOR_TRANSPORT {kind!r} (expected 'http' or 'inprocess')")
+    return HTTPTransport(api_base_url)
+
@@ -0,0 +1,91 @@
+import argparse
+import math
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+from api.columnar import AggregateQuery, Between, ColumnarSnapshot
+
+
+# Typical Analyst aggregates, each run through SQLite (via to_sql) and the snapshot
+QUERIES = {
+    "avg price by town": AggregateQuery(
+        "resale_prices", group_by=["town"],
+        aggregates={"avg_price": ("avg", "resale_price"), "transactions": ("count", "*")},
+        order_by="avg_price", descending=True,
+    ),
+    "4-room trend since 2020": AggregateQuery(
+        "resale_prices", where={"flat_type": "4-room", "month": Between("2020-01", None)},
+        group_by=["month"], aggregates={"avg_price": ("avg", "resale_price")},
+    ),
+    "town x flat type extremes": AggregateQuery(
+        "resale_prices", group_by=["town", "flat_type"],
+        aggregates={"min_price": ("min", "resale_price"), "max_price": ("max", "resale_price")},
+    ),
+    "large flats in three towns": AggregateQuery(
+        "resale_prices",
+        where={"town": ["tampines", "bedok", "punggol"], "floor_area_sqm": Between(110, None)},
+        group_by=["town", "storey_range"], aggregates={"avg_price": ("avg", "resale_price")},
+    ),
+    "overall totals": AggregateQuery(
+        "resale_prices", aggregates={"transactions": ("count", "*"), "total": ("sum", "resale_price")},
+    ),
+    "fewest bto launches": AggregateQuery(
+        "bto_prices", where={"financial_year": Between("2015", None)}, group_by=["town"],
+        aggregates={"launches": ("count", "*")}, order_by="launches", limit=5,
+    ),
+}
+
+
+def median_seconds(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def same_rows(a: List[Tuple], b: List[Tuple]) -> bool:
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        for u, v in zip(x, y):
+            if isinstance(u, float) or isinstance(v, float):
+                if u is None or v is None or not math.isclose(u, v, rel_tol=1e-9):
+                    return False
+            elif u != v:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite with the in-memory columnar snapshot.")
+    parser.add_argument("--db", default="data/hdb_prices.db", help="SQLite database")
+    parser.add_argument("--repeat", type=int, default=20, help="timed executions per query")
+    args = parser.parse_args()
+
+    snapshot = ColumnarSnapshot.load(args.db)
+    described = snapshot.describe()
+    print(f"snapshot loaded in {described['load_seconds']:.2f}s")
+    for name, table in described["tables"].items():
+        print(f"  {name}: {table['rows']} rows, {table['bytes'] / 1024 / 1024:.1f} MiB")
+    print()
+
+    conn = sqlite3.connect(Path(args.db).resolve().as_uri() + "?mode=ro", uri=True)
+    print(f"{'query':<30} {'sqlite ms':>10} {'columnar ms':>12} {'speedup':>8}  match")
+    for name, query in QUERIES.items():
+        sql = query.to_sql()
+        expected = conn.execute(sql).fetchall()
+        actual, _ = snapshot.execute(query)
+        sqlite_s = median_seconds(lambda: conn.execute(sql).fetchall(), args.repeat)
+        columnar_s = median_seconds(lambda: snapshot.execute(query), args.repeat)
+        speedup = sqlite_s / columnar_s if columnar_s else float("inf")
+        match = "yes" if same_rows(expected, actual) else "NO"
+        print(f"{name:<30} {sqlite_s * 1000:>10.2f} {columnar_s * 1000:>12.3f} {speedup:>7.1f}x  {match}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
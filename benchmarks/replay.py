@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_CORPUS = "benchmarks/fixtures/queries.jsonl"
+DEFAULT_FIXTURES = "benchmarks/fixtures/llm.jsonl"
+DEFAULT_BASELINE = "benchmarks/fixtures/replay_baseline.json"
+
+# Stages with fewer spans than this are reported but not compared (their p95 is one sample)
+MIN_SAMPLES = 20
+
+# Report fields that do not depend on the machine: all a shared baseline holds and, by default, all that is compared
+DETERMINISTIC = ("queries", "concurrency", "synthesize", "errors", "llm_calls_per_query")
+
+# How the orchestrator's responses begin when the pipeline failed
+ERROR_RESPONSES = ("I encountered an error", "An error occurred")
+
+
+def load_corpus(path: str) -> List[str]:
+    """Queries from a JSONL file of {"query": ...} objects, or a plain text file with one query per line."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def replay(queries: List[str], concurrency: int, synthesize: bool, warmup: List[str]) -> Dict[str, Any]:
+    """
+    Run every query through `Orchestrator.run_two_pass` (and `Synthesizer.synthesize`)
+    with `concurrency` queries in flight, against the API in this process.
+
+    `warmup` queries run first, one at a time, and are left out of every
+    figure; they fill the SQL, result and prediction caches so the measured
+    run sees steady-state behaviour rather than which query won a cold-cache race.
+    """
+    # Imported here so the LLM backend is configured from the environment set up in main()
+    import server.app as server
+    from api.llm_gateway import get_gateway
+    from api.orchestrator_tool import Orchestrator
+    from api.planner import ToolPlanner
+    from api.synthesizer import Synthesizer
+    from api.transport import InProcessTransport
+    from utils.tracing import tracer
+
+    # Load models, encoder and Analyst before the clock starts
+    for thread in server.components.warm_up():
+        thread.join()
+    orch = Orchestrator(transport=InProcessTransport(warm_up=False))
+    synth = Synthesizer(orchestrator=orch)
+
+    def run(query: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = orch.run_two_pass(query)
+            if synthesize:
+                synth.synthesize(str(result["response"]))
+            # the orchestrator answers its own failures with an apology rather than raising
+            failed = ((result.get("plan") or {}).get("exit") == "error"
+                      or str(result.get("response") or "").startswith(ERROR_RESPONSES)
+                      or any(ToolPlanner.failed(source) for source in result.get("sources") or []))
+        except Exception as e:
+            print(f"  failed: {query[:60]}: {e}")
+            failed = True
+        return {"seconds": time.perf_counter() - start, "failed": failed}
+
+    def requested() -> int:
+        # deduplicated calls count too, so the figure does not depend on timing
+        stats = get_gateway().stats()
+        return stats["calls"] + stats["deduplicated"]
+
+    for query in warmup:
+        run(query)
+    tracer.reset()
+    llm_before, orchestrator_before = requested(), orch.planner.llm_calls
+    dedup_before = get_gateway().stats()["deduplicated"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        runs = list(pool.map(run, queries))
+    wall = time.perf_counter() - start
+    llm_calls = requested() - llm_before
+    orchestrator_calls = orch.planner.llm_calls - orchestrator_before
+    llm = get_gateway().stats()
+
+    seconds = [r["seconds"] for r in runs]
+    stages = {
+        name: {
+            "count": m["count"],
+            "p50_seconds": m["p50_seconds"],
+            "p95_seconds": m["p95_seconds"],
+            "p99_seconds": m["p99_seconds"],
+        }
+        for name, m in tracer.stats().items()
+    }
+    stages["query"] = {
+        "count": len(seconds),
+        "p50_seconds": percentile(seconds, 0.5),
+        "p95_seconds": percentile(seconds, 0.95),
+        "p99_seconds": percentile(seconds, 0.99),
+    }
+    return {
+        "queries": len(queries),
+        "concurrency": concurrency,
+        "synthesize": synthesize,
+        "errors": sum(r["failed"] for r in runs),
+        "wall_seconds": wall,
+        "throughput_qps": len(queries) / wall if wall else 0.0,
+        "llm_calls_per_query": llm_calls / len(queries) if queries else 0.0,
+        "orchestrator_llm_calls_per_query": orchestrator_calls / len(queries) if queries else 0.0,
+        "llm_deduplicated": llm["deduplicated"] - dedup_before,
+        "llm_peak_in_flight": llm["peak_in_flight"],
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack: float,
+            timings: bool = False) -> List[str]:
+    """
+    Regressions of `report` against `baseline`.
+
+    LLM calls requested per query and errors are deterministic with the
+    stub backend and may not grow at all. With `timings`, throughput and
+    peak RSS may also move by no more than `tolerance` (a fraction), and p50
+    and p95 latencies may grow by no more than `tolerance` plus `slack`
+    seconds, so sub-millisecond stages do not fail on timer noise. Stages
+    with fewer than MIN_SAMPLES spans are skipped. Timings only mean
+    something against a baseline written on the same machine.
+    """
+    problems = []
+    for key in ("queries", "concurrency", "synthesize"):
+        if report[key] != baseline.get(key):
+            problems.append(f"{key} is {report[key]} but the baseline ran with {baseline.get(key)}; not comparable")
+    if problems:
+        return problems
+
+    if report["errors"] > baseline["errors"]:
+        problems.append(f"errors: {report['errors']} (baseline {baseline['errors']})")
+    if report["llm_calls_per_query"] > baseline["llm_calls_per_query"] + 1e-9:
+        problems.append(f"LLM calls per query: {report['llm_calls_per_query']:.2f} (baseline {baseline['llm_calls_per_query']:.2f})")
+    if not timings:
+        return problems
+
+    if "throughput_qps" not in baseline:
+        problems.append("the baseline has no timings; write one on this machine with --write-baseline --timings")
+        return problems
+    if report["throughput_qps"] < baseline["throughput_qps"] * (1 - tolerance):
+        problems.append(f"throughput: {report['throughput_qps']:.2f} q/s (baseline {baseline['throughput_qps']:.2f})")
+    if report["peak_rss_mb"] and baseline.get("peak_rss_mb") and report["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        problems.append(f"peak RSS: {report['peak_rss_mb']:.0f} MB (baseline {baseline['peak_rss_mb']:.0f} MB)")
+    for name, base in baseline["stages"].items():
+        stage = report["stages"].get(name)
+        if stage is None or min(stage["count"], base["count"]) < MIN_SAMPLES:
+            continue
+        for q in ("p50_seconds", "p95_seconds"):
+            if base[q] is not None and stage[q] is not None and stage[q] > base[q] * (1 + tolerance) + slack:
+                problems.append(f"{name} {q[:3]}: {1000 * stage[q]:.1f} ms (baseline {1000 * base[q]:.1f} ms)")
+    return problems
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"queries: {report['queries']} at concurrency {report['concurrency']}, {report['errors']} errors")
+    print(f"throughput: {report['throughput_qps']:.2f} queries/s ({report['wall_seconds']:.2f}s wall)")
+    print(f"LLM calls per query: {report['llm_calls_per_query']:.2f} "
+          f"({report['orchestrator_llm_calls_per_query']:.2f} by the orchestrator), "
+          f"{report['llm_deduplicated']} deduplicated, peak {report['llm_peak_in_flight']} in flight")
+    if report["peak_rss_mb"] is not None:
+        print(f"peak RSS: {report['peak_rss_mb']:.0f} MB")
+    print()
+    print(f"{'stage':<32} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stage in sorted(report["stages"].items()):
+        ms = [f"{1000 * stage[q]:9.1f}" if stage[q] is not None else f"{'-':>9}" for q in ("p50_seconds", "p95_seconds", "p99_seconds")]
+        print(f"{name:<32} {stage['count']:>6} {' '.join(ms)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a query corpus through the orchestrator and synthesizer with recorded LLM responses."
+    )
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL of {\"query\": ...}, or one query per line")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="recorded LLM responses for the stub backend")
+    parser.add_argument("--concurrency", type=int, default=4, help="queries in flight")
+    parser.add_argument("--repeat", type=int, default=20, help="replay the corpus this many times")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured passes over the corpus first")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--no-synthesize", action="store_true", help="skip the synthesizer")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed fractional slowdown")
+    parser.add_argument("--slack-ms", type=float, default=10.0, help="allowed absolute slowdown per latency, in ms")
+    parser.add_argument("--timings", action="store_true",
+                        help="also compare throughput, peak RSS and latencies (needs a baseline from this machine)")
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="save this run as the baseline (its timings too with --timings)")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Every LLM call is answered from fixtures: no network, no API key, deterministic answers
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_FIXTURES"] = args.fixtures
+    os.environ["LLM_STUB_LATENCY"] = str(args.llm_latency)
+
+    corpus = load_corpus(args.corpus)
+    report = replay(corpus * args.repeat, args.concurrency, not args.no_synthesize, warmup=corpus * args.warmup)
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.write_baseline:
+        saved = report if args.timings else {key: report[key] for key in DETERMINISTIC}
+        Path(args.baseline).write_text(json.dumps(saved, indent=2) + "\n")
+        print(f"\nbaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}; run with --write-baseline to create one")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        problems = compare(report, json.load(f), args.tolerance, args.slack_ms / 1000, timings=args.timings)
+    print()
+    if problems:
+        print(f"REGRESSION against {args.baseline}:")
+        for problem in problems:
+            print(f"  - {problem}")
+        raise SystemExit(1)
+    print(f"no regression against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
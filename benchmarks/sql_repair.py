@@ -0,0 +1,78 @@
+import argparse
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+from api.sql_repair import SQLRepairer
+
+
+# First-attempt statements in the shapes the model gets wrong most often
+CORPUS = [
+    "SELECT town, COUNT(*) AS launches FROM bto_prices WHERE financial_year >= '2015' GROUP BY town ORDER BY launches LIMIT 5",
+    "```sql\nSELECT AVG(resale_price) FROM resale_prices WHERE town = 'bedok'\n```",
+    "```sqlite\nSELECT month, AVG(resale_price) FROM resale_prices WHERE flat_type = '4-room' GROUP BY month;\n```",
+    "SQL: SELECT DISTINCT town FROM bto_prices WHERE financial_year = '2018';",
+    "SELECT AVG(resale_price) FROM resale_prices WHERE town = 'Ang Mo Kio'",
+    "SELECT month, AVG(resale_price) FROM resale_prices WHERE town = 'TAMPINES' AND flat_type = '5 ROOM' GROUP BY month",
+    "SELECT MAX(resale_price) FROM resale_prices WHERE flat_type = '3 room'",
+    "SELECT AVG(resale_price) FROM resale_prices WHERE town = $town",
+    "SELECT * FROM resale_price WHERE town = 'bishan' LIMIT 10",
+    "SELECT r.town, AVG(r.price) FROM resale_prices r GROUP BY r.town",
+    "SELECT town FROM bto_prices; SELECT town FROM resale_prices;",
+    "SELECT town, MIN(min_selling_price) FROM bto_prices GROUP BY town",
+]
+
+
+def outcome(conn: sqlite3.Connection, sql: str) -> str:
+    """'error', 'empty' (runs but returns nothing) or 'rows'."""
+    try:
+        rows = conn.execute(sql).fetchall()
+    except (sqlite3.Error, sqlite3.Warning):
+        return "error"
+    if not rows or all(v is None for row in rows for v in row):
+        return "empty"
+    return "rows"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what the local SQL repair stage saves over plain retries.")
+    parser.add_argument("--db", default="data/hdb_prices.db", help="SQLite database")
+    args = parser.parse_args()
+
+    uri = Path(args.db).resolve().as_uri() + "?mode=ro"
+
+    @contextmanager
+    def connection():
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    repairer = SQLRepairer(connection, args.db)
+    conn = sqlite3.connect(uri, uri=True)
+    totals = {"baseline_retries": 0, "baseline_silent": 0, "repair_retries": 0, "fixed_locally": 0}
+    print(f"{'baseline':<9} {'repaired':<9} statement")
+    for sql in CORPUS:
+        before = outcome(conn, sql)
+        result = repairer.repair(sql)
+        after = outcome(conn, result.sql) if result.ok else "retry"
+        # the old loop re-prompted only on EXPLAIN errors; empty results went through silently
+        totals["baseline_retries"] += before == "error"
+        totals["baseline_silent"] += before == "empty"
+        totals["repair_retries"] += not result.ok
+        totals["fixed_locally"] += result.ok and before != "rows"
+        note = f"  -> {result.error}" if not result.ok else (f"  fixes: {', '.join(result.fixes)}" if result.fixes else "")
+        print(f"{before:<9} {after:<9} {' '.join(sql.split())[:70]}{note}")
+    conn.close()
+
+    n = len(CORPUS)
+    print()
+    print(f"statements: {n}")
+    print(f"baseline: {totals['baseline_retries']} re-prompts, {totals['baseline_silent']} silently empty results, "
+          f"{(n + totals['baseline_retries']) / n:.2f} LLM calls per statement (at least)")
+    print(f"repaired: {totals['repair_retries']} re-prompts (each with the error), {totals['fixed_locally']} fixed without the LLM, "
+          f"{(n + totals['repair_retries']) / n:.2f} LLM calls per statement (at least)")
+
+
+if __name__ == "__main__":
+    main()
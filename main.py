@@ -3,40 +3,45 @@ import time
 import requests
 from api.orchestrator_tool import Orchestrator
 from api.synthesizer import Synthesizer
+from api.transport import InProcessTransport, transport_from_env
 
 def start_ml_server():
     """Start FastAPI ML server in a subprocess."""
     process = subprocess.Popen(
-        ["uvicorn", "server.app:app", "--host", "0.0.0.0", "--port", "8000", "--reload"],
+        ["uvicorn", "server.app:app", "--host", "0.0.0.0", "--port", "8000"],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
     print("🚀 Starting ML server at http://localhost:8000 ...")
-    time.sleep(3)  # give server a few seconds to spin up
     return process
 
-def wait_for_server(url="http://localhost:8000/predict", timeout=30):
-    """Wait until ML server is responding."""
+def wait_for_server(url="http://localhost:8000/readyz", timeout=30, interval=0.1):
+    """Wait until ML server reports ready, then print its startup breakdown."""
     start = time.time()
     while time.time() - start < timeout:
         try:
-            r = requests.post(url, json={}, timeout=2)
-            if r.status_code in (200, 422):  # 422 = validation error (expected if empty payload)
-                print("✅ ML server is live.")
+            r = requests.get(url, timeout=2)
+            if r.status_code == 200:
+                status = r.json()
+                print(f"✅ ML server is ready after {time.time() - start:.2f}s.")
+                for name, component in status["components"].items():
+                    print(f"   {name}: {component['state']} ({component['load_seconds']}s)")
                 return True
         except requests.exceptions.RequestException:
             pass
-        time.sleep(1)
+        time.sleep(interval)
     raise RuntimeError("❌ ML server failed to start.")
 
 def main():
-    # Start ML server
-    server_proc = start_ml_server()
+    # Start ML server, unless the API runs in this process (ORCHESTRATOR_TRANSPORT=inprocess)
+    transport = transport_from_env("http://localhost:8000")
+    server_proc = None if isinstance(transport, InProcessTransport) else start_ml_server()
     try:
-        wait_for_server()
+        if server_proc is not None:
+            wait_for_server()
 
-        orch = Orchestrator(api_base_url="http://localhost:8000")
-        synth = Synthesizer(api_base_url="http://localhost:8000")
+        orch = Orchestrator(api_base_url="http://localhost:8000", transport=transport)
+        synth = Synthesizer(orchestrator=orch)
 
         queries = [
             "which estate had the least BTO in the past 5 years, for this estate, recommend a BTO price for low floor, 3-room flat in Bedok with an area of 100 sq m and lease commencement in 2019. the flat model is premium maisonette",
@@ -49,14 +54,20 @@ def main():
 
             # 1. orchestrator
             orch_out = orch.run_two_pass(q)
+            print("PLAN:", orch_out["plan"])
             final_text = synth.synthesize(str(orch_out["response"]))
             print("FINAL ANSWER:\n", final_text)
             print("=" * 80)
 
+        print("Transport:", transport.stats())
+        print("Planner:", orch.planner.stats())
+        print("LLM:", orch.llm.stats())
+
     finally:
-        print("🛑 Stopping ML server...")
-        server_proc.terminate()
-        server_proc.wait()
+        if server_proc is not None:
+            print("🛑 Stopping ML server...")
+            server_proc.terminate()
+            server_proc.wait()
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,112 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-import joblib
-from typing import Any, Dict
-import pandas as pd
-from api.analyst import Analyst, QueryResult
-from utils.utils import preprocess
+import time
+_import_started = time.perf_counter()
 
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+import os
+import json
+import itertools
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Union
+from utils.utils import get_valid_values
+from utils.encoder import FeatureEncoder, parity_records
+from utils.cache import PredictionCache, normalize_prediction_request
+from utils.registry import ModelRegistry
+from utils.lifecycle import Components
+from utils.tracing import TRACE_HEADER, tracer
 
-# Load your trained ML model
-model = joblib.load("model/xgb_tuned.joblib")
 
-app = FastAPI()
+MODEL_DIR = "model"
+DB_PATH = "data/hdb_prices.db"
+
+# Rows per model.predict call on the batch path
+BATCH_CHUNK_SIZE = 4096
+
+# Largest grid /predict/sweep will price in one call
+MAX_SWEEP_ROWS = 50_000
+
+# Seconds between checks for new or changed model artifacts
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "5"))
+
+# Memoized predictions keyed on the normalized request
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "3600")),
+)
+
+########################################
+##             components             ##
+########################################
+
+def _load_models():
+    # Global plus per-segment models, hot-swapped when artifacts change
+    registry = ModelRegistry(MODEL_DIR)
+    registry.refresh()
+    registry.start_watching(MODEL_POLL_INTERVAL)
+    return registry
+
+
+def _load_encoder():
+    # Compiled feature encoder for the predict hot path. Parity with
+    # utils.utils.preprocess is covered by tests/test_encoder.py; set
+    # ENCODER_PARITY_CHECK=1 to also refuse to serve if it ever drifts.
+    encoder = FeatureEncoder()
+    if os.getenv("ENCODER_PARITY_CHECK", "0") == "1":
+        encoder.check_parity(parity_records())
+    return encoder
+
+
+def _load_analyst():
+    # Imported here so predict-only replicas never pay for the LLM SDK import
+    from api.analyst import Analyst
+    return Analyst(DB_PATH)
+
+
+def _load_assistant():
+    # Orchestrator + synthesizer for /ask, calling this process's endpoints directly
+    from api.orchestrator_tool import Orchestrator
+    from api.synthesizer import Synthesizer
+    from api.transport import InProcessTransport
+    return Synthesizer(orchestrator=Orchestrator(transport=InProcessTransport(warm_up=False)))
+
+
+components = Components()
+components.register("models", _load_models)
+components.register("encoder", _load_encoder)
+components.register("analyst", _load_analyst)
+components.register("assistant", _load_assistant)
+
+# Components that must be loaded before /predict can be served
+PREDICT_COMPONENTS = ["models", "encoder"]
+
+import_seconds = time.perf_counter() - _import_started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load everything in the background; the server accepts connections at once
+    # and /readyz reports when each component is available
+    components.warm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Join the caller's trace (orchestrator -> server) or start one, and
+    # time the whole request as an "http <route>" span
+    with tracer.trace(request.headers.get(TRACE_HEADER)) as trace, tracer.span("http") as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        span.name = f"http {route.path}" if route is not None else "http unmatched"
+        span.set(status=response.status_code)
+    response.headers[TRACE_HEADER] = trace.trace_id
+    return response
 
 ########################################
 ##              pydantic              ##
@@ -30,42 +126,422 @@ class PredictionResponse(BaseModel):
     predicted_price: float
 
 
+class PredictionColumns(BaseModel):
+    month: List[str]
+    town: List[str]
+    flat_type: List[str]
+    flat_model: List[str]
+    storey_range: List[str]
+    floor_area_sqm: List[int]
+    lease_commence_date: List[int]
+
+
+class BatchPredictionRequest(BaseModel):
+    # either a list of rows or a columnar payload (one list per field)
+    rows: Optional[List[PredictionRequest]] = None
+    columns: Optional[PredictionColumns] = None
+
+
+class BatchPredictionResponse(BaseModel):
+    predicted_prices: List[float]
+
+
+class SweepAxis(BaseModel):
+    # field of PredictionRequest to vary; give explicit `values`, or a
+    # `start`/`stop` range (inclusive; months as YYYY-MM, `step` in months),
+    # or neither to sweep every valid value of a categorical field
+    field: str
+    values: Optional[List[Union[int, str]]] = None
+    start: Optional[Union[int, str]] = None
+    stop: Optional[Union[int, str]] = None
+    step: int = 1
+
+
+class SweepRequest(BaseModel):
+    base: PredictionRequest
+    axes: List[SweepAxis]
+
+
+class SweepResponse(BaseModel):
+    # one row per grid point: the axis values followed by the price
+    columns: List[str]
+    rows: List[list]
+
+
 class AnalystRequest(BaseModel):
     query: str
 
 
+class AnalystStreamRequest(BaseModel):
+    query: str
+    chunk_size: int = Field(500, ge=1)
+    # capped at the Analyst's ANALYST_MAX_ROWS either way
+    max_rows: Optional[int] = Field(None, ge=1)
+
+
+class AskRequest(BaseModel):
+    query: str
+    # also stream the synthesizer's final answer after the orchestrator's
+    synthesize: bool = True
+
+
 class AnalystResponse(BaseModel):
     sql: str
     results: list
     columns: list
     explanation: str
+    truncated: bool = False
 
 
 ########################################
 ##              endpoints             ##
 ########################################
 
+def _component(name: str):
+    """Fetch a loaded component, answering 503 if it cannot be loaded."""
+    try:
+        return components.get(name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+## liveness
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "uptime_seconds": round(components.uptime(), 3)}
+
+
+## readiness, with a per-component startup breakdown
+@app.get("/readyz")
+def readyz():
+    ready = components.is_ready(PREDICT_COMPONENTS)
+    body = {
+        "ready": ready,
+        "predict_ready": ready,
+        "analyze_ready": components.is_ready(["analyst"]),
+        "import_seconds": round(import_seconds, 4),
+        "uptime_seconds": round(components.uptime(), 3),
+        "components": components.status(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
 ## predict
 @app.post("/predict", response_model=PredictionResponse)
 def predict(data: PredictionRequest):
-    # Convert request into dict
-    input_dict = data.dict()
-    # Preprocess into feature DataFrame
-    X = preprocess(input_dict)
-    # Predict
-    prediction = model.predict(X)[0]
-    return {"predicted_price": float(prediction)}
+    # One snapshot per request, so a hot swap mid-request cannot mix models;
+    # cached predictions are tagged with its generation
+    snapshot = _component("models").current
+    encoder = _component("encoder")
+    # Convert request into a normalized dict (also the cache key)
+    input_dict = normalize_prediction_request(data.dict())
+    key = prediction_cache.key(input_dict)
+    cached = prediction_cache.get(key, snapshot.generation)
+    if cached is not None:
+        return {"predicted_price": cached}
+    # Encode into a single feature row
+    with tracer.span("predict.preprocess", rows=1):
+        X = encoder.encode_one(input_dict)
+    # Predict with the most specific model for this flat
+    model = snapshot.route(input_dict).model
+    with tracer.span("predict.inference", rows=1):
+        prediction = float(model.predict(encoder.as_model_input(model, X))[0])
+    prediction_cache.put(key, prediction, snapshot.generation)
+    return {"predicted_price": prediction}
 
 
-## analyze
-analyst = Analyst("data/hdb_prices.db")
+def predict_batch(records, chunk_size: int = BATCH_CHUNK_SIZE) -> List[float]:
+    """
+    Predict prices for many payloads with one model call per chunk.
+
+    Rows already in the prediction cache are answered from it; only the
+    distinct misses are encoded, grouped by the model they route to, and
+    sent to that model.
+
+    Args:
+        records: List of payload dicts, or a columnar dict of equal-length lists
+        chunk_size: Maximum rows per model.predict call
+
+    Returns:
+        Predicted prices in input order
+    """
+    snapshot = _component("models").current
+    encoder = _component("encoder")
+    if isinstance(records, dict):
+        n_rows = len(records["month"])
+        records = [{key: values[i] for key, values in records.items()} for i in range(n_rows)]
+
+    normalized = [normalize_prediction_request(record) for record in records]
+    keys = [prediction_cache.key(record) for record in normalized]
+    prices: List[Optional[float]] = [prediction_cache.get(key, snapshot.generation) for key in keys]
 
+    # Identical rows within the batch are priced once
+    pending: Dict[tuple, List[int]] = {}
+    for i, price in enumerate(prices):
+        if price is None:
+            pending.setdefault(keys[i], []).append(i)
+
+    # Group the distinct misses by routed model
+    by_model: Dict[str, List[tuple]] = {}
+    routed = {}
+    for key, rows in pending.items():
+        entry = snapshot.route(normalized[rows[0]])
+        routed[entry.name] = entry.model
+        by_model.setdefault(entry.name, []).append(key)
+
+    for name, unique in by_model.items():
+        model = routed[name]
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            with tracer.span("predict.preprocess", rows=len(chunk)):
+                X = encoder.encode([normalized[pending[key][0]] for key in chunk])
+            with tracer.span("predict.inference", rows=len(chunk)):
+                predicted = model.predict(encoder.as_model_input(model, X))
+            for key, price in zip(chunk, predicted):
+                prediction_cache.put(key, float(price), snapshot.generation)
+                for i in pending[key]:
+                    prices[i] = float(price)
+
+    return prices
+
+
+## batch predict
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+def predict_batch_endpoint(data: BatchPredictionRequest):
+    if (data.rows is None) == (data.columns is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of 'rows' or 'columns'")
+
+    if data.rows is not None:
+        records = [row.dict() for row in data.rows]
+        n_rows = len(records)
+    else:
+        records = data.columns.dict()
+        lengths = {len(values) for values in records.values()}
+        if len(lengths) > 1:
+            raise HTTPException(status_code=422, detail="All columns must have the same length")
+        n_rows = lengths.pop()
+
+    if n_rows == 0:
+        return {"predicted_prices": []}
+
+    return {"predicted_prices": predict_batch(records)}
+
+
+SWEEP_CATEGORIES = {
+    "town": "towns",
+    "flat_type": "flat_types",
+    "flat_model": "flat_models",
+    "storey_range": "storey_ranges",
+}
+
+
+def _month_index(value: Union[int, str]) -> int:
+    """Months since year 0 for a YYYY-MM string, or 422."""
+    match = re.fullmatch(r"(\d{4})-(\d{2})", str(value).strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise HTTPException(status_code=422, detail=f"Invalid month {value!r}; expected YYYY-MM")
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+
+def _month_name(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _integer(value: Union[int, str], field: str) -> int:
+    """An integer sweep value or bound, or 422."""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{field} values must be integers, got {value!r}")
+
+
+def _sweep_axis(axis: SweepAxis) -> Sequence:
+    """
+    Values for one sweep axis. Ranges stay lazy `range` objects (of month
+    indices for `month`), so the grid size can be checked before anything
+    is expanded.
+    """
+    if axis.field not in PredictionRequest.__fields__:
+        raise HTTPException(status_code=422, detail=f"Unknown sweep field: {axis.field}")
+    if axis.step < 1:
+        raise HTTPException(status_code=422, detail="Sweep step must be positive")
+
+    if axis.values is not None:
+        values = axis.values
+        if axis.field == "month":
+            values = [_month_name(_month_index(v)) for v in values]
+        elif axis.field in ("floor_area_sqm", "lease_commence_date"):
+            values = [_integer(v, axis.field) for v in values]
+    elif axis.start is not None and axis.stop is not None:
+        if axis.field == "month":
+            values = range(_month_index(axis.start), _month_index(axis.stop) + 1, axis.step)
+        elif axis.field in ("floor_area_sqm", "lease_commence_date"):
+            values = range(_integer(axis.start, axis.field), _integer(axis.stop, axis.field) + 1, axis.step)
+        else:
+            raise HTTPException(status_code=422, detail=f"Ranges are not supported for {axis.field}")
+    elif axis.field in SWEEP_CATEGORIES:
+        values = get_valid_values()[SWEEP_CATEGORIES[axis.field]]
+    else:
+        raise HTTPException(status_code=422, detail=f"Axis {axis.field} needs values or a start/stop range")
+
+    if not len(values):
+        raise HTTPException(status_code=422, detail=f"Axis {axis.field} is empty")
+    return values
+
+
+## sweep: price the cartesian grid of variants of one flat in a single pass
+@app.post("/predict/sweep", response_model=SweepResponse)
+def predict_sweep(data: SweepRequest):
+    fields = [axis.field for axis in data.axes]
+    if len(set(fields)) != len(fields):
+        raise HTTPException(status_code=422, detail="Each field may only be swept once")
+
+    axes = [_sweep_axis(axis) for axis in data.axes]
+    # sized from range lengths, before any axis is expanded
+    n_rows = math.prod(len(values) for values in axes)
+    if n_rows > MAX_SWEEP_ROWS:
+        raise HTTPException(status_code=422, detail=f"Sweep has {n_rows} points; the limit is {MAX_SWEEP_ROWS}")
+    grids = [
+        [_month_name(i) for i in values] if field == "month" and isinstance(values, range) else list(values)
+        for field, values in zip(fields, axes)
+    ]
+
+    base = data.base.dict()
+    points = list(itertools.product(*grids))
+    records = [dict(base, **dict(zip(fields, point))) for point in points]
+    prices = predict_batch(records)
+
+    return {
+        "columns": fields + ["predicted_price"],
+        "rows": [list(point) + [price] for point, price in zip(points, prices)],
+    }
+
+
+## prediction cache stats
+@app.get("/predict/cache")
+def predict_cache_stats():
+    return prediction_cache.stats()
+
+
+## loaded models and their memory footprint
+@app.get("/models")
+def list_models():
+    return _component("models").describe()
+
+
+## pick up new or changed artifacts now instead of waiting for the watcher
+@app.post("/models/reload")
+def reload_models():
+    registry = _component("models")
+    try:
+        swapped = registry.refresh()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"swapped": swapped, **registry.describe()}
+
+
+## analyze
 @app.post("/analyze", response_model=AnalystResponse)
 def analyze(request: AnalystRequest):
-    result: QueryResult = analyst.query(request.query, display=False)
-    return str(AnalystResponse(
+    from api.analyst import QueryTimeoutError
+    analyst = _component("analyst")
+    try:
+        result = analyst.query(request.query, display=False)
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return AnalystResponse(
         sql=result.sql,
         results=result.results,
         columns=result.columns,
-        explanation=result.explanation
-    ))
+        explanation=result.explanation,
+        truncated=result.truncated
+    ).dict()
+
+
+## analyze, streaming rows as NDJSON instead of one big list
+@app.post("/analyze/stream")
+def analyze_stream(request: AnalystStreamRequest):
+    analyst = _component("analyst")
+
+    def lines():
+        try:
+            for event in analyst.stream(request.query, chunk_size=request.chunk_size, max_rows=request.max_rows):
+                yield json.dumps(event, default=str) + "\n"
+        except Exception as e:
+            # headers are already sent, so report the failure in-band
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+## question -> SQL (templates, cache, generation), SQL -> result and rollup routing stats
+@app.get("/analyze/cache")
+def analyze_cache_stats():
+    analyst = _component("analyst")
+    return {
+        "questions": analyst.sql_cache.stats(),
+        "results": analyst.result_cache.stats(),
+        "rollups": analyst.rollups.stats(),
+        "templates": analyst.templates.stats(),
+        "generation": analyst.sql_repair.stats(),
+    }
+
+
+## SQLite connection pool stats
+@app.get("/analyze/pool")
+def analyze_pool_stats():
+    return _component("analyst").pool.stats()
+
+
+## LLM tokens per prompt (prompt / cached / output) in this process
+@app.get("/analyze/tokens")
+def analyze_token_stats():
+    from api.prompts import ledger
+    return ledger.stats()
+
+
+## ask: the orchestrator's (and synthesizer's) answer as Server-Sent Events, with
+## routing, SQL and prediction events before the answer tokens
+@app.post("/ask/stream")
+def ask_stream(request: AskRequest):
+    from api.streaming import sse
+    assistant = _component("assistant")
+    if request.synthesize:
+        events = assistant.stream_answer(request.query)
+    else:
+        events = assistant.orchestrator.stream_two_pass(request.query)
+    return StreamingResponse(
+        (sse(event) for event in events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+## streamed answer timings (time to first byte / first token), plans, transport and LLM gateway stats
+@app.get("/ask/stats")
+def ask_stats():
+    from api.streaming import metrics
+    orchestrator = _component("assistant").orchestrator
+    return {
+        "stream": metrics.stats(),
+        "planner": orchestrator.planner.stats(),
+        "transport": orchestrator.transport.stats(),
+        "llm": orchestrator.llm.stats(),
+    }
+
+
+## per-stage latency histograms (p50/p95/p99), token and row counters, Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(tracer.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+## spans of one recent request, by the ID returned in the X-Trace-Id header
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired trace {trace_id}")
+    return trace
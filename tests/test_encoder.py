@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from utils.encoder import FeatureEncoder, parity_records
+from utils.utils import get_defaults, preprocess, preprocess_batch
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    return FeatureEncoder()
+
+
+def expected(records):
+    return preprocess_batch(records).to_numpy(dtype=np.float32)
+
+
+EDGE_CASES = [
+    # lease year as a string, as the HTTP API accepts it
+    dict(get_defaults(), lease_commence_date="1990"),
+    # fractional floor area
+    dict(get_defaults(), floor_area_sqm=67.5),
+    # sold in the year the lease started, and a flat past 50 years old
+    dict(get_defaults(), month="2019-06", lease_commence_date=2019),
+    dict(get_defaults(), month="2024-12", lease_commence_date=1966),
+    # values the model has no column for encode as all zeros in both paths
+    dict(get_defaults(), town="atlantis"),
+    dict(get_defaults(), flat_type="9-room", flat_model="unknown", storey_range="99 to 99"),
+]
+
+
+def test_matches_preprocess_batch_on_every_categorical_value(encoder):
+    records = parity_records()
+    np.testing.assert_array_equal(encoder.encode(records), expected(records))
+
+
+@pytest.mark.parametrize("record", EDGE_CASES)
+def test_encode_one_matches_preprocess(encoder, record):
+    np.testing.assert_array_equal(encoder.encode_one(record), preprocess(record).to_numpy(dtype=np.float32))
+
+
+def test_encode_matches_preprocess_batch_on_edge_cases(encoder):
+    np.testing.assert_array_equal(encoder.encode(EDGE_CASES), expected(EDGE_CASES))
+
+
+def test_columnar_input(encoder):
+    columns = {key: [record[key] for record in EDGE_CASES] for key in EDGE_CASES[0]}
+    np.testing.assert_array_equal(encoder.encode(columns), expected(columns))
+
+
+def test_preallocated_output_is_reset(encoder):
+    out = np.full((len(EDGE_CASES) + 3, encoder.n_features), 7.0, dtype=np.float32)
+    np.testing.assert_array_equal(encoder.encode(EDGE_CASES, out=out), expected(EDGE_CASES))
+
+
+def test_check_parity_names_drifted_columns(encoder):
+    drifted = FeatureEncoder()
+    drifted._numeric["floor_area_sqm"], drifted._numeric["remaining_lease"] = (
+        drifted._numeric["remaining_lease"], drifted._numeric["floor_area_sqm"],
+    )
+    encoder.check_parity(parity_records())
+    with pytest.raises(ValueError, match="floor_area_sqm"):
+        drifted.check_parity(parity_records())
@@ -0,0 +1,45 @@
+import contextvars
+import threading
+from api.prompts import Prompt, PromptUsage, TokenLedger
+
+
+def usage(name, tokens):
+    return PromptUsage(name, tokens, 0, 0)
+
+
+def test_overlapping_calls_are_each_corrected_to_their_own_count():
+    ledger = TokenLedger()
+    p1, p2 = Prompt("a", static="x" * 2000, dynamic="q"), Prompt("b", static="y" * 40, dynamic="q")
+    with ledger.request() as state:
+        charged1 = ledger.charge(p1)
+        charged2 = ledger.charge(p2)
+        ledger.record(usage("b", 10), charged=charged2)
+        ledger.record(usage("a", 10), charged=charged1)
+    assert state["tokens"] == 20
+    assert state["calls"] == 2
+
+
+def test_concurrent_calls_in_one_request():
+    ledger = TokenLedger()
+    prompt = Prompt("a", static="x" * 400, dynamic="q")
+
+    def call():
+        for _ in range(200):
+            ledger.record(usage("a", 7), charged=ledger.charge(prompt))
+
+    with ledger.request() as state:
+        # as the orchestrator's tool pool runs calls: in a copy of the request's context
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(call,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert state["calls"] == 8 * 200
+    assert state["tokens"] == 8 * 200 * 7
+
+
+def test_outside_a_request_nothing_is_charged():
+    ledger = TokenLedger()
+    assert ledger.charge(Prompt("a", static="x", dynamic="q")) == 0
+    ledger.record(usage("a", 5))
+    assert ledger.stats()["a"]["prompt_tokens"] == 5
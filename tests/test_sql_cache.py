@@ -0,0 +1,40 @@
+import pytest
+from api.sql_cache import SemanticSQLCache
+
+SQL = "SELECT 1"
+
+# (cached question, a different question that must not get its SQL)
+DIFFERENT = [
+    ("average resale price in bedok by flat type", "average resale price in bedok"),
+    ("average resale price in bedok per month", "average resale price in bedok"),
+    ("average resale price in bedok", "average resale price in bedok by flat type"),
+    ("average resale price in bedok by month", "average resale price in bedok by year"),
+    ("how many 4-room flats were sold in bedok by storey range", "how many 4-room flats were sold in bedok"),
+    ("average resale price of 4-room flats in bedok", "average resale price of flats in bedok excluding 4-room"),
+    ("average resale price of flats in bedok excluding 4-room", "average resale price of flats in bedok excluding 5-room"),
+    ("monthly average resale price in tampines", "yearly average resale price in tampines"),
+]
+
+# (cached question, a paraphrase that should reuse its SQL)
+SAME = [
+    ("average resale price in bedok by flat type", "what is the mean resale price in bedok by flat type"),
+    ("how many 4-room flats were sold in bedok", "how many four room flats were sold in bedok?"),
+    ("average resale price of flats in bedok excluding 4-room", "average resale price of flats in bedok, excluding 4 room"),
+]
+
+
+@pytest.fixture
+def cache():
+    return SemanticSQLCache()
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT)
+def test_different_questions_miss(cache, cached, asked):
+    cache.put(cached, SQL)
+    assert cache.get(asked) is None
+
+
+@pytest.mark.parametrize("cached, asked", SAME)
+def test_paraphrases_hit(cache, cached, asked):
+    cache.put(cached, SQL)
+    assert cache.get(asked) == SQL
@@ -0,0 +1,51 @@
+import pytest
+from api.sql_templates import SQLTemplateEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return SQLTemplateEngine()
+
+
+@pytest.mark.parametrize("question, template, filters", [
+    ("Which towns had the most BTO launches from 2010 to 2015?", "bto_launches",
+     [">= 2010", "<= 2015"]),
+    ("Which towns had the fewest BTO launches between 2012 and 2014?", "bto_launches",
+     [">= 2012", "<= 2014"]),
+    ("Which towns had the most BTO launches after 2015?", "bto_launches", [">= 2016"]),
+    ("Which towns had the most BTO launches before 2015?", "bto_launches", [">= 0", "<= 2014"]),
+    ("compare resale prices in bedok vs tampines from 2015 to 2016", "compare_resale",
+     ["month >= '2015-01'", "month <= '2016-12'"]),
+    ("compare bto prices in bedok vs tampines since 2018", "compare_bto",
+     ["CAST(financial_year AS INTEGER) >= 2018"]),
+    ("how did resale prices in bedok change from 2015 to 2018?", "resale_trend",
+     ["month >= '2015-01'", "month <= '2018-12'"]),
+    ("how did resale prices in bedok change in 2015-16?", "resale_trend",
+     ["month >= '2015-01'", "month <= '2016-12'"]),
+    ("how did resale prices in bedok change after 2015?", "resale_trend", ["month >= '2016-01'"]),
+    ("how did resale prices in bedok change until 2018?", "resale_trend", ["month <= '2018-12'"]),
+])
+def test_year_bounds_become_filters(engine, question, template, filters):
+    match = engine.match(question)
+    assert match is not None and match.template == template
+    for f in filters:
+        assert f in match.sql
+
+
+def test_open_period_has_no_upper_bound(engine):
+    match = engine.match("compare resale prices in bedok vs tampines since 2019")
+    assert "month >= '2019-01'" in match.sql and "<=" not in match.sql
+
+
+@pytest.mark.parametrize("question", [
+    # a year no bound accounts for
+    "Which towns had the most BTO launches in 2015?",
+    "compare resale prices in bedok vs tampines in 2015 and 2016",
+    "how did resale prices in bedok change from 2015 compared with 2018?",
+    # an empty range
+    "how did resale prices in bedok change from 2018 to 2015?",
+    # both a relative and an absolute period
+    "Which towns had the most BTO launches in the last 5 years until 2020?",
+])
+def test_unexpressible_periods_decline(engine, question):
+    assert engine.match(question) is None
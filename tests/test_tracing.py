@@ -0,0 +1,32 @@
+import threading
+from utils.tracing import Tracer
+
+
+def test_requests_sharing_a_trace_id_keep_all_spans():
+    tracer = Tracer()
+    started = threading.Barrier(2)
+
+    def request(stage):
+        with tracer.trace("abc"):
+            started.wait()
+            with tracer.span(stage):
+                pass
+
+    threads = [threading.Thread(target=request, args=(stage,)) for stage in ("one", "two")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    trace = tracer.get_trace("abc")
+    assert sorted(span["name"] for span in trace["spans"]) == ["one", "two"]
+
+
+def test_nested_traces_join_the_active_one():
+    tracer = Tracer()
+    with tracer.trace("outer") as outer:
+        with tracer.trace("inner") as inner:
+            with tracer.span("stage"):
+                pass
+    assert inner is outer
+    assert tracer.get_trace("inner") is None
+    assert [span["name"] for span in tracer.get_trace("outer")["spans"]] == ["stage"]
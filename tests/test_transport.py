@@ -0,0 +1,94 @@
+import os
+from pathlib import Path
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from api.transport import HTTPTransport, InProcessTransport, TransportError
+from utils.utils import get_defaults
+
+FIXTURES = Path(__file__).resolve().parents[1] / "benchmarks" / "fixtures" / "llm.jsonl"
+
+# Fields every successful analyze response carries, with their JSON types
+ANALYZE_FIELDS = {"sql": str, "results": list, "columns": list, "explanation": str, "truncated": bool}
+
+pytestmark = pytest.mark.skipif(
+    not (os.path.isdir("model") and os.path.exists("data/hdb_prices.db")),
+    reason="needs the trained models in model/ and data/hdb_prices.db",
+)
+
+
+class TestClientAdapter(BaseAdapter):
+    """Answers a `requests` session from a FastAPI `TestClient`, so HTTPTransport runs its full HTTP path in process."""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def send(self, request, **kwargs):
+        answer = self.client.request(request.method, request.url, content=request.body, headers=dict(request.headers))
+        response = requests.Response()
+        response.status_code = answer.status_code
+        response.headers = CaseInsensitiveDict(answer.headers)
+        response._content = answer.content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stub_llm():
+    # /analyze answers from recorded fixtures: no network or API key
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("LLM_BACKEND", "stub")
+        mp.setenv("LLM_FIXTURES", str(FIXTURES))
+        yield
+
+
+def http_transport():
+    from fastapi.testclient import TestClient
+    from api.http_client import HTTPClient
+    import server.app as server
+
+    client = TestClient(server.app)
+    http = HTTPClient(retries=0)
+    http.session.mount(str(client.base_url), TestClientAdapter(client))
+    return HTTPTransport(str(client.base_url), http=http)
+
+
+@pytest.fixture(scope="module", params=["inprocess", "http"])
+def transport(request):
+    return InProcessTransport(warm_up=False) if request.param == "inprocess" else http_transport()
+
+
+def test_predict_returns_a_price(transport):
+    prediction = transport.predict(get_defaults())
+    assert set(prediction) == {"predicted_price"}
+    assert isinstance(prediction["predicted_price"], float)
+
+
+def test_predict_rejects_an_incomplete_payload_with_422(transport):
+    payload = {k: v for k, v in get_defaults().items() if k != "town"}
+    with pytest.raises(TransportError) as error:
+        transport.predict(payload)
+    assert error.value.status_code == 422
+
+
+def test_analyze_returns_the_response_fields(transport):
+    analysis = transport.analyze("which towns had the fewest BTO launches in the last 5 years")
+    for name, kind in ANALYZE_FIELDS.items():
+        assert isinstance(analysis.get(name), kind), name
+    assert analysis["results"]
+    assert all(isinstance(row, list) for row in analysis["results"])
+
+
+def test_transports_agree():
+    payload = dict(get_defaults(), town="bedok", flat_type="4-room")
+    query = "which towns had the fewest BTO launches in the last 5 years"
+    inprocess, http = InProcessTransport(warm_up=False), http_transport()
+    assert inprocess.predict(payload) == http.predict(payload)
+    assert inprocess.analyze(query)["results"] == http.analyze(query)["results"]
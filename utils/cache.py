@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from utils.utils import get_defaults
+
+
+PREDICTION_FIELDS = [
+    "month", "town", "flat_type", "flat_model",
+    "storey_range", "floor_area_sqm", "lease_commence_date",
+]
+
+
+def normalize_prediction_request(payload: dict) -> dict:
+    """
+    Canonical form of a prediction payload.
+
+    Missing or empty fields take the same defaults the orchestrator applies,
+    strings are stripped and lower-cased, numbers are cast to int, so that
+    payloads which would price identically also look identical.
+
+    Args:
+        payload: Raw prediction payload
+
+    Returns:
+        Normalized payload with exactly PREDICTION_FIELDS as keys
+    """
+    defaults = get_defaults()
+    normalized = {}
+    for field in PREDICTION_FIELDS:
+        value = payload.get(field)
+        if value is None or value == "":
+            value = defaults[field]
+        if field in ("floor_area_sqm", "lease_commence_date"):
+            value = int(value)
+        else:
+            value = str(value).strip().lower()
+        normalized[field] = value
+    return normalized
+
+
+def artifact_version(path: str) -> Tuple[int, int]:
+    """(mtime_ns, size) of a file, used to detect a changed model artifact."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with per-entry TTL for prediction results.
+
+    Entries are tagged with a model version; the first lookup under a new
+    version drops everything cached for the previous one.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = 3600.0):
+        """
+        Args:
+            maxsize: Maximum number of cached predictions
+            ttl: Seconds an entry stays valid (None for no expiry)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._version: Any = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(normalized: dict) -> Tuple:
+        return tuple(normalized[field] for field in PREDICTION_FIELDS)
+
+    def _check_version(self, version: Any) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: Hashable, version: Any = None) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, version: Any = None) -> None:
+        """Store `value`, evicting the least recently used entries if full."""
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
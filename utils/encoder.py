@@ -0,0 +1,167 @@
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+from utils.utils import EXPECTED_COLUMNS, CATEGORICAL_COLUMNS, preprocess_batch, get_defaults, get_valid_values
+
+
+class FeatureEncoder:
+    """
+    Precompiled, pandas-free equivalent of `utils.utils.preprocess`.
+
+    Column positions for every numeric feature and every one-hot level are
+    resolved once at construction, so encoding a payload is a handful of dict
+    lookups written straight into a float32 NumPy row or matrix.
+    """
+
+    NUMERIC_FEATURES = [
+        "floor_area_sqm", "lease_commence_date", "year_of_transact", "month_of_transact",
+        "years_between_lease_and_sale", "age_of_flat", "remaining_lease",
+    ]
+
+    def __init__(self, columns: List[str] = EXPECTED_COLUMNS):
+        """
+        Build the column lookup tables.
+
+        Args:
+            columns: Feature columns in model order (defaults to the training columns)
+        """
+        self.columns = list(columns)
+        self.n_features = len(self.columns)
+        index = {name: i for i, name in enumerate(self.columns)}
+
+        # -1 marks a numeric feature the model was not trained on
+        self._numeric = {name: index.get(name, -1) for name in self.NUMERIC_FEATURES}
+
+        # value -> column index per categorical; values without a column
+        # (the training reference level, unseen values) encode as all zeros
+        self._categorical: Dict[str, Dict[str, int]] = {}
+        for col in CATEGORICAL_COLUMNS:
+            prefix = f"{col}_"
+            self._categorical[col] = {
+                name[len(prefix):]: i for name, i in index.items() if name.startswith(prefix)
+            }
+
+    def _numeric_values(self, record: dict) -> Dict[str, float]:
+        transacted = datetime.strptime(record["month"], "%Y-%m")
+        lease_year = int(record["lease_commence_date"])
+        age = transacted.year - lease_year
+        return {
+            "floor_area_sqm": record["floor_area_sqm"],
+            "lease_commence_date": lease_year,
+            "year_of_transact": transacted.year,
+            "month_of_transact": transacted.month,
+            "years_between_lease_and_sale": age,
+            "age_of_flat": age,
+            "remaining_lease": 99 - age,
+        }
+
+    def encode_one(self, record: dict, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Encode a single payload.
+
+        Args:
+            record: Prediction payload (same keys as `preprocess`)
+            out: Optional preallocated float32 row of length `n_features`
+
+        Returns:
+            Array of shape (1, n_features)
+        """
+        row = np.zeros(self.n_features, dtype=np.float32) if out is None else out
+        if out is not None:
+            row.fill(0.0)
+
+        for name, value in self._numeric_values(record).items():
+            i = self._numeric[name]
+            if i >= 0:
+                row[i] = value
+
+        for col, lookup in self._categorical.items():
+            i = lookup.get(record[col], -1)
+            if i >= 0:
+                row[i] = 1.0
+
+        return row.reshape(1, -1)
+
+    def encode(self, records: Union[List[dict], Dict[str, list]], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Encode many payloads into one feature matrix.
+
+        Args:
+            records: List of payload dicts, or a columnar dict of equal-length lists
+            out: Optional preallocated float32 matrix with at least len(records) rows
+
+        Returns:
+            Array of shape (n_rows, n_features)
+        """
+        if isinstance(records, dict):
+            n_rows = len(records["month"])
+            records = [{key: values[i] for key, values in records.items()} for i in range(n_rows)]
+        n_rows = len(records)
+
+        if out is None:
+            X = np.zeros((n_rows, self.n_features), dtype=np.float32)
+        else:
+            X = out[:n_rows]
+            X.fill(0.0)
+
+        numeric = [self._numeric_values(record) for record in records]
+        for name, i in self._numeric.items():
+            if i >= 0:
+                X[:, i] = [values[name] for values in numeric]
+
+        rows = np.arange(n_rows)
+        for col, lookup in self._categorical.items():
+            idx = np.fromiter((lookup.get(record[col], -1) for record in records), dtype=np.intp, count=n_rows)
+            hit = idx >= 0
+            X[rows[hit], idx[hit]] = 1.0
+
+        return X
+
+    def as_model_input(self, model, X: np.ndarray):
+        """
+        Adapt an encoded matrix to what `model.predict` accepts.
+
+        Models fitted on a DataFrame (e.g. the training Pipeline, whose
+        ColumnTransformer selects columns by name) get a thin named frame.
+        It is widened to float64 because the pipeline's StandardScaler keeps
+        its input dtype, and scaling in float32 can flip tree splits. A bare
+        booster converts to float32 internally, so it gets the array as is.
+        """
+        if hasattr(model, "feature_names_in_"):
+            import pandas as pd
+            return pd.DataFrame(X.astype(np.float64), columns=self.columns, copy=False)
+        return X
+
+    def check_parity(self, records: List[dict]) -> None:
+        """
+        Verify the encoder reproduces `preprocess_batch` exactly.
+
+        Args:
+            records: Payloads to compare on
+
+        Raises:
+            ValueError: If any feature differs, naming the offending columns
+        """
+        expected = preprocess_batch(records).to_numpy(dtype=np.float32)
+        actual = self.encode(records)
+        if expected.shape != actual.shape:
+            raise ValueError(f"Encoder shape {actual.shape} != preprocess shape {expected.shape}")
+        mismatched = np.flatnonzero((expected != actual).any(axis=0))
+        if mismatched.size:
+            raise ValueError(
+                "Encoder differs from preprocess on columns: "
+                + ", ".join(self.columns[i] for i in mismatched)
+            )
+
+
+def parity_records() -> List[dict]:
+    """One payload per valid categorical value (defaults elsewhere), for `check_parity`."""
+    defaults = get_defaults()
+    valid = get_valid_values()
+    records = [dict(defaults)]
+    for col, key in [("town", "towns"), ("flat_type", "flat_types"),
+                     ("flat_model", "flat_models"), ("storey_range", "storey_ranges")]:
+        records.extend(dict(defaults, **{col: value}) for value in valid[key])
+    records.append(dict(defaults, month="2000-12", lease_commence_date=1966, floor_area_sqm=valid["min_area"]))
+    records.append(dict(defaults, floor_area_sqm=valid["max_area"], lease_commence_date="2019"))
+    return records
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a failed load is remembered before a request may try the loader again
+RETRY_INTERVAL = float(os.getenv("COMPONENT_RETRY_INTERVAL", "30"))
+
+
+class Component:
+    """
+    A lazily loaded service dependency (model, database, LLM client, ...).
+
+    A failed load is remembered for `retry_interval` seconds: callers in
+    that window get the recorded error at once instead of each running the
+    loader again under the lock.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], retry_interval: float = RETRY_INTERVAL):
+        self.name = name
+        self.loader = loader
+        self.retry_interval = retry_interval
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.value: Any = None
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Seconds until a failed load may be retried (0 if not failed or already due)."""
+        if self.state != "failed" or self.loaded_at is None:
+            return 0.0
+        return max(0.0, self.loaded_at + self.retry_interval - time.time())
+
+    def _raise_failed(self) -> None:
+        raise RuntimeError(f"{self.name} failed to load: {self.error} (retrying in {self.retry_in():.0f}s)")
+
+    def load(self) -> Any:
+        """
+        Load once; concurrent callers block until the first load finishes.
+
+        Raises:
+            RuntimeError: If the load failed, now or within the last `retry_interval` seconds
+        """
+        if self.state == "ready":
+            return self.value
+        if self.retry_in() > 0:
+            self._raise_failed()
+        with self._lock:
+            if self.state == "ready":
+                return self.value
+            if self.retry_in() > 0:
+                # another caller's load just failed
+                self._raise_failed()
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                self.value = self.loader()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logger.error(f"Failed to load {self.name}: {e}")
+            else:
+                self.state = "ready"
+                self.error = None
+            self.seconds = time.perf_counter() - start
+            self.loaded_at = time.time()
+            if self.state == "ready":
+                logger.info(f"Loaded {self.name} in {self.seconds:.3f}s")
+        if self.state == "failed":
+            self._raise_failed()
+        return self.value
+
+
+class Components:
+    """
+    Registry of service components with lazy loading and background warm-up.
+
+    `get` loads a component on first use, so requests never see a half-built
+    dependency; `warm_up` starts loading everything in background threads so
+    the first request usually finds it ready.
+    """
+
+    def __init__(self):
+        self._components: "OrderedDict[str, Component]" = OrderedDict()
+        self.started = time.perf_counter()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        self._components[name] = Component(name, loader)
+
+    def get(self, name: str) -> Any:
+        """
+        Return a loaded component, loading it now if needed.
+
+        Raises:
+            RuntimeError: If the component failed to load
+        """
+        return self._components[name].load()
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> List[threading.Thread]:
+        """Start loading components in background threads, one per component."""
+        threads = []
+        for name in names or list(self._components):
+            component = self._components[name]
+            if component.state != "pending":
+                continue
+            thread = threading.Thread(target=self._load_quietly, args=(component,), name=f"warmup-{name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    @staticmethod
+    def _load_quietly(component: Component) -> None:
+        try:
+            component.load()
+        except RuntimeError:
+            pass  # already logged and recorded on the component
+
+    def is_ready(self, names: Iterable[str]) -> bool:
+        return all(self._components[name].state == "ready" for name in names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Per-component state and load time (the startup breakdown)."""
+        return {
+            name: {
+                "state": component.state,
+                "load_seconds": round(component.seconds, 4) if component.seconds is not None else None,
+                "error": component.error,
+                "retry_in_seconds": round(component.retry_in(), 1) if component.state == "failed" else None,
+            }
+            for name, component in self._components.items()
+        }
+
+    def uptime(self) -> float:
+        return time.perf_counter() - self.started
@@ -0,0 +1,205 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import joblib
+from utils.cache import artifact_version
+
+logger = logging.getLogger(__name__)
+
+
+def segment_slug(value: str) -> str:
+    """File-name form of a segment value, e.g. 'kallang/whampoa' -> 'kallang_whampoa'."""
+    return str(value).strip().lower().replace("/", "_").replace(" ", "_")
+
+
+@dataclass
+class LoadedModel:
+    """One loaded artifact and what we know about it."""
+    key: Tuple[str, ...]
+    path: str
+    version: Tuple[int, int]
+    model: Any
+    artifact_bytes: int
+    memory_bytes: int
+    load_seconds: float
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def name(self) -> str:
+        return "/".join(self.key)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "artifact_bytes": self.artifact_bytes,
+            "memory_bytes": self.memory_bytes,
+            "load_seconds": round(self.load_seconds, 4),
+            "loaded_at": self.loaded_at,
+        }
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """Immutable set of models; the registry swaps whole snapshots atomically."""
+    generation: int
+    models: Dict[Tuple[str, ...], LoadedModel]
+
+    def route(self, record: dict) -> LoadedModel:
+        """Most specific model for a normalized payload, falling back to the global one."""
+        for fields in ModelRegistry.SEGMENTS:
+            key = (ModelRegistry.segment_dir(fields),) + tuple(segment_slug(record[f]) for f in fields)
+            model = self.models.get(key)
+            if model is not None:
+                return model
+        return self.models[ModelRegistry.GLOBAL_KEY]
+
+
+class ModelRegistry:
+    """
+    Registry of XGBoost artifacts: one global model plus optional per-segment
+    models, routed by the most specific segment available.
+
+    Layout under `model_dir`:
+        xgb_tuned.joblib                           global model (required)
+        town_flat_type/<town>__<flat_type>.joblib  per town and flat type
+        town/<town>.joblib                         per town
+        flat_type/<flat_type>.joblib               per flat type
+
+    Segment values use `segment_slug` ('kallang/whampoa' -> 'kallang_whampoa').
+    Every model must take the same feature columns as the global one.
+
+    `refresh` reloads only artifacts whose (mtime, size) changed and then
+    publishes a new snapshot in a single assignment. Requests already
+    holding the previous snapshot finish on the models they started with.
+    A file that fails to load (e.g. still being written) keeps its previous
+    version until the next refresh. Write new artifacts elsewhere and
+    `os.replace` them into place.
+    """
+
+    GLOBAL_FILE = "xgb_tuned.joblib"
+    GLOBAL_KEY = ("global",)
+    # most specific first
+    SEGMENTS = [("town", "flat_type"), ("town",), ("flat_type",)]
+
+    def __init__(self, model_dir: str = "model", loader: Callable[[str], Any] = joblib.load):
+        """
+        Args:
+            model_dir: Directory holding the artifacts
+            loader: Function that loads one artifact from a path
+        """
+        self.model_dir = model_dir
+        self.loader = loader
+        self.current = ModelSnapshot(generation=0, models={})
+        self._refresh_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.swaps = 0
+
+    @staticmethod
+    def segment_dir(fields: Tuple[str, ...]) -> str:
+        return "_".join(fields)
+
+    def _discover(self) -> Dict[Tuple[str, ...], str]:
+        """Map registry keys to artifact paths currently on disk."""
+        found = {}
+        global_path = os.path.join(self.model_dir, self.GLOBAL_FILE)
+        if os.path.exists(global_path):
+            found[self.GLOBAL_KEY] = global_path
+        for fields in self.SEGMENTS:
+            directory = os.path.join(self.model_dir, self.segment_dir(fields))
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                stem, ext = os.path.splitext(filename)
+                if ext != ".joblib":
+                    continue
+                parts = tuple(stem.split("__"))
+                if len(parts) != len(fields):
+                    logger.warning(f"Ignoring {filename}: expected {len(fields)} segment value(s)")
+                    continue
+                found[(self.segment_dir(fields),) + parts] = os.path.join(directory, filename)
+        return found
+
+    def _load(self, key: Tuple[str, ...], path: str) -> LoadedModel:
+        version = artifact_version(path)
+        start = time.perf_counter()
+        model = self.loader(path)
+        load_seconds = time.perf_counter() - start
+        try:
+            memory_bytes = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            memory_bytes = version[1]
+        return LoadedModel(
+            key=key, path=path, version=version, model=model,
+            artifact_bytes=version[1], memory_bytes=memory_bytes, load_seconds=load_seconds,
+        )
+
+    def refresh(self) -> bool:
+        """
+        Load new or changed artifacts and drop deleted ones.
+
+        Returns:
+            True if a new snapshot was published
+
+        Raises:
+            RuntimeError: If no global model is available
+        """
+        with self._refresh_lock:
+            previous = self.current
+            models = {}
+            changed = False
+            for key, path in self._discover().items():
+                old = previous.models.get(key)
+                try:
+                    if old is not None and old.path == path and old.version == artifact_version(path):
+                        models[key] = old
+                        continue
+                    models[key] = self._load(key, path)
+                    changed = True
+                    logger.info(f"Loaded model {'/'.join(key)} from {path}")
+                except Exception as e:
+                    logger.error(f"Failed to load model {'/'.join(key)} from {path}: {e}")
+                    if old is not None:
+                        models[key] = old
+
+            changed = changed or set(models) != set(previous.models)
+            if self.GLOBAL_KEY not in models:
+                raise RuntimeError(f"No global model at {os.path.join(self.model_dir, self.GLOBAL_FILE)}")
+            if changed:
+                self.current = ModelSnapshot(generation=previous.generation + 1, models=models)
+                self.swaps += 1
+            return changed
+
+    def start_watching(self, interval: float = 5.0) -> None:
+        """Poll `model_dir` for changed artifacts in a daemon thread."""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Model refresh failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def describe(self) -> Dict[str, Any]:
+        """Loaded models with per-model memory, for sizing hosts."""
+        snapshot = self.current
+        models: List[Dict[str, Any]] = [m.describe() for m in snapshot.models.values()]
+        return {
+            "generation": snapshot.generation,
+            "swaps": self.swaps,
+            "total_memory_bytes": sum(m["memory_bytes"] for m in models),
+            "models": models,
+        }
@@ -0,0 +1,281 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header carrying the trace ID from the orchestrator to the API server (and back)
+TRACE_HEADER = "X-Trace-Id"
+
+# Histogram bucket upper bounds in seconds, from a cache hit to a slow LLM call
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Recent durations per stage kept for p50 / p95 / p99
+WINDOW = 2048
+
+# Finished traces kept for lookup by ID, and spans kept per trace
+MAX_TRACES = 256
+MAX_SPANS = 500
+
+# Numeric span attributes exported as per-stage counters
+COUNTED = ("prompt_tokens", "cached_tokens", "output_tokens", "rows")
+
+
+@dataclass
+class Span:
+    """One timed stage of a request."""
+    name: str
+    trace_id: Optional[str]
+    span_id: str
+    parent_id: Optional[str]
+    started: float  # wall clock, seconds since the epoch
+    seconds: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started": self.started,
+            "seconds": self.seconds,
+            "attributes": self.attributes,
+        }
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    spans: List[Span] = field(default_factory=list)
+    dropped: int = 0
+
+
+class StageMetrics:
+    """Latency histogram, recent-window quantiles and counters for one stage."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.counters: Dict[str, float] = {}
+        self.recent: deque = deque(maxlen=WINDOW)
+
+    def observe(self, span: Span, failed: bool) -> None:
+        self.buckets[bisect_left(BUCKETS, span.seconds)] += 1
+        self.count += 1
+        self.total += span.seconds
+        self.errors += int(failed)
+        self.recent.append(span.seconds)
+        for name in COUNTED:
+            value = span.attributes.get(name)
+            if isinstance(value, (int, float)):
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def quantiles(self) -> Dict[str, Optional[float]]:
+        values = sorted(self.recent)
+        return {
+            q: values[min(len(values) - 1, int(float(q) * len(values)))] if values else None
+            for q in ("0.5", "0.95", "0.99")
+        }
+
+
+class Tracer:
+    """
+    Spans per pipeline stage, grouped into traces, with per-stage metrics.
+
+    `trace()` starts a request's trace (or joins the one already active in
+    this context) and `span(name)` times a stage within it. Both live in
+    context variables, so they follow the request into threads started
+    with a copied context (tool calls, streams, FastAPI's threadpool).
+    Every finished span, traced or not, feeds its stage's histogram;
+    numeric attributes named in COUNTED (tokens, rows) are summed per
+    stage. The trace ID crosses process boundaries in TRACE_HEADER.
+    """
+
+    def __init__(self):
+        self._trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+        self._span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageMetrics] = {}
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+
+    @contextmanager
+    def trace(self, trace_id: Optional[str] = None) -> Iterator[Trace]:
+        """
+        Trace one request; nested calls join the active trace, and a known
+        `trace_id` (requests sharing an X-Trace-Id) joins that trace.
+        """
+        active = self._trace.get()
+        if active is not None:
+            yield active
+            return
+        with self._lock:
+            trace = self._traces.get(trace_id) if trace_id else None
+            if trace is None:
+                trace = Trace(trace_id or uuid.uuid4().hex)
+                self._traces[trace.trace_id] = trace
+            self._traces.move_to_end(trace.trace_id)
+            while len(self._traces) > MAX_TRACES:
+                self._traces.popitem(last=False)
+        token = self._trace.set(trace)
+        try:
+            yield trace
+        finally:
+            self._trace.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time a stage; the yielded span takes further attributes."""
+        trace = self._trace.get()
+        parent = self._span.get()
+        span = Span(
+            name=name,
+            trace_id=trace.trace_id if trace else None,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            started=time.time(),
+            attributes=dict(attributes),
+        )
+        token = self._span.set(span)
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield span
+        except BaseException as e:
+            failed = True
+            span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.seconds = time.perf_counter() - start
+            self._span.reset(token)
+            self._finish(span, trace, failed)
+
+    def record(self, name: str, seconds: float, **attributes: Any) -> Span:
+        """
+        Record an already-timed stage as a child of the active span, without
+        making it active (for work done inside a generator, where a context
+        variable set across yields could be reset from another context).
+        """
+        trace = self._trace.get()
+        parent = self._span.get()
+        span = Span(
+            name=name,
+            trace_id=trace.trace_id if trace else None,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            started=time.time() - seconds,
+            seconds=seconds,
+            attributes=dict(attributes),
+        )
+        self._finish(span, trace, "error" in attributes)
+        return span
+
+    def _finish(self, span: Span, trace: Optional[Trace], failed: bool) -> None:
+        with self._lock:
+            self._stages.setdefault(span.name, StageMetrics()).observe(span, failed)
+            if trace is not None:
+                if len(trace.spans) < MAX_SPANS:
+                    trace.spans.append(span)
+                else:
+                    trace.dropped += 1
+        logger.debug(f"span {span.name} {span.seconds * 1000:.1f}ms trace={span.trace_id} {span.attributes}")
+
+    def current_trace_id(self) -> Optional[str]:
+        trace = self._trace.get()
+        return trace.trace_id if trace else None
+
+    def headers(self) -> Dict[str, str]:
+        """Headers propagating the active trace to another service."""
+        trace_id = self.current_trace_id()
+        return {TRACE_HEADER: trace_id} if trace_id else {}
+
+    def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            spans = sorted(trace.spans, key=lambda s: s.started)
+            return {
+                "trace_id": trace.trace_id,
+                "spans": [s.to_dict() for s in spans],
+                "dropped_spans": trace.dropped,
+            }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "count": m.count,
+                    "errors": m.errors,
+                    "mean_seconds": m.total / m.count if m.count else 0.0,
+                    **{f"p{int(float(q) * 100)}_seconds": v for q, v in m.quantiles().items()},
+                    **m.counters,
+                }
+                for name, m in sorted(self._stages.items())
+            }
+
+    def reset(self) -> None:
+        """Forget all stage metrics and finished traces (e.g. after a benchmark's warm-up)."""
+        with self._lock:
+            self._stages.clear()
+            self._traces.clear()
+
+    def prometheus(self) -> str:
+        """All stage metrics in the Prometheus text exposition format."""
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"')
+
+        lines = [
+            "# HELP pipeline_stage_seconds Time spent per pipeline stage.",
+            "# TYPE pipeline_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, m in stages:
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), m.buckets):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'pipeline_stage_seconds_bucket{{stage="{label(name)}",le="{le}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{label(name)}"}} {m.total}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{label(name)}"}} {m.count}')
+
+            lines += [
+                f"# HELP pipeline_stage_quantile_seconds Stage latency quantiles over the last {WINDOW} spans.",
+                "# TYPE pipeline_stage_quantile_seconds summary",
+            ]
+            for name, m in stages:
+                for q, value in m.quantiles().items():
+                    if value is not None:
+                        lines.append(f'pipeline_stage_quantile_seconds{{stage="{label(name)}",quantile="{q}"}} {value}')
+                lines.append(f'pipeline_stage_quantile_seconds_sum{{stage="{label(name)}"}} {m.total}')
+                lines.append(f'pipeline_stage_quantile_seconds_count{{stage="{label(name)}"}} {m.count}')
+
+            lines += [
+                "# HELP pipeline_stage_errors_total Spans per stage that raised.",
+                "# TYPE pipeline_stage_errors_total counter",
+            ]
+            lines += [f'pipeline_stage_errors_total{{stage="{label(name)}"}} {m.errors}' for name, m in stages]
+            for counter in COUNTED:
+                metric = f"pipeline_stage_{counter}_total"
+                lines += [f"# HELP {metric} Sum of the {counter} attribute per stage.", f"# TYPE {metric} counter"]
+                lines += [
+                    f'{metric}{{stage="{label(name)}"}} {m.counters[counter]}'
+                    for name, m in stages if counter in m.counters
+                ]
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every component in the process
+tracer = Tracer()
@@ -1,4 +1,11 @@
 import pandas as pd
+from typing import Dict, List, Union
+
+## columns the model was trained on, in training order
+EXPECTED_COLUMNS = ['floor_area_sqm', 'lease_commence_date', 'year_of_transact', 'month_of_transact', 'years_between_lease_and_sale', 'age_of_flat', 'remaining_lease', 'per_square_meter', 'town_bedok', 'town_bishan', 'town_bukit batok', 'town_bukit merah', 'town_bukit panjang', 'town_bukit timah', 'town_central area', 'town_choa chu kang', 'town_clementi', 'town_geylang', 'town_hougang', 'town_jurong east', 'town_jurong west', 'town_kallang/whampoa', 'town_lim chu kang', 'town_marine parade', 'town_pasir ris', 'town_punggol', 'town_queenstown', 'town_sembawang', 'town_sengkang', 'town_serangoon', 'town_tampines', 'town_toa payoh', 'town_woodlands', 'town_yishun', 'flat_type_2-room', 'flat_type_3-room', 'flat_type_4-room', 'flat_type_5-room', 'flat_type_executive', 'flat_type_multi generation', 'flat_type_multi-generation', 'flat_model_3gen', 'flat_model_adjoined flat', 'flat_model_apartment', 'flat_model_dbss', 'flat_model_improved', 'flat_model_improved-maisonette', 'flat_model_maisonette', 'flat_model_model a', 'flat_model_model a-maisonette', 'flat_model_model a2', 'flat_model_multi generation', 'flat_model_new generation', 'flat_model_premium apartment', 'flat_model_premium apartment loft', 'flat_model_premium maisonette', 'flat_model_simplified', 'flat_model_standard', 'flat_model_terrace', 'flat_model_type s1', 'flat_model_type s2', 'storey_range_01 to 05', 'storey_range_04 to 06', 'storey_range_06 to 10', 'storey_range_07 to 09', 'storey_range_10 to 12', 'storey_range_11 to 15', 'storey_range_13 to 15', 'storey_range_16 to 18', 'storey_range_16 to 20', 'storey_range_19 to 21', 'storey_range_21 to 25', 'storey_range_22 to 24', 'storey_range_25 to 27', 'storey_range_26 to 30', 'storey_range_28 to 30', 'storey_range_31 to 33', 'storey_range_31 to 35', 'storey_range_34 to 36', 'storey_range_36 to 40', 'storey_range_37 to 39', 'storey_range_40 to 42', 'storey_range_43 to 45', 'storey_range_46 to 48', 'storey_range_49 to 51']
+
+CATEGORICAL_COLUMNS = ['town', 'flat_type', 'flat_model', 'storey_range']
+
 
 ## preprocess function to prepare payload for prediction
 def preprocess(variables: dict):
@@ -15,10 +22,24 @@ def preprocess(variables: dict):
                 - flat_model: str, model of the flat
                 - lease_commence_date: str or int, year when lease commenced (e.g., '1990' or 1990)
     Returns:
-        dict: Encoded dictionary ready for model prediction
+        pd.DataFrame: One-row feature frame ready for model prediction
     """
-    # Convert input dict to DataFrame
-    df = pd.DataFrame([variables])
+    return preprocess_batch([variables])
+
+
+def preprocess_batch(records: Union[List[dict], Dict[str, list]]):
+    """
+    Preprocesses many prediction payloads at once.
+    Parameters:
+        records : list of dict or dict of lists
+            Row-oriented payloads (same keys as `preprocess`) or a columnar
+            mapping of column name to equal-length value lists.
+    Returns:
+        pd.DataFrame: Feature frame with one row per payload, columns in
+        EXPECTED_COLUMNS order
+    """
+    # Convert input records to DataFrame
+    df = pd.DataFrame(records)
 
     # Convert data types
     df['lease_commence_date'] = pd.to_datetime(df['lease_commence_date'], format='%Y')
@@ -42,30 +63,24 @@ def preprocess(variables: dict):
 
     df["lease_commence_date"] = df["lease_commence_date"].dt.year.astype("Int64")
 
-    # Define categorical columns to encode
-    categorical_cols = ['town', 'flat_type', 'flat_model', 'storey_range']
-
-    # One-hot encode categorical variables
+    # One-hot encode categorical variables. All levels are kept here and the
+    # reference level dropped at training time (drop_first) is removed by the
+    # reindex below, so a row encodes the same way whatever else is in the batch.
     dummies = pd.get_dummies(
-        df[categorical_cols],
-        columns=categorical_cols,
-        prefix=categorical_cols,
-        drop_first=True
+        df[CATEGORICAL_COLUMNS],
+        columns=CATEGORICAL_COLUMNS,
+        prefix=CATEGORICAL_COLUMNS,
     )
 
     # Concatenate dummy variables with main dataframe
     df = pd.concat([df, dummies], axis=1)
 
     # Drop original categorical columns
-    df = df.drop(columns=categorical_cols)
-
-    # Optional: Reindex to match the exact column order from training (replace with actual expected columns)
-    expected_columns = ['floor_area_sqm', 'lease_commence_date', 'year_of_transact', 'month_of_transact', 'years_between_lease_and_sale', 'age_of_flat', 'remaining_lease', 'per_square_meter', 'town_bedok', 'town_bishan', 'town_bukit batok', 'town_bukit merah', 'town_bukit panjang', 'town_bukit timah', 'town_central area', 'town_choa chu kang', 'town_clementi', 'town_geylang', 'town_hougang', 'town_jurong east', 'town_jurong west', 'town_kallang/whampoa', 'town_lim chu kang', 'town_marine parade', 'town_pasir ris', 'town_punggol', 'town_queenstown', 'town_sembawang', 'town_sengkang', 'town_serangoon', 'town_tampines', 'town_toa payoh', 'town_woodlands', 'town_yishun', 'flat_type_2-room', 'flat_type_3-room', 'flat_type_4-room', 'flat_type_5-room', 'flat_type_executive', 'flat_type_multi generation', 'flat_type_multi-generation', 'flat_model_3gen', 'flat_model_adjoined flat', 'flat_model_apartment', 'flat_model_dbss', 'flat_model_improved', 'flat_model_improved-maisonette', 'flat_model_maisonette', 'flat_model_model a', 'flat_model_model a-maisonette', 'flat_model_model a2', 'flat_model_multi generation', 'flat_model_new generation', 'flat_model_premium apartment', 'flat_model_premium apartment loft', 'flat_model_premium maisonette', 'flat_model_simplified', 'flat_model_standard', 'flat_model_terrace', 'flat_model_type s1', 'flat_model_type s2', 'storey_range_01 to 05', 'storey_range_04 to 06', 'storey_range_06 to 10', 'storey_range_07 to 09', 'storey_range_10 to 12', 'storey_range_11 to 15', 'storey_range_13 to 15', 'storey_range_16 to 18', 'storey_range_16 to 20', 'storey_range_19 to 21', 'storey_range_21 to 25', 'storey_range_22 to 24', 'storey_range_25 to 27', 'storey_range_26 to 30', 'storey_range_28 to 30', 'storey_range_31 to 33', 'storey_range_31 to 35', 'storey_range_34 to 36', 'storey_range_36 to 40', 'storey_range_37 to 39', 'storey_range_40 to 42', 'storey_range_43 to 45', 'storey_range_46 to 48', 'storey_range_49 to 51']
+    df = df.drop(columns=CATEGORICAL_COLUMNS)
 
-    # Reindex using expected columns, filling missing ones with 0
-    df = df.reindex(columns=expected_columns, fill_value=0)
+    # Reindex to the exact column order from training, filling missing ones with 0
+    df = df.reindex(columns=EXPECTED_COLUMNS, fill_value=0)
 
-    # Return as dictionary (for JSON-like payload)
     return df
 
 ## restriction to arguements for prediction by llm
@@ -115,6 +130,8 @@ def get_defaults():
 
 
 def create_function_declarations(valid_values: dict):
+    # Valid options are given once, as the enum; repeating them in the
+    # description doubled the size of every tool schema sent to the model.
     return [
         {
             "name": "call_prediction_api",
@@ -129,22 +146,22 @@ def create_function_declarations(valid_values: dict):
                     "town": {
                         "type": "string",
                         "enum": valid_values["towns"],
-                        "description": f"Singapore town/estate name. Valid options: {', '.join(valid_values['towns'])}"
+                        "description": "Singapore town/estate name"
                     },
                     "flat_type": {
                         "type": "string",
                         "enum": valid_values["flat_types"],
-                        "description": f"Type of HDB flat. Valid options: {', '.join(valid_values['flat_types'])}. Default: 4-room"
+                        "description": "Type of HDB flat. Default: 4-room"
                     },
                     "flat_model": {
                         "type": "string",
                         "enum": valid_values["flat_models"],
-                        "description": f"HDB flat model/design type. Valid options: {', '.join(valid_values['flat_models'])}. Default: improved"
+                        "description": "HDB flat model/design type. Default: improved"
                     },
                     "storey_range": {
                         "type": "string",
                         "enum": valid_values["storey_ranges"],
-                        "description": f"Floor level range. Valid options: {', '.join(valid_values['storey_ranges'])}. Default: 07 to 09"
+                        "description": "Floor level range. Default: 07 to 09"
                     },
                     "floor_area_sqm": {
                         "type": "integer",